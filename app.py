@@ -1,17 +1,32 @@
+import time
+
 import streamlit as st
-import sounddevice as sd
-import soundfile as sf
-import io
 from google.cloud import speech
 from google.cloud import texttospeech
 
+from speech_stream import (
+    GoogleStreamingRecognizer,
+    InterimPrefetcher,
+    MicrophoneStream,
+    transcribe_stream,
+)
+from speech_synthesis import (
+    AudioPlayer,
+    SentenceSynthesizer,
+    canned_phrases,
+    join_wav,
+)
+
 # --- 1. Import your Backend Logic ---
-# This assumes ing_assistant.py is in the same folder
+# The pipeline runs in the Leo service (python leo_service.py); this app is
+# a client of it. ing_assistant.py only provides constants here.
 try:
-    from ing_assistant import get_bot_response, customers_df
+    from ing_assistant import MASTER_PROMPT, TRACE_FILE
+    from leo_client import LeoServiceClient
+    from telemetry import Tracer
 except ImportError:
     st.error(
-        "CRITICAL ERROR: 'ing_assistant.py' not found. Make sure it's in the same folder as app.py."
+        "CRITICAL ERROR: backend modules not found. Make sure ing_assistant.py and leo_client.py are in the same folder as app.py."
     )
     st.stop()
 except Exception as e:
@@ -23,9 +38,7 @@ except Exception as e:
 # This app assumes you have set the GOOGLE_APPLICATION_CREDENTIALS
 # environment variable in your terminal before running streamlit.
 
-RECORD_DURATION = 10  # Duration of recording in seconds
-SAMPLE_RATE = 16000  # Sample rate in Hz
-CHANNELS = 1  # Mono audio
+MAX_RECORD_DURATION = 15  # Recording stops earlier, as soon as the user stops talking
 
 # --- 3. Google API Clients ---
 try:
@@ -37,65 +50,84 @@ except Exception as e:
     st.stop()
 
 
-# --- 4. Speech-to-Text Function ---
-def transcribe_audio(audio_data, language_code="en-US"):
+@st.cache_resource
+def get_assistant():
     """
-    Transcribes audio data using Google Cloud Speech-to-Text.
+    The client of the Leo service, shared by all reruns and sessions. Data,
+    indexes, the vector DB and the LLM calls live in the service's worker
+    processes, so a slow answer never blocks this script.
     """
-    try:
-        with io.BytesIO() as audio_file:
-            sf.write(audio_file, audio_data, SAMPLE_RATE, format="WAV")
-            content = audio_file.getvalue()
+    return LeoServiceClient()
 
-        audio = speech.RecognitionAudio(content=content)
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=SAMPLE_RATE,
-            language_code=language_code,
-        )
 
-        response = speech_client.recognize(config=config, audio=audio)
+@st.cache_resource
+def get_tracer():
+    """Traces the UI-side stages (STT, backend call, TTS) of each turn."""
+    return Tracer(trace_path=TRACE_FILE)
+
+
+assistant = get_assistant()
+tracer = get_tracer()
+
+
+# --- 4. Speech-to-Text Function ---
+speech_recognizer = GoogleStreamingRecognizer(speech_client)
 
-        if not response.results:
-            return "Could not understand audio."
 
-        return response.results[0].alternatives[0].transcript
+def transcribe_microphone(language_code="en-US", on_interim=None):
+    """
+    Streams microphone audio to Google Cloud Speech-to-Text while the user
+    speaks. Recording ends on end-of-utterance (silence or the recognizer's
+    signal), so short questions do not wait for a fixed recording window.
+    """
+    try:
+        with MicrophoneStream(max_duration=MAX_RECORD_DURATION) as mic:
+            transcript = transcribe_stream(
+                mic.frames(),
+                speech_recognizer,
+                language_code=language_code,
+                on_interim=on_interim,
+                on_end_of_utterance=mic.stop,
+            )
+        return transcript or "Could not understand audio."
     except Exception as e:
         st.error(f"Speech-to-Text error: {e}")
         return ""
 
 
 # --- 5. Text-to-Speech Function ---
+@st.cache_resource
+def get_speech_output():
+    """
+    One synthesizer (with its audio cache) and one local player shared by
+    all reruns and sessions. Canned MASTER_PROMPT phrases are synthesized
+    up front so those answers start playing without a TTS round trip.
+    """
+    synthesizer = SentenceSynthesizer(tts_client)
+    synthesizer.prewarm(canned_phrases(MASTER_PROMPT), language_codes=("en-US",))
+    return synthesizer, AudioPlayer()
+
+
 def synthesize_speech(text, language_code="en-US"):
     """
-    Synthesizes text into speech using Google Cloud Text-to-Speech.
-    Returns the audio content as bytes.
+    Synthesizes text into speech sentence by sentence using Google Cloud
+    Text-to-Speech, playing each sentence as soon as it is ready.
+    Returns the full answer as one WAV clip for the chat history.
     """
     try:
-        input_text = texttospeech.SynthesisInput(text=text)
-
-        voice_name_map = {
-            "en-US": "en-US-Wavenet-F",
-            "fr-FR": "fr-FR-Wavenet-B",
-            "nl-BE": "nl-BE-Wavenet-A",
-        }
-
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=language_code,
-            name=voice_name_map.get(
-                language_code, "en-US-Wavenet-F"
-            ),  # Default to English
-        )
-
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
-        )
-
-        response = tts_client.synthesize_speech(
-            input=input_text, voice=voice, audio_config=audio_config
-        )
-
-        return response.audio_content
+        synthesizer, player = get_speech_output()
+        clips = []
+        started = time.perf_counter()
+        with tracer.span("tts"):
+            for _, clip in synthesizer.stream(text, language_code):
+                if not clips:
+                    tracer.observe(
+                        "tts_first_audio_ms", (time.perf_counter() - started) * 1000
+                    )
+                player.enqueue(clip)
+                clips.append(clip)
+        tracer.count("tts_sentences", len(clips))
+        return join_wav(clips) if clips else None
     except Exception as e:
         st.error(f"Text-to-Speech error: {e}")
         return None
@@ -125,14 +157,21 @@ selected_language_code_google = language_options[selected_language_name]
 selected_language_code_backend = language_map_simple[selected_language_code_google]
 
 st.write(
-    f"Click the button to record 5 seconds of audio in **{selected_language_name}**."
+    f"Click the button and ask your question in **{selected_language_name}**. Recording stops when you stop talking."
 )
 
 # --- 7. Session State Management ---
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "example_customer_id" not in st.session_state:
-    st.session_state.example_customer_id = customers_df["customer_id"].iloc[0]
+    try:
+        st.session_state.example_customer_id = assistant.customer_ids()[0]
+    except Exception as e:
+        st.error(f"Could not reach the Leo service at {assistant.base_url}: {e}")
+        st.error("Start it first with: python leo_service.py")
+        st.stop()
+    # Render the customer's context now so the first question finds it ready.
+    assistant.start_session(st.session_state.example_customer_id)
 
 # --- MODIFIED: Display chat history ---
 # This loop now runs first and displays the full history,
@@ -141,22 +180,30 @@ for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         if message["role"] == "assistant" and "audio" in message:
-            st.audio(message["audio"], format="audio/mp3")
+            st.audio(message["audio"], format="audio/wav")
 
 # --- 8. Main Record Button & Logic ---
-if st.button("🔴 Record 5 Seconds"):
-    with st.spinner(f"Recording for {RECORD_DURATION} seconds... Speak now!"):
-        audio_data = sd.rec(
-            int(RECORD_DURATION * SAMPLE_RATE),
-            samplerate=SAMPLE_RATE,
-            channels=CHANNELS,
-            dtype="int16",
-        )
-        sd.wait()
-        st.success("Recording finished. Transcribing...")
-
-        # 1. Transcribe audio to text
-        user_text = transcribe_audio(audio_data, selected_language_code_google)
+if st.button("🔴 Ask Leo"):
+    # One traced turn from recording to playback (see telemetry.py).
+    with tracer.trace(
+        customer_id=int(st.session_state.example_customer_id),
+        language=selected_language_code_backend,
+    ), st.spinner("Listening... Speak now!"):
+        # 1. Transcribe audio to text while recording; interim transcripts
+        # already start retrieval in the background.
+        with tracer.span("stt"):
+            user_text = transcribe_microphone(
+                selected_language_code_google,
+                on_interim=InterimPrefetcher(
+                    lambda partial: assistant.prefetch_context(
+                        partial,
+                        st.session_state.example_customer_id,
+                        selected_language_code_backend,
+                    )
+                ),
+            )
+        st.success("Recording finished.")
+
         if not user_text or user_text == "Could not understand audio.":
             st.error("Sorry, I couldn't understand that. Please try again.")
         else:
@@ -164,8 +211,8 @@ if st.button("🔴 Record 5 Seconds"):
             st.session_state.messages.append({"role": "user", "content": user_text})
 
             # 2. Generate bot response (THE INTEGRATION STEP)
-            with st.spinner("Leo is thinking..."):
-                bot_text = get_bot_response(
+            with st.spinner("Leo is thinking..."), tracer.span("backend"):
+                bot_text = assistant.get_bot_response(
                     user_question=user_text,
                     customer_id=st.session_state.example_customer_id,
                     language=selected_language_code_backend,
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Offline batch evaluation: runs a JSONL question set through the pipeline.
+
+Each input line is a record such as
+
+    {"id": "q1", "question": "How much did I spend?", "customer_id": 1001, "language": "en"}
+
+(`id` and `language` are optional; any extra fields, e.g. an expected
+answer, are kept). Each output line holds the record's `id`, the input
+record unchanged under `input`, and the run's fields (`answer`, `error`,
+`prompt_tokens`, ...), so input fields never collide with them. The runner:
+
+1. skips records already answered in the output file (the output is the
+   checkpoint, so a crashed run resumes where it stopped);
+2. retrieves public context once per distinct (question, language), with
+   one embedding call and one Chroma query per batch of questions;
+3. answers each distinct (question, customer, language) once, building
+   prompts and calling Gemini concurrently, at most as many at a time as
+   the client allows (`GeminiClient.max_concurrency` by default). An AIMD
+   limiter halves the number of in-flight LLM calls whenever Gemini answers
+   429 (on top of the client's own Retry-After handling) and grows it back
+   one at a time;
+4. appends one JSON line per record as soon as its answer exists.
+
+Records whose retrieval failed, or that end in a fallback answer
+(overloaded / technical issue), are written with an `error` and retried on
+the next run.
+
+    python batch_eval.py questions.jsonl results.jsonl --concurrency 8
+"""
+
+import argparse
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from retrieval_cache import normalize_question
+
+# --- 1. Configuration ---
+# Used only when the LLM client does not say how many calls it runs at once.
+MAX_CONCURRENCY = 8
+INITIAL_CONCURRENCY = 4
+RETRIEVAL_BATCH_SIZE = 64
+# Clean LLM calls needed before the limiter allows one more in flight.
+INCREASE_EVERY = 8
+
+
+# --- 2. Rate-Limit-Aware Scheduling ---
+class AdaptiveLimiter:
+    """
+    Additive-increase / multiplicative-decrease cap on concurrent calls:
+    halved when a call was rate limited, raised by one after
+    `increase_every` calls that were not.
+    """
+
+    def __init__(
+        self,
+        limit=INITIAL_CONCURRENCY,
+        min_limit=1,
+        max_limit=MAX_CONCURRENCY,
+        increase_every=INCREASE_EVERY,
+    ):
+        self.limit = limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase_every = increase_every
+        self.in_flight = 0
+        self._clean_calls = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, rate_limited=False):
+        with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self._clean_calls = 0
+            else:
+                self._clean_calls += 1
+                if self._clean_calls >= self.increase_every and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._clean_calls = 0
+            self._condition.notify_all()
+
+
+# --- 3. Records & Checkpoint ---
+def _record_id(record):
+    key = json.dumps(
+        [record["question"], record["customer_id"], record.get("language", "en")]
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def load_records(path):
+    """Reads the input JSONL; fills in `language` and a stable `id`."""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "question" not in record or "customer_id" not in record:
+                raise ValueError(f"{path}:{line_number}: needs 'question' and 'customer_id'")
+            record.setdefault("language", "en")
+            record.setdefault("id", _record_id(record))
+            records.append(record)
+    return records
+
+
+def completed_ids(path):
+    """IDs already answered (without error) in an existing output file."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off by a crash; that record is simply redone.
+                continue
+            if not result.get("error"):
+                done.add(result["id"])
+    return done
+
+
+# --- 4. Runner ---
+def run_batch(
+    input_path,
+    output_path,
+    engine=None,
+    max_concurrency=None,
+    retrieval_batch_size=RETRIEVAL_BATCH_SIZE,
+    limit=None,
+):
+    """
+    Answers every pending record and returns a summary dict. At most
+    `max_concurrency` LLM calls are in flight, never more than the client's
+    own cap (its default), so the limiter only grows into real capacity.
+    """
+    from ing_assistant import UNCACHEABLE_ANSWERS, get_engine
+
+    engine = engine or get_engine()
+    started = time.perf_counter()
+    records = load_records(input_path)
+    done = completed_ids(output_path)
+    pending = [record for record in records if record["id"] not in done]
+    skipped = len(records) - len(pending)
+    if limit is not None:
+        pending = pending[:limit]
+    print(f"{len(records)} records, {skipped} already answered, {len(pending)} to run.")
+    summary = {"records": len(records), "skipped": skipped, "answered": 0, "errors": 0}
+    if not pending:
+        return summary
+
+    # --- Distinct retrievals, batched per language ---
+    questions_by_language = OrderedDict()
+    for record in pending:
+        questions = questions_by_language.setdefault(record["language"], OrderedDict())
+        questions.setdefault(normalize_question(record["question"]), record["question"])
+    public_contexts = {}
+    for language, questions in questions_by_language.items():
+        keys = list(questions)
+        for i in range(0, len(keys), retrieval_batch_size):
+            batch = keys[i : i + retrieval_batch_size]
+            # No fallback text: a failed retrieval must not pass for a real context.
+            contexts = engine.retrieve_public_contexts(
+                [questions[key] for key in batch], language, fallback=None
+            )
+            public_contexts.update(
+                ((language, key), context) for key, context in zip(batch, contexts)
+            )
+    summary["retrievals"] = len(public_contexts)
+    summary["retrieval_errors"] = sum(
+        context is None for context in public_contexts.values()
+    )
+    print(f"Retrieved public context for {len(public_contexts)} distinct questions.")
+
+    # --- Distinct answers, scheduled under the adaptive limiter ---
+    groups = OrderedDict()
+    for record in pending:
+        key = (
+            record["language"],
+            normalize_question(record["question"]),
+            int(record["customer_id"]),
+        )
+        groups.setdefault(key, []).append(record)
+    summary["llm_calls"] = len(groups)
+    client_limit = getattr(engine.gemini_client, "max_concurrency", MAX_CONCURRENCY)
+    if max_concurrency is None or max_concurrency > client_limit:
+        max_concurrency = client_limit
+    limiter = AdaptiveLimiter(
+        limit=min(INITIAL_CONCURRENCY, max_concurrency), max_limit=max_concurrency
+    )
+
+    def answer(key):
+        language, normalized, customer_id = key
+        record = groups[key][0]
+        public_context = public_contexts[(language, normalized)]
+        if public_context is None:
+            return {"answer": None, "error": "retrieval_failed"}
+        call_started = time.perf_counter()
+        with engine.tracer.trace(customer_id=customer_id, language=language, batch=True):
+            prompt_build = engine.build_prompt(
+                record["question"],
+                customer_id,
+                language,
+                public_context=public_context,
+            )
+            call_stats = {}
+            limiter.acquire()
+            try:
+                final_answer = engine.call_gemini_api(prompt_build.prompt, call_stats)
+            finally:
+                limiter.release(rate_limited=call_stats.get("rate_limited", 0) > 0)
+        result = {
+            "answer": final_answer,
+            "prompt_tokens": prompt_build.total_tokens,
+            "latency_ms": round((time.perf_counter() - call_started) * 1000, 1),
+            "llm_retries": call_stats.get("retries", 0),
+        }
+        if final_answer in UNCACHEABLE_ANSWERS:
+            result["error"] = "llm_fallback"
+        return result
+
+    with ThreadPoolExecutor(
+        max_workers=max_concurrency, thread_name_prefix="batch-eval"
+    ) as pool, open(output_path, "a", encoding="utf-8") as out:
+        futures = {
+            pool.submit(contextvars.copy_context().run, answer, key): key for key in groups
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"answer": None, "error": f"{type(e).__name__}: {e}"}
+            for record in groups[key]:
+                line = {"id": record["id"], "input": record, **result}
+                out.write(json.dumps(line, default=str) + "\n")
+                summary["errors" if result.get("error") else "answered"] += 1
+            # Flushed per answer: the output file doubles as the checkpoint.
+            out.flush()
+
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    summary["final_concurrency"] = limiter.limit
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", help="JSONL with question/customer_id/language records")
+    parser.add_argument("output", help="results JSONL (appended to; resumes from it)")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=None,
+        help="LLM calls in flight at most (default and cap: the client's max_concurrency)",
+    )
+    parser.add_argument("--retrieval-batch-size", type=int, default=RETRIEVAL_BATCH_SIZE)
+    parser.add_argument("--limit", type=int, default=None, help="run at most N records")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(
+        args.input,
+        args.output,
+        max_concurrency=args.concurrency,
+        retrieval_batch_size=args.retrieval_batch_size,
+        limit=args.limit,
+    )
+    print(f"✅ Batch finished: {json.dumps(summary)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,837 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Reproducible benchmarks for the Leo pipeline on synthetic data.
+
+Generates customers, products and transactions at a configurable scale
+(10k to 10M transactions) plus multilingual chunk manifests in the same
+layout as the real files, then measures:
+
+- cold start: module import, building the tables from CSV, loading them
+  from the snapshot, and building the per-customer indexes;
+- vector DB build (full sync) and reopening an up-to-date DB;
+- `retrieve_public_context` (uncached and cached), `retrieve_personal_context`
+  and `get_total_spending`;
+- end-to-end `get_bot_response`, and a full voice turn, with Gemini, STT and
+  TTS stubbed out so only local work is timed;
+- with `--retrieval`, recall@k and query latency of the knowledge base
+  search for every embedder x HNSW setting x collection layout (one
+  collection per language, or one shared collection filtered by language).
+
+Results (plus the engine's per-stage latency histograms) are written as
+JSON. Pass `--baseline` to compare against an earlier run; the script exits
+non-zero when a metric got slower than the tolerance allows.
+
+    python benchmark.py --transactions 1000000 --baseline benchmark_results/main.json
+    python benchmark.py --retrieval --retrieval-embedders local,local-int8
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from lexical_index import tokenize
+from telemetry import Histogram
+
+# --- 1. Configuration ---
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = "./benchmark_data"
+RESULTS_DIR = "./benchmark_results"
+LANGUAGES = ("en", "fr", "nl")
+# Rows generated and written per block, so 10M transactions fit in memory.
+WRITE_BLOCK = 1_000_000
+REFERENCE_DATE = pd.Timestamp("2025-10-29")
+HISTORY_DAYS = 730
+# A metric regresses when it is this much slower than the baseline.
+REGRESSION_TOLERANCE = 0.2
+# HNSW settings swept by --retrieval, and the k of recall@k.
+HNSW_GRID = [
+    {"M": 8, "construction_ef": 64, "search_ef": 16},
+    {"M": 16, "construction_ef": 128, "search_ef": 64},
+    {"M": 32, "construction_ef": 256, "search_ef": 128},
+]
+RETRIEVAL_K = 5
+RETRIEVAL_QUERIES = 200
+
+PRODUCT_TYPES = [
+    ("Current Account", "ING Lion Account"),
+    ("Savings Account", "ING Savings"),
+    ("Credit Card", "ING Visa Classic"),
+    ("Debit Card", "ING Debit"),
+    ("Investment Account", "ING Invest"),
+]
+PRODUCT_STATUSES = ["Active"] * 8 + ["Blocked by ING", "Closed"]
+# (description, transaction_type, typical amount in EUR)
+TRANSACTION_KINDS = [
+    ("Grocery Store", "Debit", 60),
+    ("Supermarket Purchase", "Debit", 45),
+    ("Transport Ticket", "Debit", 15),
+    ("Fuel Station", "Debit", 70),
+    ("Restaurant Payment", "Debit", 40),
+    ("Bookstore Purchase", "Debit", 25),
+    ("ATM Withdrawal", "Debit", 50),
+    ("Online Shopping", "Debit", 80),
+    ("Utility Bill", "Debit", 120),
+    ("Salary Deposit", "Credit", 2500),
+    ("Refund", "Credit", 30),
+]
+FIRST_NAMES = ["Anna", "Bart", "Chantal", "David", "Eva", "Louis", "Nina", "Karel", "Elena", "Sofie"]
+LAST_NAMES = ["Janssens", "Peeters", "De Smet", "Vermeulen", "Maes", "Willems", "Claes", "Wouters"]
+
+VOCABULARY = {
+    "en": "account card savings fee transfer payment loan mortgage interest app login "
+    "block stolen limit contactless travel insurance statement balance overdraft".split(),
+    "fr": "compte carte épargne frais virement paiement prêt hypothécaire intérêt appli "
+    "connexion bloquer volée limite sans contact voyage assurance extrait solde".split(),
+    "nl": "rekening kaart sparen kosten overschrijving betaling lening hypotheek rente app "
+    "aanmelden blokkeren gestolen limiet contactloos reizen verzekering uittreksel saldo".split(),
+}
+QUESTIONS = {
+    "en": [
+        "What are the fees for a Visa card?",
+        "How do I block my stolen card?",
+        "What is the interest rate on savings?",
+        "How can I increase my contactless limit?",
+    ],
+    "fr": [
+        "Quels sont les frais pour une carte Visa?",
+        "Comment bloquer ma carte volée?",
+        "Quel est le taux d'intérêt de l'épargne?",
+    ],
+    "nl": [
+        "Wat zijn de kosten voor een Visa kaart?",
+        "Hoe blokkeer ik mijn gestolen kaart?",
+        "Wat is de rente op een spaarrekening?",
+    ],
+}
+SPENDING_QUESTIONS = [
+    "How much did I spend on groceries this month?",
+    "How much did I spend on transport this week?",
+    "How much did I spend last month?",
+]
+CANNED_ANSWER = "You spent €123.45 on groceries this month. Would you like a budget alert?"
+
+
+# --- 2. Synthetic Data ---
+def _write_with_junk_row(df, path, junk_position):
+    """
+    Writes `df` as CSV with a repeated header line at `junk_position`, like
+    the real exports (wrangle_tables drops that row).
+    """
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        df.iloc[:junk_position].to_csv(f, index=False)
+        f.write(",".join(df.columns) + "\n")
+        df.iloc[junk_position:].to_csv(f, index=False, header=False)
+
+
+def _transaction_block(rng, start_id, size, product_ids):
+    kinds = rng.integers(0, len(TRANSACTION_KINDS), size)
+    typical = np.array([kind[2] for kind in TRANSACTION_KINDS], dtype=np.float64)[kinds]
+    amounts = np.round(typical * rng.lognormal(0.0, 0.5, size), 2)
+    days = rng.integers(0, HISTORY_DAYS, size)
+    dates = (REFERENCE_DATE - pd.to_timedelta(days, unit="D")).strftime("%Y-%m-%d")
+    return pd.DataFrame(
+        {
+            "transaction_id": np.arange(start_id, start_id + size),
+            "product_id": rng.choice(product_ids, size),
+            "date": dates,
+            "amount": amounts,
+            "currency": "EUR",
+            "description": np.array([kind[0] for kind in TRANSACTION_KINDS])[kinds],
+            "transaction_type": np.array([kind[1] for kind in TRANSACTION_KINDS])[kinds],
+        }
+    )
+
+
+def generate_banking_data(out_dir, n_transactions, n_customers=None, seed=0):
+    """
+    Writes customers/products/products_closed/transactions CSVs to `out_dir`
+    and returns them as a DATA_FILES-style dict. Existing files are reused.
+    """
+    files = {
+        name: os.path.join(out_dir, f"{name}.csv")
+        for name in ("customers", "products", "products_closed", "transactions")
+    }
+    if all(os.path.exists(path) for path in files.values()):
+        return files
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n_customers = max(50, n_customers or n_transactions // 200)
+
+    customer_ids = np.arange(1001, 1001 + n_customers)
+    first = rng.choice(FIRST_NAMES, n_customers)
+    last = rng.choice(LAST_NAMES, n_customers)
+    customers = pd.DataFrame(
+        {
+            "customer_id": customer_ids,
+            "name": [f"{f} {l}" for f, l in zip(first, last)],
+            "birthdate": (
+                pd.Timestamp("1950-01-01")
+                + pd.to_timedelta(rng.integers(0, 50 * 365, n_customers), unit="D")
+            ).strftime("%Y-%m-%d"),
+            "email": [f"customer{c}@example.com" for c in customer_ids],
+            "phone": [f"+3247{c:07d}" for c in customer_ids],
+            "address": "Rue de la Loi 12, 1000 Brussels",
+            "segment_code": "ADULT",
+        }
+    )
+    _write_with_junk_row(customers, files["customers"], 30)
+
+    products_per_customer = rng.integers(1, 6, n_customers)
+    n_products = int(products_per_customer.sum())
+    types = rng.integers(0, len(PRODUCT_TYPES), n_products)
+    products = pd.DataFrame(
+        {
+            "product_id": np.arange(2001, 2001 + n_products),
+            "customer_id": np.repeat(customer_ids, products_per_customer),
+            "product_type": [PRODUCT_TYPES[t][0] for t in types],
+            "product_name": [PRODUCT_TYPES[t][1] for t in types],
+            "opened_date": (
+                pd.Timestamp("2005-01-01")
+                + pd.to_timedelta(rng.integers(0, 20 * 365, n_products), unit="D")
+            ).strftime("%Y-%m-%d"),
+            "status": rng.choice(PRODUCT_STATUSES, n_products),
+        }
+    )
+    products.to_csv(files["products"], index=False)
+    products.sample(n=min(10, n_products), random_state=seed).to_csv(
+        files["products_closed"], index=False
+    )
+
+    product_ids = products["product_id"].to_numpy()
+    written = 0
+    while written < n_transactions:
+        size = min(WRITE_BLOCK, n_transactions - written)
+        block = _transaction_block(rng, 3001 + written, size, product_ids)
+        if written == 0:
+            _write_with_junk_row(block, files["transactions"], min(65, size))
+        else:
+            block.to_csv(files["transactions"], mode="a", index=False, header=False)
+        written += size
+    print(
+        f"Generated {n_customers} customers, {n_products} products and "
+        f"{n_transactions} transactions in {out_dir}."
+    )
+    return files
+
+
+def generate_chunk_manifests(out_dir, chunks_per_language=300, seed=0):
+    """
+    Writes one chunk manifest per language in the real column layout and
+    returns a language_configs-style dict. Existing files are reused.
+    """
+    configs = {
+        lang: os.path.join(out_dir, f"detailed_{lang}_chunks.xlsx") for lang in LANGUAGES
+    }
+    if all(os.path.exists(path) for path in configs.values()):
+        return configs
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    for lang, path in configs.items():
+        words = VOCABULARY[lang]
+        rows = []
+        for chunk_id in range(chunks_per_language):
+            topic = " ".join(rng.sample(words, 3))
+            # 500-750 characters, like the real chunking.
+            content = []
+            while sum(len(w) + 1 for w in content) < rng.randint(500, 750):
+                content.append(rng.choice(words))
+            rows.append(
+                {
+                    "chunk_id": chunk_id,
+                    "chunk_name": topic,
+                    "chunk_url": f"https://www.ing.be/{lang}/{topic.replace(' ', '-')}",
+                    "chunk_number": chunk_id % 5,
+                    "chunk_content": f"{topic}. " + " ".join(content),
+                }
+            )
+        pd.DataFrame(rows).to_excel(path, index=False)
+    return configs
+
+
+# --- 3. Stubs ---
+class HashingEmbeddingFunction:
+    """
+    Deterministic bag-of-words embedder (feature hashing). Needs no model
+    download, so vector DB timings are reproducible across machines.
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def __call__(self, input):
+        vectors = np.zeros((len(input), self.dim), dtype=np.float32)
+        for row, text in enumerate(input):
+            for token in tokenize(text):
+                h = zlib.crc32(token.encode("utf-8"))
+                vectors[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).tolist()
+
+
+def make_embedder(name):
+    """'hash', 'local' or 'local-int8' -> an embedding function."""
+    if name == "hash":
+        return HashingEmbeddingFunction()
+    from embedder import LocalEmbeddingFunction
+
+    return LocalEmbeddingFunction(quantize=name == "local-int8")
+
+
+class StubGeminiClient:
+    """Answers every prompt with a fixed text after `latency` seconds."""
+
+    def __init__(self, latency=0.0, answer=CANNED_ANSWER):
+        self.latency = latency
+        self.answer = answer
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    def generate(self, prompt, call_stats=None):
+        self.stats["requests"] += 1
+        time.sleep(self.latency)
+        return self.answer
+
+    def stream(self, prompt, call_stats=None):
+        yield self.generate(prompt, call_stats)
+
+
+class StubTTSClient:
+    """Returns silent LINEAR16 WAV audio roughly as long as the text."""
+
+    def synthesize_speech(self, input, voice, audio_config):
+        import soundfile as sf
+
+        from speech_synthesis import AUDIO_SAMPLE_RATE
+
+        samples = np.zeros(int(AUDIO_SAMPLE_RATE * 0.06 * len(input.text)), dtype=np.int16)
+        with io.BytesIO() as out:
+            sf.write(out, samples, AUDIO_SAMPLE_RATE, format="WAV")
+            audio = out.getvalue()
+        return type("SynthesizeSpeechResponse", (), {"audio_content": audio})()
+
+
+# --- 4. Measurement Helpers ---
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return round(time.perf_counter() - started, 4)
+
+
+def _measure(fn, calls):
+    """Runs fn(*args) for every args tuple; returns a latency summary in ms."""
+    histogram = Histogram(max_samples=len(calls) or 1)
+    for args in calls:
+        started = time.perf_counter()
+        fn(*args)
+        histogram.observe((time.perf_counter() - started) * 1000)
+    return histogram.summary()
+
+
+def _import_seconds(repeat=3):
+    """Median wall time of `import ing_assistant` in a fresh interpreter."""
+    code = (
+        "import time; t = time.perf_counter(); import ing_assistant; "
+        "print(time.perf_counter() - t)"
+    )
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return round(float(np.median(times)), 4)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- 5. Benchmarks ---
+def run_benchmarks(
+    n_transactions,
+    n_customers=None,
+    chunks_per_language=300,
+    iterations=200,
+    llm_latency=0.0,
+    embedder="hash",
+    seed=0,
+    data_dir=DATA_DIR,
+    retrieval=False,
+    retrieval_embedders=("hash",),
+    hnsw_grid=HNSW_GRID,
+):
+    from ing_assistant import LeoAssistant
+
+    rng = random.Random(seed)
+    work_dir = os.path.abspath(os.path.join(data_dir, f"tx{n_transactions}_seed{seed}"))
+    data_files = generate_banking_data(
+        os.path.join(work_dir, "data"), n_transactions, n_customers, seed
+    )
+    results = {}
+    skipped = {}
+    try:
+        language_configs = generate_chunk_manifests(
+            os.path.join(work_dir, "chunks"), chunks_per_language, seed
+        )
+    except ImportError as e:
+        language_configs = None
+        skipped["vector_db"] = f"cannot write chunk manifests: {e}"
+
+    embedding_function = make_embedder(embedder) if embedder != "default" else None
+    db_path = os.path.join(work_dir, "chroma_db")
+
+    def new_engine(**kwargs):
+        return LeoAssistant(
+            data_files=data_files,
+            language_configs=language_configs or {},
+            db_path=db_path,
+            embedding_function=embedding_function,
+            gemini_client=StubGeminiClient(latency=llm_latency),
+            reference_date=REFERENCE_DATE,
+            **kwargs,
+        )
+
+    # The data snapshot is written relative to the working directory.
+    previous_cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        # --- Cold start ---
+        print("Measuring cold start...")
+        results["import_seconds"] = {"seconds": _import_seconds()}
+        shutil.rmtree("data_cache", ignore_errors=True)
+        engine = new_engine()
+        results["tables_from_csv_seconds"] = {"seconds": _timed(engine.warm, ["tables"])}
+        results["indexes_build_seconds"] = {"seconds": _timed(engine.warm, ["indexes"])}
+        engine = new_engine()
+        results["tables_from_snapshot_seconds"] = {
+            "seconds": _timed(engine.warm, ["tables"])
+        }
+        engine.warm(["indexes"])
+
+        customer_ids = engine.customers_df["customer_id"].tolist()
+        periods = ["month", "week", "last_month"]
+        categories = [None, "Grocery", "Transport"]
+
+        # --- Pandas-side retrieval ---
+        print("Measuring spending and personal context...")
+        results["get_total_spending"] = _measure(
+            engine.get_total_spending,
+            [
+                (rng.choice(customer_ids), rng.choice(periods), rng.choice(categories))
+                for _ in range(iterations)
+            ],
+        )
+        results["retrieve_personal_context"] = _measure(
+            engine.retrieve_personal_context,
+            [(rng.choice(customer_ids), True, rng.choice(SPENDING_QUESTIONS)) for _ in range(iterations)],
+        )
+
+        # --- Vector DB ---
+        if language_configs is not None:
+            print("Measuring vector DB build and retrieval...")
+            shutil.rmtree(db_path, ignore_errors=True)
+            try:
+                results["vector_db_build_seconds"] = {
+                    "seconds": _timed(engine.warm, ["vector_db"])
+                }
+                reopened = new_engine()
+                results["vector_db_open_seconds"] = {
+                    "seconds": _timed(reopened.warm, ["vector_db"])
+                }
+            except ImportError as e:
+                skipped["vector_db"] = f"vector DB unavailable: {e}"
+
+        if "vector_db" not in skipped:
+            questions = [(q, lang) for lang, qs in QUESTIONS.items() for q in qs]
+
+            def uncached(question, language):
+                engine.retrieval_cache.invalidate()
+                engine.retrieve_public_context(question, language)
+
+            results["retrieve_public_context"] = _measure(
+                uncached, [rng.choice(questions) for _ in range(iterations)]
+            )
+            results["retrieve_public_context_cached"] = _measure(
+                engine.retrieve_public_context,
+                [rng.choice(questions) for _ in range(iterations)],
+            )
+
+            # --- End to end (stubbed LLM) ---
+            print("Measuring end-to-end responses...")
+            all_questions = [q for q, _ in questions] + SPENDING_QUESTIONS
+
+            def respond(question, customer_id):
+                engine.answer_cache.invalidate()
+                engine.get_bot_response(question, customer_id)
+
+            engine.tracer.reset()
+            results["get_bot_response"] = _measure(
+                respond,
+                [(rng.choice(all_questions), rng.choice(customer_ids)) for _ in range(iterations)],
+            )
+            results["voice_turn"] = _measure_voice_turn(engine, customer_ids, rng, iterations)
+            results["stages"] = engine.tracer.snapshot()
+        else:
+            skipped.setdefault("get_bot_response", skipped["vector_db"])
+
+        # --- Retrieval settings sweep ---
+        if retrieval:
+            if language_configs is None:
+                skipped["retrieval"] = skipped["vector_db"]
+            else:
+                print("Measuring recall@k and latency per retrieval setting...")
+                try:
+                    results.update(
+                        run_retrieval_benchmarks(
+                            language_configs, retrieval_embedders, hnsw_grid, seed=seed
+                        )
+                    )
+                except ImportError as e:
+                    skipped["retrieval"] = f"retrieval sweep unavailable: {e}"
+    finally:
+        os.chdir(previous_cwd)
+
+    for name, reason in skipped.items():
+        results.setdefault(name, {"skipped": reason})
+
+    return {
+        "meta": {
+            "created_at": pd.Timestamp.now().isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "n_transactions": n_transactions,
+            "n_customers": len(customer_ids),
+            "chunks_per_language": chunks_per_language,
+            "iterations": iterations,
+            "llm_latency": llm_latency,
+            "embedder": embedder,
+            "retrieval_embedders": list(retrieval_embedders) if retrieval else None,
+            "hnsw_grid": hnsw_grid if retrieval else None,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def _exact_top_k(doc_vectors, query_vectors, k):
+    """Brute-force top-k by cosine similarity (vectors are L2-normalized)."""
+    scores = query_vectors @ doc_vectors.T
+    k = min(k, doc_vectors.shape[0])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _add_in_batches(collection, ids, vectors, metadatas=None, batch_size=1000):
+    for i in range(0, len(ids), batch_size):
+        collection.add(
+            ids=ids[i : i + batch_size],
+            embeddings=vectors[i : i + batch_size].tolist(),
+            metadatas=metadatas[i : i + batch_size] if metadatas else None,
+        )
+
+
+def run_retrieval_benchmarks(
+    language_configs,
+    embedders=("hash",),
+    hnsw_grid=HNSW_GRID,
+    k=RETRIEVAL_K,
+    n_queries=RETRIEVAL_QUERIES,
+    seed=0,
+):
+    """
+    Recall@k and per-query latency for every embedder x HNSW setting x layout.
+    Ground truth is exact search over the first embedder's vectors, so for
+    the others recall also shows what they lose against it (e.g. int8 against
+    the full-precision model). `embedding` is the latency of embedding one
+    query, `exact` that of brute-force search without an index.
+    """
+    import chromadb
+
+    from ing_assistant import hnsw_metadata
+    from kb_ingest import iter_chunks
+
+    rng = random.Random(seed)
+    chunks = {}
+    for chunk_id, document, metadata in iter_chunks(language_configs):
+        chunks.setdefault(metadata["language"], []).append(
+            (chunk_id, document, metadata["chunk_name"])
+        )
+    # Short topic-style queries (chunk titles) plus the fixed question set.
+    queries = {
+        language: (
+            QUESTIONS.get(language, [])
+            + [rng.choice(rows)[2] for _ in range(n_queries // len(chunks))]
+        )
+        for language, rows in chunks.items()
+    }
+
+    client = chromadb.EphemeralClient()
+    results = {}
+    truth = {}
+    for embedder_name in embedders:
+        embed = make_embedder(embedder_name)
+        prefix = f"retrieval/{embedder_name}"
+        started = time.perf_counter()
+        doc_vectors = {
+            language: np.asarray(embed([row[1] for row in rows]), dtype=np.float32)
+            for language, rows in chunks.items()
+        }
+        results[f"{prefix}/embed_documents_seconds"] = {
+            "seconds": round(time.perf_counter() - started, 4)
+        }
+        query_vectors = {}
+        histogram = Histogram(max_samples=sum(map(len, queries.values())))
+        for language, texts in queries.items():
+            vectors = []
+            for text in texts:
+                started = time.perf_counter()
+                vectors.append(embed([text])[0])
+                histogram.observe((time.perf_counter() - started) * 1000)
+            query_vectors[language] = np.asarray(vectors, dtype=np.float32)
+        results[f"{prefix}/embedding"] = histogram.summary()
+
+        def recall(found, language):
+            hits = sum(
+                len(set(row) & set(expected))
+                for row, expected in zip(found, truth[language])
+            )
+            return round(hits / (len(found) * k), 4)
+
+        ids = {language: [row[0] for row in rows] for language, rows in chunks.items()}
+        histogram = Histogram(max_samples=sum(map(len, queries.values())))
+        exact_found = {}
+        for language in chunks:
+            top = []
+            for vector in query_vectors[language]:
+                started = time.perf_counter()
+                top.append(_exact_top_k(doc_vectors[language], vector[None, :], k)[0])
+                histogram.observe((time.perf_counter() - started) * 1000)
+            exact_found[language] = [[ids[language][i] for i in row] for row in top]
+            # The first embedder's exact results are the reference for all.
+            truth.setdefault(language, exact_found[language])
+        results[f"{prefix}/exact"] = {
+            **histogram.summary(),
+            "recall_at_k": round(
+                float(np.mean([recall(exact_found[lang], lang) for lang in chunks])), 4
+            ),
+        }
+
+        for setting in hnsw_grid:
+            label = f"M{setting['M']}_efc{setting['construction_ef']}_ef{setting['search_ef']}"
+            metadata = hnsw_metadata({"space": "cosine", **setting})
+            layouts = {"partitioned": {}, "filtered": None}
+            for language in chunks:
+                collection = client.create_collection(
+                    name=f"bench_{language}", metadata=metadata, embedding_function=None
+                )
+                _add_in_batches(collection, ids[language], doc_vectors[language])
+                layouts["partitioned"][language] = collection
+            shared = client.create_collection(
+                name="bench_shared", metadata=metadata, embedding_function=None
+            )
+            for language in chunks:
+                _add_in_batches(
+                    shared,
+                    ids[language],
+                    doc_vectors[language],
+                    [{"language": language}] * len(ids[language]),
+                )
+            layouts["filtered"] = shared
+
+            for layout, target in layouts.items():
+                histogram = Histogram(max_samples=sum(map(len, queries.values())))
+                recalls = []
+                for language in chunks:
+                    found = []
+                    for vector in query_vectors[language]:
+                        started = time.perf_counter()
+                        if layout == "partitioned":
+                            hits = target[language].query(
+                                query_embeddings=[vector.tolist()],
+                                n_results=k,
+                                include=["distances"],
+                            )
+                        else:
+                            hits = target.query(
+                                query_embeddings=[vector.tolist()],
+                                n_results=k,
+                                where={"language": language},
+                                include=["distances"],
+                            )
+                        histogram.observe((time.perf_counter() - started) * 1000)
+                        found.append(hits["ids"][0])
+                    recalls.append(recall(found, language))
+                results[f"{prefix}/{label}/{layout}"] = {
+                    **histogram.summary(),
+                    "recall_at_k": round(float(np.mean(recalls)), 4),
+                }
+            for language in chunks:
+                client.delete_collection(f"bench_{language}")
+            client.delete_collection("bench_shared")
+            print(f"Measured {embedder_name} with {label}.")
+    return results
+
+
+def _measure_voice_turn(engine, customer_ids, rng, iterations):
+    """STT (scripted recognizer) -> get_bot_response -> sentence TTS (stub)."""
+    from speech_stream import FakeRecognizer, synthetic_frames, transcribe_stream
+    from speech_synthesis import AudioCache, SentenceSynthesizer
+
+    try:
+        import google.cloud.texttospeech  # noqa: F401
+
+        synthesizer = SentenceSynthesizer(StubTTSClient(), AudioCache())
+    except ImportError:
+        synthesizer = None
+
+    frames = synthetic_frames(30, 10)
+
+    def turn(question, customer_id):
+        with engine.tracer.trace(customer_id=int(customer_id), language="en"):
+            with engine.tracer.span("stt"):
+                text = transcribe_stream(frames, FakeRecognizer(question, frames_per_word=2))
+            engine.answer_cache.invalidate()
+            answer = engine.get_bot_response(text, customer_id)
+            if synthesizer is not None:
+                with engine.tracer.span("tts"):
+                    for _ in synthesizer.stream(answer):
+                        pass
+
+    summary = _measure(
+        turn,
+        [(rng.choice(SPENDING_QUESTIONS), rng.choice(customer_ids)) for _ in range(iterations)],
+    )
+    if synthesizer is None:
+        summary["note"] = "TTS not measured: google-cloud-texttospeech is not installed"
+    return summary
+
+
+# --- 6. Comparison ---
+def _headline(metric):
+    """The number compared across runs: p50 latency, or a one-off duration."""
+    if "p50" in metric:
+        return metric["p50"]
+    return metric.get("seconds")
+
+
+def compare_results(baseline, current, tolerance=REGRESSION_TOLERANCE):
+    """Returns [(name, baseline, current, ratio)] for metrics slower than allowed."""
+    regressions = []
+    for name, metric in current["results"].items():
+        before = baseline["results"].get(name)
+        if not isinstance(before, dict) or not isinstance(metric, dict):
+            continue
+        old, new = _headline(before), _headline(metric)
+        if not old or new is None:
+            continue
+        ratio = new / old
+        if ratio > 1 + tolerance:
+            regressions.append((name, old, new, round(ratio, 2)))
+    return regressions
+
+
+def _parse_hnsw(text):
+    grid = []
+    for setting in text.split(","):
+        m, construction_ef, search_ef = (int(value) for value in setting.split(":"))
+        grid.append({"M": m, "construction_ef": construction_ef, "search_ef": search_ef})
+    return grid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--transactions", type=int, default=10_000)
+    parser.add_argument("--customers", type=int, default=None)
+    parser.add_argument("--chunks-per-language", type=int, default=300)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub Gemini delay (s)")
+    parser.add_argument(
+        "--embedder", choices=["hash", "local", "local-int8", "default"], default="hash"
+    )
+    parser.add_argument(
+        "--retrieval", action="store_true", help="sweep embedders x HNSW settings"
+    )
+    parser.add_argument(
+        "--retrieval-embedders",
+        default="hash",
+        help="comma-separated; the first one's exact search is the recall reference",
+    )
+    parser.add_argument(
+        "--hnsw",
+        default=None,
+        help="comma-separated M:construction_ef:search_ef settings (default: HNSW_GRID)",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--out", default=None, help="results JSON path")
+    parser.add_argument("--baseline", default=None, help="earlier results JSON to compare")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(
+        args.transactions,
+        n_customers=args.customers,
+        chunks_per_language=args.chunks_per_language,
+        iterations=args.iterations,
+        llm_latency=args.llm_latency,
+        embedder=args.embedder,
+        seed=args.seed,
+        data_dir=args.data_dir,
+        retrieval=args.retrieval,
+        retrieval_embedders=args.retrieval_embedders.split(","),
+        hnsw_grid=_parse_hnsw(args.hnsw) if args.hnsw else HNSW_GRID,
+    )
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"tx{args.transactions}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"✅ Results written to {out}")
+
+    for name, metric in report["results"].items():
+        if name != "stages":
+            print(f"  {name}: {metric}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, report, args.tolerance)
+        for name, old, new, ratio in regressions:
+            print(f"❌ {name} regressed: {old} -> {new} ({ratio}x)")
+        if regressions:
+            return 1
+        print("✅ No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
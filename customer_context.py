@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Materialized per-customer prompt context.
+
+A conversation keeps the same customer for every turn, yet the profile,
+product table and transaction listing used to be rebuilt with pandas on
+each question. A `CustomerContext` holds them rendered once:
+
+- `profile`: the profile and active-products text, ready for the prompt;
+- `history`: a `TransactionHistory` (prompt_builder.py) with every
+  transaction row pre-rendered and monthly totals pre-aggregated.
+
+`ContextCache` keeps the most recently used contexts (LRU beyond
+`max_entries`), each tagged with the customer's data version from
+`CustomerIndex.data_version`. Any new transaction or product change bumps
+that version, so a stale context is rebuilt on its next use rather than
+served. Contexts are built when a session starts (`start_session`) or
+ahead of time in a background batch (`LeoAssistant.warm_contexts`).
+"""
+
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+
+from prompt_builder import TransactionHistory
+
+# --- 1. Configuration ---
+CONTEXT_CACHE_ENTRIES = 256
+
+
+@dataclass
+class CustomerContext:
+    customer_id: int
+    version: int
+    profile: str
+    history: TransactionHistory
+    built_at: float = field(default_factory=time.monotonic)
+
+
+# --- 2. Cache ---
+class ContextCache:
+    def __init__(self, max_entries=CONTEXT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        # customer_id -> CustomerContext, least recently used first
+        self._entries = OrderedDict()
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    def get(self, customer_id, version):
+        """The cached context when it was built at `version`, else None."""
+        customer_id = int(customer_id)
+        with self._lock:
+            context = self._entries.get(customer_id)
+            if context is None:
+                self._counters["misses"] += 1
+                return None
+            if context.version != version:
+                del self._entries[customer_id]
+                self._counters["stale"] += 1
+                return None
+            self._entries.move_to_end(customer_id)
+            self._counters["hits"] += 1
+            return context
+
+    def put(self, context):
+        with self._lock:
+            current = self._entries.get(context.customer_id)
+            # A concurrent build may already have stored a newer version.
+            if current is not None and current.version > context.version:
+                return
+            self._entries[context.customer_id] = context
+            self._entries.move_to_end(context.customer_id)
+            self._counters["builds"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate(self, customer_ids=None):
+        """Drops the given customers' contexts (all by default)."""
+        with self._lock:
+            if customer_ids is None:
+                self._entries.clear()
+                return
+            for customer_id in customer_ids:
+                self._entries.pop(int(customer_id), None)
+
+    def __contains__(self, customer_id):
+        with self._lock:
+            return int(customer_id) in self._entries
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        lookups = counters.get("hits", 0) + counters.get("misses", 0) + counters.get("stale", 0)
+        counters["size"] = size
+        counters["hit_rate"] = counters.get("hits", 0) / lookups if lookups else 0.0
+        return counters
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Per-customer row indexes over the banking tables.
+
+The retrievers used to boolean-scan `products_df` and run `isin` over the
+whole of `transactions_df` on every question. `CustomerIndex` maps each
+customer to their row positions once, so a lookup only touches that one
+customer's history:
+
+    customer_id -> customer row
+    customer_id -> product rows
+    product_id  -> product row, owning customer
+    product_id  -> transaction rows, newest first
+
+Positions are row positions (for `DataFrame.iloc`/`take`) into frames with a
+RangeIndex. When rows are appended to a frame, pass the new slice and its
+starting position to `add_products` / `add_transactions` to keep the index
+in sync without rebuilding it.
+"""
+
+import numpy as np
+import pandas as pd
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def _date_keys(dates):
+    """Sortable int64 keys for a datetime column; NaT sorts as oldest."""
+    return pd.to_datetime(dates).to_numpy("datetime64[ns]").view(np.int64)
+
+
+class CustomerIndex:
+    def __init__(self, customers_df, products_df, transactions_df):
+        self._customer_row = {}
+        self._product_row = {}
+        self._customer_products = {}
+        self._customer_product_ids = {}
+        self._product_owner = {}
+        # product_id -> (date keys, row positions), both sorted newest first
+        self._product_transactions = {}
+        # customer_id -> counter bumped whenever that customer's rows change
+        self._versions = {}
+
+        self.add_customers(customers_df, start=0)
+        self.add_products(products_df, start=0)
+        self.add_transactions(transactions_df, start=0)
+
+    # --- Building / Appending ---
+    def add_customers(self, rows, start):
+        for offset, customer_id in enumerate(rows["customer_id"].to_numpy()):
+            self._customer_row.setdefault(int(customer_id), start + offset)
+
+    def add_products(self, rows, start):
+        positions = np.arange(start, start + len(rows), dtype=np.int64)
+        product_ids = rows["product_id"].to_numpy().astype(np.int64)
+        groups = pd.Series(positions).groupby(rows["customer_id"].to_numpy()).indices
+        for customer_id, idx in groups.items():
+            customer_id = int(customer_id)
+            self._customer_products[customer_id] = np.concatenate(
+                [self._customer_products.get(customer_id, _EMPTY), positions[idx]]
+            )
+            self._customer_product_ids[customer_id] = np.concatenate(
+                [self._customer_product_ids.get(customer_id, _EMPTY), product_ids[idx]]
+            )
+        for position, product_id, customer_id in zip(
+            positions, rows["product_id"].to_numpy(), rows["customer_id"].to_numpy()
+        ):
+            self._product_owner[int(product_id)] = int(customer_id)
+            self._product_row.setdefault(int(product_id), int(position))
+        self._bump(groups)
+
+    def add_transactions(self, rows, start):
+        positions = np.arange(start, start + len(rows), dtype=np.int64)
+        keys = _date_keys(rows["date"])
+        groups = pd.Series(positions).groupby(rows["product_id"].to_numpy()).indices
+        for product_id, idx in groups.items():
+            product_id = int(product_id)
+            old_keys, old_positions = self._product_transactions.get(
+                product_id, (_EMPTY, _EMPTY)
+            )
+            merged_keys = np.concatenate([old_keys, keys[idx]])
+            merged_positions = np.concatenate([old_positions, positions[idx]])
+            # Stable sort on the negated keys keeps newest first and, for equal
+            # dates, the original row order.
+            order = np.argsort(-merged_keys.astype(np.float64), kind="stable")
+            self._product_transactions[product_id] = (
+                merged_keys[order],
+                merged_positions[order],
+            )
+        self._bump(self.owner_of(product_id) for product_id in groups)
+
+    def touch(self, customer_ids):
+        """Marks customers' data as changed (e.g. after an in-place product update)."""
+        self._bump(customer_ids)
+
+    def _bump(self, customer_ids):
+        for customer_id in customer_ids:
+            if customer_id is not None:
+                customer_id = int(customer_id)
+                self._versions[customer_id] = self._versions.get(customer_id, 0) + 1
+
+    # --- Lookups ---
+    def data_version(self, customer_id):
+        """Changes whenever rows are added for the customer (for cache keys)."""
+        return self._versions.get(int(customer_id), 0)
+
+    def customer_row(self, customer_id):
+        """Row position of the customer, or None if unknown."""
+        return self._customer_row.get(int(customer_id))
+
+    def product_rows(self, customer_id):
+        return self._customer_products.get(int(customer_id), _EMPTY)
+
+    def product_row(self, product_id):
+        """Row position of the product, or None if unknown."""
+        return self._product_row.get(int(product_id))
+
+    def owner_of(self, product_id):
+        return self._product_owner.get(int(product_id))
+
+    def product_ids(self, customer_id):
+        return self._customer_product_ids.get(int(customer_id), _EMPTY)
+
+    def transaction_rows(self, customer_id):
+        """Row positions of all the customer's transactions, newest first."""
+        parts = [
+            self._product_transactions[int(product_id)]
+            for product_id in self.product_ids(customer_id)
+            if int(product_id) in self._product_transactions
+        ]
+        if not parts:
+            return _EMPTY
+        if len(parts) == 1:
+            return parts[0][1]
+        keys = np.concatenate([p[0] for p in parts])
+        positions = np.concatenate([p[1] for p in parts])
+        order = np.argsort(-keys.astype(np.float64), kind="stable")
+        return positions[order]
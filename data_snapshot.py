@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Columnar snapshot cache for the wrangled banking tables.
+
+Parsing the CSVs and re-running the wrangling on every import is the slowest
+part of a cold start. This module stores the already-wrangled frames in a
+typed columnar format (Parquet when pyarrow is available, pickle otherwise)
+next to a small JSON manifest describing the source files they came from.
+
+A snapshot is reused as long as every source file still has the same mtime
+and size, or - if the mtime changed - the same SHA-256 content hash. Anything
+else triggers a rebuild through the caller's build function.
+
+`write_column_store` additionally exports loaded tables as one `.npy` file
+per column (categoricals as codes plus their categories), which
+`open_column_store` memory-maps read-only. Processes opening the same store
+share its pages instead of each holding a private copy of the tables.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# --- 1. Configuration ---
+SNAPSHOT_DIR = "./data_cache"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_SCHEMA = 1
+
+try:
+    import pyarrow  # noqa: F401
+
+    SNAPSHOT_FORMAT = "parquet"
+except ImportError:
+    SNAPSHOT_FORMAT = "pickle"
+
+
+# --- 2. Source Fingerprints ---
+def _file_hash(path, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _fingerprint(path, with_hash=True):
+    stat = os.stat(path)
+    fingerprint = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if with_hash:
+        fingerprint["sha256"] = _file_hash(path)
+    return fingerprint
+
+
+def _sources_unchanged(sources, recorded):
+    """
+    Checks every source against the manifest. Returns (unchanged, touched):
+    `touched` is True when a file only changed mtime, so the manifest should
+    be refreshed to keep the next check on the cheap stat-only path.
+    """
+    if set(sources) != set(recorded):
+        return False, False
+
+    touched = False
+    for name, path in sources.items():
+        old = recorded[name]
+        if old.get("path") != os.path.abspath(path):
+            return False, False
+        stat = os.stat(path)
+        if stat.st_size != old["size"]:
+            return False, False
+        if stat.st_mtime_ns == old["mtime_ns"]:
+            continue
+        if _file_hash(path) != old["sha256"]:
+            return False, False
+        old["mtime_ns"] = stat.st_mtime_ns
+        touched = True
+    return True, touched
+
+
+# --- 3. Snapshot Read / Write ---
+def _table_path(cache_dir, name, fmt):
+    extension = "parquet" if fmt == "parquet" else "pkl"
+    return os.path.join(cache_dir, f"{name}.{extension}")
+
+
+def _write_table(df, path, fmt):
+    # Write to a temporary file first so a crash never leaves a torn snapshot.
+    tmp_path = path + ".tmp"
+    if fmt == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_table(path, fmt):
+    if fmt == "parquet":
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def _write_manifest(cache_dir, manifest):
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+# --- 4. Public Entry Point ---
+def load_snapshot(sources, build_fn, version="1", cache_dir=SNAPSHOT_DIR):
+    """
+    Returns the wrangled tables for `sources` ({table_name: csv_path}).
+
+    Loads them from the snapshot in `cache_dir` when it is still valid,
+    otherwise calls `build_fn(sources)` - which must return a
+    {table_name: DataFrame} dict - and stores the result as a new snapshot.
+    Bump `version` whenever the wrangling logic changes so old snapshots are
+    discarded.
+    """
+    manifest = _read_manifest(cache_dir)
+    if (
+        manifest is not None
+        and manifest.get("schema") == MANIFEST_SCHEMA
+        and manifest.get("version") == str(version)
+        and manifest.get("format") == SNAPSHOT_FORMAT
+    ):
+        try:
+            unchanged, touched = _sources_unchanged(sources, manifest["sources"])
+            if unchanged:
+                tables = {
+                    name: _read_table(
+                        _table_path(cache_dir, name, SNAPSHOT_FORMAT), SNAPSHOT_FORMAT
+                    )
+                    for name in manifest["tables"]
+                }
+                if touched:
+                    _write_manifest(cache_dir, manifest)
+                print(f"✅ Loaded data snapshot from {cache_dir}.")
+                return tables
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Data snapshot unreadable, rebuilding: {e}")
+
+    # Fingerprint before building so an edit during the build invalidates it.
+    fingerprints = {}
+    for name, path in sources.items():
+        fingerprints[name] = _fingerprint(path)
+        fingerprints[name]["path"] = os.path.abspath(path)
+
+    tables = build_fn(sources)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, df in tables.items():
+            _write_table(df, _table_path(cache_dir, name, SNAPSHOT_FORMAT), SNAPSHOT_FORMAT)
+        _write_manifest(
+            cache_dir,
+            {
+                "schema": MANIFEST_SCHEMA,
+                "version": str(version),
+                "format": SNAPSHOT_FORMAT,
+                "sources": fingerprints,
+                "tables": list(tables),
+            },
+        )
+        print(f"✅ Saved data snapshot to {cache_dir}.")
+    except Exception as e:
+        # A failed snapshot write must never break loading the data itself.
+        print(f"Could not save data snapshot: {e}")
+
+    return tables
+
+
+# --- 5. Memory-Mapped Column Store ---
+COLUMN_LAYOUT_NAME = "layout.json"
+
+
+def write_column_store(tables, directory):
+    """
+    Exports `tables` to `directory` (replacing any previous store). Numeric,
+    boolean and datetime columns and categorical codes are memory-mappable;
+    remaining object/string columns go to one small pickle per table.
+    """
+    tmp_dir = directory.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    layout = {}
+    for name, df in tables.items():
+        columns = {}
+        rest = {}
+        for i, column in enumerate(df.columns):
+            values = df[column]
+            file_name = f"{name}.{i}.npy"
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                np.save(os.path.join(tmp_dir, file_name), values.cat.codes.to_numpy())
+                columns[column] = {
+                    "kind": "categorical",
+                    "file": file_name,
+                    "categories": values.cat.categories.tolist(),
+                    "ordered": bool(values.cat.ordered),
+                }
+            elif isinstance(values.dtype, np.dtype) and values.dtype.kind in "biufmM":
+                np.save(os.path.join(tmp_dir, file_name), values.to_numpy())
+                columns[column] = {"kind": "array", "file": file_name}
+            else:
+                rest[column] = values
+                columns[column] = {"kind": "pickled"}
+        if rest:
+            pd.DataFrame(rest).to_pickle(os.path.join(tmp_dir, f"{name}.rest.pkl"))
+        layout[name] = {"rows": len(df), "columns": columns}
+    with open(os.path.join(tmp_dir, COLUMN_LAYOUT_NAME), "w") as f:
+        json.dump(layout, f, indent=2)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+
+
+def open_column_store(directory):
+    """
+    Opens a store from `write_column_store` as {name: DataFrame}. The frames'
+    arrays are read-only views of the mapped files, so appends work (they
+    build new frames) but in-place edits raise unless the column is copied
+    first.
+    """
+    with open(os.path.join(directory, COLUMN_LAYOUT_NAME)) as f:
+        layout = json.load(f)
+    tables = {}
+    for name, table in layout.items():
+        rest = None
+        columns = {}
+        for column, spec in table["columns"].items():
+            if spec["kind"] == "pickled":
+                if rest is None:
+                    rest = pd.read_pickle(os.path.join(directory, f"{name}.rest.pkl"))
+                columns[column] = rest[column]
+                continue
+            values = np.load(os.path.join(directory, spec["file"]), mmap_mode="r")
+            if spec["kind"] == "categorical":
+                dtype = pd.CategoricalDtype(spec["categories"], ordered=spec["ordered"])
+                values = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+            columns[column] = values
+        tables[name] = pd.DataFrame(columns, copy=False)
+    return tables
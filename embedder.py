@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Local sentence embedder for the knowledge base and queries.
+
+`LocalEmbeddingFunction` runs all-MiniLM-L6-v2 (the model behind Chroma's
+default embedding function, so existing collections stay compatible) in
+this process with onnxruntime:
+
+- texts are tokenized and embedded in batches of `batch_size`, padded only
+  to the longest text of the batch;
+- `quantize=True` uses a dynamically int8-quantized copy of the model
+  (built once next to the original), which is smaller and faster on CPU at
+  a small cost in recall; see `benchmark.py --retrieval` for the trade-off.
+
+The model files are the ones Chroma downloads to its cache on first use.
+onnxruntime and tokenizers are Chroma dependencies, so nothing extra needs
+installing.
+
+`QueryEmbeddingMemo` keeps the vectors of recent queries, so a repeated
+question (or a prefetched transcript that turns out to be the final one)
+is not embedded twice.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from retrieval_cache import normalize_question
+
+# --- 1. Configuration ---
+MODEL_NAME = "all-MiniLM-L6-v2"
+MODEL_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "chroma", "onnx_models", MODEL_NAME, "onnx"
+)
+BATCH_SIZE = 32
+MAX_TOKENS = 256
+MEMO_ENTRIES = 4096
+
+
+def _ensure_model(model_dir):
+    """Downloads the model through Chroma when it is not cached yet."""
+    if os.path.exists(os.path.join(model_dir, "model.onnx")):
+        return model_dir
+    from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+    default = ONNXMiniLM_L6_V2()
+    default(["warm-up"])  # triggers the download
+    return os.path.join(str(default.DOWNLOAD_PATH), default.EXTRACTED_FOLDER_NAME)
+
+
+def _quantized_model(model_path):
+    """Path of an int8 copy of `model_path`, built on first use."""
+    quantized_path = model_path.replace(".onnx", "_int8.onnx")
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp_path = quantized_path + ".tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+
+# --- 2. Embedding Function ---
+class LocalEmbeddingFunction:
+    """Chroma-compatible embedding function: `ef(list_of_texts) -> vectors`."""
+
+    def __init__(
+        self, model_dir=MODEL_DIR, quantize=False, batch_size=BATCH_SIZE, threads=None
+    ):
+        self.model_dir = model_dir
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.threads = threads
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Loaded on first use so constructing the function stays free.
+        with self._lock:
+            if self._session is not None:
+                return
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            model_dir = _ensure_model(self.model_dir)
+            model_path = os.path.join(model_dir, "model.onnx")
+            if self.quantize:
+                model_path = _quantized_model(model_path)
+            tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=MAX_TOKENS)
+            tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+            options = onnxruntime.SessionOptions()
+            if self.threads:
+                options.intra_op_num_threads = self.threads
+            self._session = onnxruntime.InferenceSession(
+                model_path, options, providers=["CPUExecutionProvider"]
+            )
+            self._tokenizer = tokenizer
+
+    def _embed_batch(self, texts):
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        hidden = self._session.run(
+            None,
+            {
+                "input_ids": input_ids,
+                "attention_mask": attention_mask,
+                "token_type_ids": np.zeros_like(input_ids),
+            },
+        )[0]
+        # Mean pooling over real tokens, then L2 normalization.
+        mask = attention_mask[:, :, None].astype(np.float32)
+        vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def __call__(self, input):
+        if self._session is None:
+            self._load()
+        texts = [str(text) for text in input]
+        if not texts:
+            return []
+        vectors = [
+            self._embed_batch(texts[i : i + self.batch_size])
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        return np.concatenate(vectors).tolist()
+
+
+# --- 3. Query Memo ---
+class QueryEmbeddingMemo:
+    """Bounded LRU of query vectors, keyed by the normalized question."""
+
+    def __init__(self, max_entries=MEMO_ENTRIES):
+        self.max_entries = max_entries
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, texts, embedding_function):
+        """Vectors for `texts`, embedding only the ones not seen recently (in one call)."""
+        keys = [normalize_question(text) for text in texts]
+        vectors = [None] * len(texts)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._vectors.get(key)
+                if vector is not None:
+                    self._vectors.move_to_end(key)
+                    vectors[i] = vector
+        # One text per missing key, so duplicates within a batch embed once.
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], i)
+        if missing:
+            computed = embedding_function([texts[i] for i in missing.values()])
+            with self._lock:
+                for key, vector in zip(missing, computed):
+                    self._vectors[key] = vector
+                    self._vectors.move_to_end(key)
+                while len(self._vectors) > self.max_entries:
+                    self._vectors.popitem(last=False)
+            computed = dict(zip(missing, computed))
+            vectors = [
+                computed[key] if vector is None else vector
+                for key, vector in zip(keys, vectors)
+            ]
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return vectors
+
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._vectors), "hits": self.hits, "misses": self.misses}
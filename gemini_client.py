@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Pooled, asynchronous Gemini client with streaming generation.
+
+`call_gemini_api` used to open a new connection per call, back off with a
+blocking `time.sleep` and wait for the full `generateContent` response.
+`GeminiClient` instead keeps one `httpx.AsyncClient` (a keep-alive
+connection pool) on a private event loop thread, limits concurrent calls
+with a semaphore, retries with full-jitter backoff under a shared retry
+budget, and supports the `streamGenerateContent` SSE endpoint so text
+arrives as it is generated.
+
+Synchronous callers (Streamlit, scripts) use `generate()` / `stream()`;
+async callers await `agenerate()` / iterate `astream()` from any event
+loop (calls from another loop are relayed to the client's). Point
+`base_url` at a local stub server, or pass an httpx `transport`, to test it
+offline.
+"""
+
+import asyncio
+import json
+import queue
+import random
+import threading
+
+import httpx
+
+# --- 1. Configuration ---
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_MODEL = "gemini-2.5-flash-preview-09-2025"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+NO_RESPONSE_MESSAGE = "I'm sorry, I wasn't able to generate a response. Please try again."
+TECHNICAL_ISSUE_MESSAGE = (
+    "I'm sorry, I'm facing a technical issue and can't respond right now."
+)
+OVERLOADED_MESSAGE = "I'm sorry, I'm currently overloaded. Please try again."
+
+_DONE = object()
+
+
+class RetryBudget:
+    """
+    Caps retries to a fraction of recent traffic: every request deposits
+    `ratio` tokens, every retry withdraws one. The budget starts with
+    `min_retries` tokens so a fresh client can retry before it has seen
+    much traffic; once spent, retries depend on new deposits.
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_retries)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class _RetryableError(Exception):
+    def __init__(self, message, retry_after=None, status=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _candidate_text(result):
+    """Text of the first candidate, or None when the response has none."""
+    candidates = result.get("candidates") or []
+    if not candidates:
+        return None
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+
+class GeminiClient:
+    def __init__(
+        self,
+        api_key,
+        model=GEMINI_MODEL,
+        base_url=GEMINI_BASE_URL,
+        max_connections=20,
+        max_concurrency=8,
+        timeout=60.0,
+        max_retries=3,
+        base_delay=0.5,
+        max_delay=8.0,
+        retry_budget=None,
+        transport=None,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget or RetryBudget()
+        # Optional httpx transport, e.g. an httpx.MockTransport in tests.
+        self.transport = transport
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+        self._loop = None
+        self._thread = None
+        self._http = None
+        self._semaphore = None
+        self._start_lock = threading.Lock()
+
+    # --- Event loop / connection pool lifecycle ---
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="gemini-client", daemon=True
+            )
+            thread.start()
+
+            async def setup():
+                self._http = httpx.AsyncClient(
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                    headers={"Content-Type": "application/json"},
+                    transport=self.transport,
+                )
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            asyncio.run_coroutine_threadsafe(setup(), loop).result()
+            self._loop, self._thread = loop, thread
+            return loop
+
+    def close(self):
+        with self._start_lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self._http.aclose(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = self._thread = self._http = self._semaphore = None
+
+    # --- Retry helpers ---
+    def _url(self, method):
+        suffix = "?alt=sse&" if method == "streamGenerateContent" else "?"
+        return f"{self.base_url}/models/{self.model}:{method}{suffix}key={self.api_key}"
+
+    @staticmethod
+    def _payload(prompt):
+        return {"contents": [{"parts": [{"text": prompt}]}]}
+
+    def _delay(self, attempt, retry_after):
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        # Full jitter: spreads retries from concurrent callers apart.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def _with_retries(self, attempt_fn, call_stats=None):
+        """
+        Runs `attempt_fn` until it succeeds, retrying retryable failures.
+        Per-call counts go into `call_stats` when given (for tracing).
+        """
+        if call_stats is None:
+            call_stats = {}
+        call_stats.setdefault("retries", 0)
+        call_stats.setdefault("rate_limited", 0)
+        self.stats["requests"] += 1
+        self.retry_budget.deposit()
+        for attempt in range(self.max_retries):
+            try:
+                async with self._semaphore:
+                    return await attempt_fn()
+            except _RetryableError as e:
+                if e.status == 429:
+                    call_stats["rate_limited"] += 1
+                last_attempt = attempt == self.max_retries - 1
+                if last_attempt or not self.retry_budget.withdraw():
+                    print(f"Giving up after {attempt + 1} attempt(s): {e}")
+                    break
+                delay = self._delay(attempt, e.retry_after)
+                print(f"{e}. Retrying in {delay:.2f}s...")
+                self.stats["retries"] += 1
+                call_stats["retries"] += 1
+                await asyncio.sleep(delay)
+        self.stats["failures"] += 1
+        call_stats["failed"] = True
+        return OVERLOADED_MESSAGE
+
+    async def _relay(self, agen, loop):
+        """Iterates async generator `agen` on `loop` from the caller's loop."""
+        caller = asyncio.get_running_loop()
+        items = asyncio.Queue()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    caller.call_soon_threadsafe(items.put_nowait, item)
+            except Exception as e:
+                caller.call_soon_threadsafe(items.put_nowait, e)
+            finally:
+                caller.call_soon_threadsafe(items.put_nowait, _DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                item = await items.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    # --- Async API (runs on the client's loop) ---
+    async def agenerate(self, prompt, call_stats=None):
+        """Returns the full answer text (or a user-facing fallback message)."""
+        loop = self._ensure_started()
+        if asyncio.get_running_loop() is not loop:
+            # The connection pool belongs to the client's loop; run the call there.
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.agenerate(prompt, call_stats), loop)
+            )
+
+        async def attempt():
+            try:
+                response = await self._http.post(
+                    self._url("generateContent"), json=self._payload(prompt)
+                )
+            except httpx.TransportError as e:
+                raise _RetryableError(f"Request error occurred: {e}")
+            if response.status_code in RETRYABLE_STATUS:
+                raise _RetryableError(
+                    f"HTTP {response.status_code} from Gemini",
+                    _retry_after(response),
+                    response.status_code,
+                )
+            if response.is_error:
+                print(f"HTTP error occurred: {response.status_code} - {response.text}")
+                return TECHNICAL_ISSUE_MESSAGE
+            try:
+                result = response.json()
+            except ValueError:
+                # e.g. an HTML error page from a proxy in front of the API.
+                print(f"Non-JSON response from Gemini: {response.text[:200]}")
+                return TECHNICAL_ISSUE_MESSAGE
+            text = _candidate_text(result)
+            return text if text is not None else NO_RESPONSE_MESSAGE
+
+        return await self._with_retries(attempt, call_stats)
+
+    async def astream(self, prompt, call_stats=None):
+        """
+        Yields answer text chunks as they arrive. Retries only happen before
+        the first chunk; a failure mid-stream ends the stream early and sets
+        `call_stats["truncated"]`, so callers know not to cache the answer.
+        """
+        loop = self._ensure_started()
+        if asyncio.get_running_loop() is not loop:
+            async for chunk in self._relay(self.astream(prompt, call_stats), loop):
+                yield chunk
+            return
+        if call_stats is None:
+            call_stats = {}
+        chunks = asyncio.Queue()
+
+        async def attempt():
+            emitted = False
+            try:
+                async with self._http.stream(
+                    "POST", self._url("streamGenerateContent"), json=self._payload(prompt)
+                ) as response:
+                    if response.status_code in RETRYABLE_STATUS:
+                        raise _RetryableError(
+                            f"HTTP {response.status_code} from Gemini",
+                            _retry_after(response),
+                            response.status_code,
+                        )
+                    if response.is_error:
+                        await response.aread()
+                        print(
+                            f"HTTP error occurred: {response.status_code} - {response.text}"
+                        )
+                        return TECHNICAL_ISSUE_MESSAGE
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        try:
+                            event = json.loads(line[len("data:") :])
+                        except ValueError:
+                            print(f"Malformed stream event from Gemini: {line[:200]}")
+                            if not emitted:
+                                return TECHNICAL_ISSUE_MESSAGE
+                            call_stats["truncated"] = True
+                            return None
+                        text = _candidate_text(event)
+                        if text:
+                            emitted = True
+                            await chunks.put(text)
+            except httpx.TransportError as e:
+                if emitted:
+                    print(f"Stream interrupted: {e}")
+                    call_stats["truncated"] = True
+                    return None
+                raise _RetryableError(f"Request error occurred: {e}")
+            return None if emitted else NO_RESPONSE_MESSAGE
+
+        async def run():
+            try:
+                fallback = await self._with_retries(attempt, call_stats)
+                if fallback:
+                    await chunks.put(fallback)
+            finally:
+                await chunks.put(_DONE)
+
+        task = asyncio.ensure_future(run())
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is _DONE:
+                    break
+                yield chunk
+            await task
+        finally:
+            task.cancel()
+
+    # --- Sync API (safe to call from any thread) ---
+    def generate(self, prompt, call_stats=None):
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(
+            self.agenerate(prompt, call_stats), loop
+        ).result()
+
+    def stream(self, prompt, call_stats=None):
+        """Synchronous generator over `astream`, for Streamlit and scripts."""
+        loop = self._ensure_started()
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in self.astream(prompt, call_stats):
+                    items.put(chunk)
+            except Exception as e:
+                items.put(e)
+            finally:
+                items.put(_DONE)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                item = items.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
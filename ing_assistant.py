@@ -1,54 +1,69 @@
 #!/usr/bin/env python
 # coding: utf-8
+"""
+Leo's backend: data tables, retrieval, routing and the Gemini call.
+
+Importing this module has no side effects. Every expensive resource lives
+on a `LeoAssistant` engine as a lazily initialized component that can also
+be warmed explicitly (or in the background) and reported on with
+`health()`:
+
+    tables     the wrangled banking DataFrames (from the columnar snapshot)
+    indexes    per-customer row indexes and daily spending rollups
+    vector_db  per-language Chroma collections, the local embedder and BM25 indexes
+    llm        the pooled Gemini client
+
+Each turn is traced per stage (see telemetry.py): set LEO_TRACE_FILE to
+append turns to a JSONL file. `serve_metrics()` serves p50/p95/p99 latency
+histograms and the health report over local HTTP (on LEO_METRICS_PORT by
+default).
+
+New transactions and product changes are applied incrementally with
+`ingest()` or from a drop folder watched by `start_ingestion()`
+(LEO_INGEST_DIR by default, see ingest.py). leo_service.py exposes the
+metrics of all its workers and watches LEO_INGEST_DIR for them.
+Spending periods follow the engine's clock: the date of the latest
+transaction by default, a fixed date with LEO_REFERENCE_DATE=YYYY-MM-DD,
+or the system date with LEO_REFERENCE_DATE=system.
+
+Each customer's profile, products and transaction history are rendered
+once per data version and reused across turns (see customer_context.py):
+`start_session()` builds them when a conversation starts and
+`warm_contexts()` ahead of time.
+
+The module-level functions (`get_bot_response`, `route_query`, ...) and
+attributes (`customers_df`, `collections`, ...) delegate to one shared
+engine from `get_engine()`, so existing callers keep working.
+"""
 
 # --- 1. All Imports ---
-import pandas as pd
-import chromadb
-from collections import Counter
-import requests
+import contextvars
+import os
+import threading
 import time
-from datetime import datetime, timedelta
-
-# --- 2. Load Data Files ---
-print("Loading data files...")
-try:
-    customers = pd.read_csv("data/Syntheticdata/customers.csv")
-    products = pd.read_csv("data/Syntheticdata/products.csv")
-    products_closed = pd.read_csv("data/Syntheticdata/products_closed.csv")
-    transactions = pd.read_csv("data/Syntheticdata/transactions.csv")
-except FileNotFoundError as e:
-    print(
-        f"CRITICAL ERROR: Could not find data files. Make sure the 'data/Syntheticdata' folder is correct."
-    )
-    print(e)
-    exit()
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from gemini_client import (
+    GEMINI_BASE_URL,
+    NO_RESPONSE_MESSAGE,
+    OVERLOADED_MESSAGE,
+    TECHNICAL_ISSUE_MESSAGE,
+)
+
+# pandas, numpy and the data/retrieval helpers are imported where they are
+# first needed, so importing this module (e.g. for MASTER_PROMPT) stays cheap.
+
+# --- 2. Configuration ---
+DATA_FILES = {
+    "customers": "data/Syntheticdata/customers.csv",
+    "products": "data/Syntheticdata/products.csv",
+    "products_closed": "data/Syntheticdata/products_closed.csv",
+    "transactions": "data/Syntheticdata/transactions.csv",
+}
+# Bump this whenever wrangle_tables changes so cached snapshots are rebuilt.
+WRANGLE_VERSION = "2"
 
-# --- 3. Data Wrangling (As per your notebook) ---
-print("Wrangling data...")
-# Drop specific rows
-customers = customers.drop(customers.index[30])
-customers.reset_index(inplace=True, drop=True)
-
-transactions = transactions.drop(transactions.index[65])
-transactions.reset_index(inplace=True, drop=True)
-
-# Convert data types
-transactions[["transaction_id", "product_id"]] = transactions[
-    ["transaction_id", "product_id"]
-].astype(int)
-transactions["amount"] = transactions["amount"].astype(float)
-transactions["date"] = pd.to_datetime(transactions["date"], errors="coerce")
-
-customers["birthdate"] = pd.to_datetime(customers["birthdate"], errors="coerce")
-customers["customer_id"] = customers["customer_id"].astype(int)
-
-products[["customer_id", "product_id"]] = products[
-    ["customer_id", "product_id"]
-].astype(int)
-products["opened_date"] = pd.to_datetime(products["opened_date"], errors="coerce")
-print("Data loading and wrangling complete.")
-
-# --- 4. Vector DB Setup (Build Once Logic) ---
 language_configs = {
     "en": "data/chunks/500_750_processed_be_en_2025_09_23/detailed_en_chunks.xlsx",
     "fr": "data/chunks/500_750_processed_be_fr_2025_09_23/detailed_fr_chunks.xlsx",
@@ -57,83 +72,71 @@ language_configs = {
 DB_PATH = "./chroma_db"
 COLLECTION_NAME = "ing_knowledge_base"
 
-# Use PersistentClient to save the database to disk
-client = chromadb.PersistentClient(path=DB_PATH)
+# --- Global API Key Configuration ---
+API_KEY = ""
 
-try:
-    collection = client.get_collection(name=COLLECTION_NAME)
-    if collection.count() > 0:
-        print(f"✅ Connected to existing database with {collection.count()} documents.")
-    else:
-        raise Exception("Collection is empty, rebuilding.")
-
-except Exception:
-    print(f"Database not found or is empty. Building it now at {DB_PATH}...")
-    try:
-        if COLLECTION_NAME in [c.name for c in client.list_collections()]:
-            client.delete_collection(name=COLLECTION_NAME)
-        collection = client.create_collection(name=COLLECTION_NAME)
-    except Exception as e:
-        print(f"Error creating collection: {e}")
-        collection = client.get_or_create_collection(name=COLLECTION_NAME)
-
-    all_documents = []
-    all_metadatas = []
-    all_ids = []
-
-    for lang_code, manifest_path in language_configs.items():
-        print(f"--- Processing language: {lang_code.upper()} ---")
-        # Ensure you have 'openpyxl' installed (via requirements.txt)
-        df_manifest = pd.read_excel(manifest_path)
-        for index, row in df_manifest.iterrows():
-            document_content = row["chunk_content"]
-            original_id = row["chunk_id"]
-            unique_id = f"{lang_code}_{original_id}"
-
-            chunk_metadata = {
-                "language": lang_code,
-                "chunk_name": row["chunk_name"],
-                "chunk_url": row["chunk_url"],
-                "chunk_number": row["chunk_number"],
-            }
+# Named spending periods ("this month", ...) are relative to the engine's
+# clock. By default "today" is the date of the latest transaction, so the
+# bundled synthetic data (which ends in 2025) still has a "this month".
+# LEO_REFERENCE_DATE pins a date (YYYY-MM-DD), or "system" for the real date.
+REFERENCE_DATE = os.environ.get("LEO_REFERENCE_DATE")
 
-            all_documents.append(document_content)
-            all_metadatas.append(chunk_metadata)
-            all_ids.append(unique_id)
+# Drop folder watched for new transactions / product changes (see ingest.py).
+INGEST_DIR = os.environ.get("LEO_INGEST_DIR")
 
-    print(f"Processed a total of {len(all_documents)} documents.")
+# How named periods read in spending answers.
+PERIOD_LABELS = {
+    "week": "this week",
+    "last_week": "last week",
+    "month": "this month",
+    "last_month": "last month",
+    "year": "this year",
+}
 
-    id_counts = Counter(all_ids)
-    duplicates = [item for item, count in id_counts.items() if count > 1]
+# Retrieval results for repeated / near-identical questions, per language.
+RETRIEVAL_CACHE_SIMILARITY = 0.95
+# Dense and lexical candidates fetched per requested result before fusion.
+HYBRID_CANDIDATE_MULTIPLIER = 4
+# Token budgets: the whole prompt, and transactions when rendered on their own.
+PROMPT_TOKEN_BUDGET = 3000
+TRANSACTION_TOKEN_BUDGET = 1200
 
-    if duplicates:
-        print(
-            f"\n❌ ERROR: Found {len(duplicates)} duplicated IDs in the final list before adding to DB."
-        )
-        print(
-            "This means there are duplicate 'chunk_id' values within one of your Excel files."
-        )
-        print("Here are the first 10 problematic IDs:", duplicates[:10])
-    else:
-        print("\n✅ No duplicates found in the final prepared list.")
-        if all_documents:
-            collection.add(
-                documents=all_documents, metadatas=all_metadatas, ids=all_ids
-            )
-            print("✅ Successfully built and saved the vector database!")
+# Run retrieval stages concurrently; set to False to run them one after another.
+PARALLEL_RETRIEVAL = True
+# Seconds each concurrent stage may take before its fallback is used instead.
+STAGE_DEADLINES = {"public_context": 5.0}
 
+# HNSW parameters of the per-language collections. They are fixed when a
+# collection is created: delete the chroma_db folder to rebuild with new
+# values. `benchmark.py --retrieval` reports recall@k and latency per setting.
+HNSW_SETTINGS = {"space": "cosine", "M": 16, "construction_ef": 128, "search_ef": 64}
+# Run the local embedding model int8-quantized (faster on CPU, slightly lower recall).
+EMBEDDING_INT8 = os.environ.get("LEO_EMBEDDING_INT8") == "1"
 
-# --- 5. RAG System Setup ---
+# Tracing: JSONL file for finished turns, and an optional local metrics port.
+TRACE_FILE = os.environ.get("LEO_TRACE_FILE")
+METRICS_PORT = int(os.environ.get("LEO_METRICS_PORT", "0")) or None
+
+# Fallback messages are never cached so a transient failure is not repeated.
+UNCACHEABLE_ANSWERS = {NO_RESPONSE_MESSAGE, TECHNICAL_ISSUE_MESSAGE, OVERLOADED_MESSAGE}
+# Answer scope's knowledge base version while the vector DB is not loaded.
+KB_NOT_LOADED = "kb-not-loaded"
+
+
+def system_clock():
+    """Today's date (midnight, local time)."""
+    import pandas as pd
+
+    return pd.Timestamp.now().normalize()
 
-# --- Global API Key Configuration ---
-API_KEY = ""
-API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-09-2025:generateContent?key={API_KEY}"
 
-# --- Create copies of the DataFrames for the RAG system to use ---
-# This matches the logic from your original script
-customers_df = customers.copy()
-products_df = products.copy()
-transactions_df = transactions.copy()
+def fixed_clock(date):
+    """A clock that always returns `date`, for fixed datasets and tests."""
+    import pandas as pd
+
+    today = pd.Timestamp(date).normalize()
+    return lambda: today
+
 
 # --- The Master Prompt ---
 MASTER_PROMPT = """
@@ -163,197 +166,1175 @@ Based strictly on the rules and context above, provide a concise and helpful ans
 """
 
 
-# --- 6. Python Toolkit (Calculations) ---
-def get_total_spending(customer_id, time_period="month", category=None):
-    try:
-        today = pd.Timestamp("2025-10-29")
-        if time_period == "month":
-            start_date = today.replace(day=1)
-        elif time_period == "last_month":
-            first_of_current_month = today.replace(day=1)
-            start_date = (first_of_current_month - timedelta(days=1)).replace(day=1)
-        elif time_period == "week":
-            start_date = today - timedelta(days=today.dayofweek + 1)
-        else:
-            start_date = today.replace(day=1)
+# --- 3. Data Wrangling (As per your notebook) ---
+def wrangle_tables(sources):
+    """
+    Reads the raw CSVs and applies the notebook's wrangling steps.
+    Only called when the data snapshot is missing or stale.
+    """
+    import pandas as pd
 
-        active_products = products_df[products_df["customer_id"] == customer_id]
+    from table_layout import compact_tables
 
-        customer_transactions = transactions_df[
-            (transactions_df["product_id"].isin(active_products["product_id"]))
-            & (transactions_df["transaction_type"] == "Debit")
-            & (transactions_df["date"] >= start_date)
-            & (transactions_df["date"] <= today)
-        ]
+    customers = pd.read_csv(sources["customers"])
+    products = pd.read_csv(sources["products"])
+    products_closed = pd.read_csv(sources["products_closed"])
+    transactions = pd.read_csv(sources["transactions"])
 
-        if category:
-            customer_transactions = customer_transactions[
-                customer_transactions["description"].str.contains(category, case=False)
-            ]
+    print("Wrangling data...")
+    # Drop specific rows
+    customers = customers.drop(customers.index[30])
+    customers.reset_index(inplace=True, drop=True)
+
+    transactions = transactions.drop(transactions.index[65])
+    transactions.reset_index(inplace=True, drop=True)
+
+    # Convert data types: fixed-width IDs, dates, categoricals for repeated
+    # strings and integer cents for amounts (see table_layout.py)
+    return compact_tables(
+        {
+            "customers": customers,
+            "products": products,
+            "products_closed": products_closed,
+            "transactions": transactions,
+        }
+    )
+
+
+# --- 4. Vector DB Resources ---
+def hnsw_metadata(settings):
+    """Chroma collection metadata for HNSW `settings` (space, M, construction_ef, search_ef)."""
+    return {f"hnsw:{name}": value for name, value in settings.items()}
+
+
+class VectorStore:
+    """The per-language Chroma collections plus everything derived from them."""
 
-        total_spent = customer_transactions["amount"].sum()
+    def __init__(self, client, embedding_function):
+        from embedder import QueryEmbeddingMemo
 
-        time_str = (
-            "this " + time_period if time_period != "last_month" else "last month"
+        self.client = client
+        self.embedding_function = embedding_function
+        self.collections = {}  # language -> collection
+        self.lexical_indexes = {}  # language -> BM25Index
+        self.kb_versions = {}  # language -> manifest key of its last sync
+        self.query_memo = QueryEmbeddingMemo()
+
+    @property
+    def kb_version(self):
+        """Version of the whole knowledge base, for cache scopes."""
+        return "|".join(
+            f"{language}:{version}" for language, version in sorted(self.kb_versions.items())
         )
-        category_str = f"on '{category}'" if category else ""
 
-        return (
-            f"The total amount spent {category_str} {time_str} is €{total_spent:.2f}."
+    def embed_queries(self, questions):
+        return self.query_memo.embed(questions, self.embedding_function)
+
+
+# --- 5. The Assistant Engine ---
+class LeoAssistant:
+    COMPONENTS = ("tables", "indexes", "vector_db", "llm")
+
+    def __init__(
+        self,
+        data_files=DATA_FILES,
+        language_configs=language_configs,
+        db_path=DB_PATH,
+        collection_name=COLLECTION_NAME,
+        api_key=API_KEY,
+        gemini_base_url=None,
+        reference_date=REFERENCE_DATE,
+        trace_path=TRACE_FILE,
+        embedding_function=None,
+        gemini_client=None,
+        clock=None,
+        column_store=None,
+        hnsw_settings=HNSW_SETTINGS,
+        sync_knowledge_base=True,
+    ):
+        from customer_context import CONTEXT_CACHE_ENTRIES, ContextCache
+        from intent_router import IntentRouter
+        from retrieval_cache import SemanticCache
+        from telemetry import Tracer
+
+        self.data_files = data_files
+        self.language_configs = language_configs
+        self.db_path = db_path
+        self.collection_name = collection_name
+        self.api_key = api_key
+        # Override to point the client at a local stub server when testing offline.
+        self.gemini_base_url = gemini_base_url or os.environ.get(
+            "GEMINI_BASE_URL", GEMINI_BASE_URL
+        )
+        # clock() -> today's date: the latest transaction's date unless a
+        # reference_date ("system" for the real date) or a clock is given.
+        if clock is None:
+            if reference_date == "system":
+                clock = system_clock
+            elif reference_date:
+                clock = fixed_clock(reference_date)
+            else:
+                clock = self.latest_transaction_date
+        self.clock = clock
+        self.tracer = Tracer(trace_path=trace_path)
+        # None means the local MiniLM model (embedder.py); pass any
+        # Chroma-compatible embedding function to use a different one.
+        self.embedding_function = embedding_function
+        self.hnsw_settings = hnsw_settings
+        # A ready-made client (e.g. a stub for benchmarks) instead of GeminiClient.
+        self._gemini_client = gemini_client
+        # Directory from data_snapshot.write_column_store: the tables are then
+        # memory-mapped read-only (shared between worker processes) instead of
+        # loaded. Appends build new frames and product updates copy the
+        # columns they change, so the store itself is never written.
+        self.column_store = column_store
+        # False opens the collections read-only: nothing is synced, embedded
+        # or saved, so several processes can share one DB that a single
+        # owner keeps in sync (see leo_service.py).
+        self.sync_knowledge_base = sync_knowledge_base
+
+        self.retrieval_cache = SemanticCache(
+            max_entries=1024,
+            ttl_seconds=6 * 3600,
+            similarity_threshold=RETRIEVAL_CACHE_SIMILARITY,
         )
-    except Exception as e:
-        print(f"Error in get_total_spending: {e}")
-        return "Error: Could not calculate spending."
+        # Full answers per (customer, language, data versions, normalized question);
+        # a hit skips retrieval and the LLM call entirely.
+        self.answer_cache = SemanticCache(max_entries=2048, ttl_seconds=3600)
+        # Rendered profile/products text and prepared transaction history per
+        # customer, rebuilt when the customer's data version changes.
+        self.context_cache = ContextCache(max_entries=CONTEXT_CACHE_ENTRIES)
 
+        self._components = {}
+        self._status = {name: {"state": "cold"} for name in self.COMPONENTS}
+        self._locks = {name: threading.Lock() for name in self.COMPONENTS}
+        self.intent_router = IntentRouter()
+        # intent -> handler(route, customer_id) returning a pre-computed answer.
+        # Intents without a handler (e.g. balance, fees) use the full prompt.
+        self.intent_handlers = {
+            "spending": self._answer_spending,
+            "products": self._answer_products,
+        }
+        self._stage_pool = None
+        self._pool_lock = threading.Lock()
+        # Serializes writers (appends, ingestion); readers never take it.
+        self._write_lock = threading.RLock()
+        # Kept up to date by appends once first computed.
+        self._latest_date = None
+        self._transaction_ids = None
 
-# --- 7. Context Retrievers ---
-def retrieve_public_context(question, language="en", n_results=2):
-    try:
-        results = collection.query(
-            query_texts=[question], n_results=n_results, where={"language": language}
+    # --- Lazy component machinery ---
+    def _component(self, name):
+        component = self._components.get(name)
+        if component is not None:
+            return component
+        with self._locks[name]:
+            component = self._components.get(name)
+            if component is not None:
+                return component
+            self._status[name] = {"state": "warming"}
+            started = time.perf_counter()
+            try:
+                component = getattr(self, f"_init_{name}")()
+            except BaseException as e:
+                self._status[name] = {"state": "failed", "error": str(e)}
+                raise
+            self._components[name] = component
+            self._status[name] = {
+                "state": "ready",
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+            return component
+
+    def warm(self, components=None):
+        """Initializes the given components (all by default) right now."""
+        for name in components or self.COMPONENTS:
+            self._component(name)
+        return self.health()
+
+    def warm_in_background(self, components=None):
+        """Starts warm-up on a daemon thread; progress shows up in health()."""
+
+        def run():
+            for name in components or self.COMPONENTS:
+                try:
+                    self._component(name)
+                except Exception as e:
+                    print(f"Background warm-up of '{name}' failed: {e}")
+
+        thread = threading.Thread(target=run, name="leo-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def serve_metrics(self, port=METRICS_PORT, host="127.0.0.1"):
+        """Serves /metrics (latency histograms, counters) and /health as JSON."""
+        from telemetry import serve_metrics
+
+        return serve_metrics(
+            {"metrics": self.tracer.snapshot, "health": self.health}, port or 0, host
         )
-        context = "\n".join(results["documents"][0])
-        return context
-    except Exception as e:
-        print(f"Error retrieving from Vector DB: {e}")
-        return "No public context found."
 
+    def health(self):
+        """Readiness report: per-component state/timing plus cache counters."""
+        components = {name: dict(status) for name, status in self._status.items()}
+        return {
+            "ready": all(status["state"] == "ready" for status in components.values()),
+            "components": components,
+            "retrieval_cache": self.retrieval_cache.stats(),
+            "answer_cache": self.answer_cache.stats(),
+            "context_cache": self.context_cache.stats(),
+            "memory": self.memory_report() if "tables" in self._components else None,
+            "query_embeddings": (
+                self.vector_store.query_memo.stats()
+                if "vector_db" in self._components
+                else None
+            ),
+            # The default clock reads the tables, so health() never loads them for it.
+            "today": f"{self.today():%Y-%m-%d}" if "tables" in self._components else None,
+        }
 
-def retrieve_personal_context(customer_id, include_transactions=True):
-    """
-    Retrieves customer data. Can optionally exclude the recent transactions.
-    """
-    try:
-        customer_info = customers_df[customers_df["customer_id"] == customer_id].iloc[0]
-        active_products = products_df[products_df["customer_id"] == customer_id]
+    def memory_report(self):
+        """Deep memory footprint per table (rows, bytes, bytes per column)."""
+        from table_layout import memory_report
+
+        return memory_report(self.tables)
+
+    def today(self):
+        import pandas as pd
+
+        return pd.Timestamp(self.clock()).normalize()
+
+    def latest_transaction_date(self):
+        """Date of the newest transaction (the default clock); the system date if none."""
+        import pandas as pd
+
+        if self._latest_date is None:
+            latest = self.transactions_df["date"].max()
+            self._latest_date = system_clock() if pd.isna(latest) else latest.normalize()
+        return self._latest_date
+
+    @property
+    def stage_pool(self):
+        with self._pool_lock:
+            if self._stage_pool is None:
+                self._stage_pool = ThreadPoolExecutor(
+                    max_workers=8, thread_name_prefix="leo-stage"
+                )
+            return self._stage_pool
+
+    # --- Component initializers ---
+    def _init_tables(self):
+        from data_snapshot import load_snapshot, open_column_store
+        from table_layout import format_memory_report, memory_report
+
+        if self.column_store:
+            return open_column_store(self.column_store)
+        print("Loading data files...")
+        try:
+            tables = load_snapshot(
+                self.data_files, wrangle_tables, version=WRANGLE_VERSION
+            )
+        except FileNotFoundError as e:
+            print(
+                f"CRITICAL ERROR: Could not find data files. Make sure the 'data/Syntheticdata' folder is correct."
+            )
+            print(e)
+            raise
+        print("Data loading and wrangling complete.")
+        print(format_memory_report(memory_report(tables)))
+        return tables
+
+    def _init_indexes(self):
+        from customer_index import CustomerIndex
+        from spending_rollup import SpendingRollup
+
+        # --- Per-customer indexes so lookups never scan the full tables ---
+        customer_index = CustomerIndex(
+            self.customers_df, self.products_df, self.transactions_df
+        )
+        # --- Daily debit rollups so spending questions never touch the raw table ---
+        spending_rollup = SpendingRollup(self.products_df, self.transactions_df)
+        return customer_index, spending_rollup
+
+    def _init_vector_db(self):
+        import chromadb
+
+        from embedder import LocalEmbeddingFunction
+        from kb_ingest import knowledge_base_is_current, state_names, synced_version
+        from lexical_index import build_lexical_indexes, load_lexical_indexes
+
+        # Use PersistentClient to save the database to disk
+        client = chromadb.PersistentClient(path=self.db_path)
+        # The same model Chroma uses by default, run locally in batches; created
+        # explicitly so ingestion can embed batches in parallel outside of upsert.
+        embedding_function = self.embedding_function or LocalEmbeddingFunction(
+            quantize=EMBEDDING_INT8
+        )
+        store = VectorStore(client, embedding_function)
+
+        if not self.sync_knowledge_base:
+            return self._open_store(client, store)
+
+        # One collection per language: a query searches only its language's
+        # HNSW graph instead of filtering a shared one by metadata.
+        for language in self.language_configs:
+            collection = store.collections[language] = client.get_or_create_collection(
+                name=f"{self.collection_name}_{language}",
+                embedding_function=embedding_function,
+                metadata=hnsw_metadata(self.hnsw_settings),
+            )
+            state_name, _ = state_names(language)
+            configs = {language: self.language_configs[language]}
+            if knowledge_base_is_current(collection, configs, self.db_path, state_name):
+                print(
+                    f"✅ Connected to the '{language}' collection with "
+                    f"{collection.count()} documents."
+                )
+                version = synced_version(self.db_path, state_name)
+                store.kb_versions[language] = version
+                indexes = load_lexical_indexes(
+                    self.db_path, [language], version
+                ) or build_lexical_indexes(collection, self.db_path, version)
+                store.lexical_indexes.update(indexes)
+            else:
+                print(
+                    f"The '{language}' collection is missing, empty or outdated. "
+                    f"Syncing it now at {self.db_path}..."
+                )
+                try:
+                    self._sync_store(store, [language])
+                except Exception as e:
+                    print(f"Error syncing the '{language}' vector database: {e}")
+        return store
+
+    def _open_store(self, client, store):
+        """Opens the existing collections and their BM25 indexes without writing to the DB."""
+        from kb_ingest import state_names, synced_version
+        from lexical_index import build_lexical_indexes, load_lexical_indexes
+
+        for language in self.language_configs:
+            try:
+                collection = client.get_collection(
+                    name=f"{self.collection_name}_{language}",
+                    embedding_function=store.embedding_function,
+                )
+            except Exception as e:
+                print(f"The '{language}' collection is not available yet: {e}")
+                continue
+            store.collections[language] = collection
+            state_name, _ = state_names(language)
+            version = synced_version(self.db_path, state_name)
+            store.kb_versions[language] = version
+            indexes = load_lexical_indexes(
+                self.db_path, [language], version
+            ) or build_lexical_indexes(collection, self.db_path, version, save=False)
+            store.lexical_indexes.update(indexes)
+            print(
+                f"✅ Opened the '{language}' collection with {collection.count()} "
+                "documents (read-only)."
+            )
+        return store
+
+    def _init_llm(self):
+        if self._gemini_client is not None:
+            return self._gemini_client
+        from gemini_client import GeminiClient
+
+        return GeminiClient(api_key=self.api_key, base_url=self.gemini_base_url)
+
+    # --- Component accessors ---
+    @property
+    def tables(self):
+        return self._component("tables")
+
+    @property
+    def customers_df(self):
+        return self.tables["customers"]
+
+    @property
+    def products_df(self):
+        return self.tables["products"]
+
+    @property
+    def transactions_df(self):
+        return self.tables["transactions"]
+
+    @property
+    def customer_index(self):
+        return self._component("indexes")[0]
+
+    @property
+    def spending_rollup(self):
+        return self._component("indexes")[1]
+
+    @property
+    def vector_store(self):
+        return self._component("vector_db")
+
+    @property
+    def collections(self):
+        return self.vector_store.collections
+
+    @property
+    def collection(self):
+        """The English collection, for callers of the former single collection."""
+        collections = self.collections
+        return collections["en"] if "en" in collections else next(iter(collections.values()))
+
+    @property
+    def gemini_client(self):
+        return self._component("llm")
+
+    # --- Data updates ---
+    # The table is swapped in before the indexes learn the new positions, so
+    # concurrent readers never see a position beyond the end of its table.
+    # The indexes are initialized first: built after the swap, they would
+    # already hold the new rows and then be given them a second time.
+    def append_products(self, new_rows):
+        """Appends product rows and keeps the customer index in sync."""
+        from table_layout import SCHEMAS, append_rows
+
+        with self._write_lock:
+            customer_index, spending_rollup = self._component("indexes")
+            tables = self.tables
+            start = len(tables["products"])
+            tables["products"] = append_rows(
+                tables["products"], new_rows, SCHEMAS["products"]
+            )
+            customer_index.add_products(tables["products"].iloc[start:], start)
+            # Transactions that arrived before their product count from now on.
+            spending_rollup.adopt_orphans(customer_index.owner_of)
+
+    def append_transactions(self, new_rows):
+        """Appends transaction rows and keeps the customer index in sync."""
+        from table_layout import SCHEMAS, append_rows
+
+        with self._write_lock:
+            customer_index, spending_rollup = self._component("indexes")
+            tables = self.tables
+            start = len(tables["transactions"])
+            tables["transactions"] = append_rows(
+                tables["transactions"], new_rows, SCHEMAS["transactions"]
+            )
+            added = tables["transactions"].iloc[start:]
+            customer_index.add_transactions(added, start)
+            spending_rollup.add_transactions(added, customer_index.owner_of)
+            if self._transaction_ids is not None:
+                self._transaction_ids.update(added["transaction_id"].tolist())
+            newest = added["date"].max()
+            if self._latest_date is not None and newest > self._latest_date:
+                self._latest_date = newest.normalize()
+
+    def update_products(self, changes):
+        """
+        Applies changed columns (e.g. `status`) to known products in place.
+        `product_id` identifies the row; missing values leave a column as it
+        was, and ownership (`customer_id`) never moves. Returns the number of
+        rows updated.
+        """
+        import numpy as np
+        import pandas as pd
+
+        from table_layout import SCHEMAS, compact_table
+
+        changes = compact_table(
+            changes.drop(columns="customer_id", errors="ignore"), SCHEMAS["products"]
+        )
+        with self._write_lock:
+            products = self.tables["products"]
+            positions = [
+                self.customer_index.product_row(product_id)
+                for product_id in changes["product_id"]
+            ]
+            known = [position is not None for position in positions]
+            changes = changes[known]
+            positions = np.array(
+                [position for position in positions if position is not None], dtype=np.int64
+            )
+            for column in changes.columns.difference(["product_id"]):
+                if column not in products:
+                    continue
+                present = changes[column].notna().to_numpy()
+                values = changes[column][present]
+                if self.column_store:
+                    # Memory-mapped columns are read-only; edit an in-memory copy.
+                    products[column] = products[column].copy()
+                if isinstance(products[column].dtype, pd.CategoricalDtype):
+                    extra = pd.Index(values.dropna().unique()).difference(
+                        products[column].cat.categories
+                    )
+                    if len(extra):
+                        products[column] = products[column].cat.add_categories(extra)
+                    values = values.astype(object)
+                products.iloc[positions[present], products.columns.get_loc(column)] = (
+                    values.to_numpy()
+                )
+            self.customer_index.touch(
+                {int(customer_id) for customer_id in products["customer_id"].iloc[positions]}
+            )
+        return len(positions)
+
+    def ingest(self, transactions=None, products=None):
+        """
+        Incrementally applies a batch of new data (see ingest.py): products
+        first (known IDs updated in place, new ones appended), then transactions
+        not seen before. Returns counts of what was applied.
+        """
+        import numpy as np
+        import pandas as pd
+
+        stats = {}
+        with self._write_lock, self.tracer.span("ingest"):
+            if products is not None and len(products):
+                known = products["product_id"].map(
+                    lambda product_id: self.customer_index.product_row(product_id) is not None
+                ).to_numpy(dtype=bool)
+                # The last change to a product within a batch wins.
+                updates = products[known].drop_duplicates("product_id", keep="last")
+                additions = products[~known].drop_duplicates("product_id", keep="last")
+                if len(updates):
+                    stats["products_updated"] = self.update_products(updates)
+                if len(additions):
+                    self.append_products(additions)
+                    stats["products_added"] = len(additions)
+            if transactions is not None and len(transactions):
+                if self._transaction_ids is None:
+                    # Built once; appends keep it current, so later batches only
+                    # look up their own IDs instead of scanning the table.
+                    self._transaction_ids = set(self.transactions_df["transaction_id"].tolist())
+                transaction_ids = pd.to_numeric(transactions["transaction_id"])
+                seen = np.fromiter(
+                    (i in self._transaction_ids for i in transaction_ids.tolist()),
+                    dtype=bool,
+                    count=len(transaction_ids),
+                )
+                fresh = ~transaction_ids.duplicated() & ~seen
+                if fresh.any():
+                    self.append_transactions(transactions[fresh.to_numpy()])
+                stats["transactions_added"] = int(fresh.sum())
+                stats["transactions_skipped"] = int(len(transactions) - fresh.sum())
+        for name, value in stats.items():
+            self.tracer.count(f"ingest_{name}", value)
+        return stats
+
+    def start_ingestion(self, drop_folder=INGEST_DIR, poll_interval=None, replay=True):
+        """
+        Starts a background `Ingestor` on `drop_folder` (and its in-process
+        queue). With `replay`, files ingested before a restart are re-applied
+        first, since the tables are rebuilt from the source CSVs.
+        """
+        from ingest import POLL_INTERVAL, Ingestor
+
+        ingestor = Ingestor(
+            self, drop_folder=drop_folder, poll_interval=poll_interval or POLL_INTERVAL
+        )
+        return ingestor.start(replay=replay)
+
+    def _sync_store(self, store, languages=None):
+        from kb_ingest import state_names, sync_knowledge_base, synced_version
+        from lexical_index import build_lexical_indexes
+
+        if not self.sync_knowledge_base:
+            raise RuntimeError("This engine opened the knowledge base read-only.")
+        stats = {}
+        for language in languages or store.collections:
+            state_name, checkpoint_name = state_names(language)
+            # Only chunks whose content hash changed are re-embedded.
+            stats[language] = sync_knowledge_base(
+                store.collections[language],
+                {language: self.language_configs[language]},
+                self.db_path,
+                embedding_function=store.embedding_function,
+                state_name=state_name,
+                checkpoint_name=checkpoint_name,
+            )
+            store.kb_versions[language] = synced_version(self.db_path, state_name)
+            store.lexical_indexes.update(
+                build_lexical_indexes(
+                    store.collections[language], self.db_path, store.kb_versions[language]
+                )
+            )
+        self.retrieval_cache.invalidate()
+        return stats
+
+    def sync_vector_db(self):
+        """Syncs every collection with the manifests and drops stale cached retrievals."""
+        return self._sync_store(self.vector_store)
+
+    # --- 6. Python Toolkit (Calculations) ---
+    def get_total_spending(
+        self, customer_id, time_period="month", category=None, start_date=None, end_date=None
+    ):
+        """
+        Answers spending questions from the precomputed daily rollups.
+        Pass `start_date`/`end_date` for an arbitrary range instead of a named period.
+        """
+        import pandas as pd
+
+        from spending_rollup import period_bounds
+
+        try:
+            if start_date is not None or end_date is not None:
+                period_start, period_end = period_bounds(time_period, self.today())
+                start_date = pd.Timestamp(start_date or period_start)
+                end_date = pd.Timestamp(end_date or period_end)
+                time_str = f"between {start_date:%Y-%m-%d} and {end_date:%Y-%m-%d}"
+            else:
+                start_date, end_date = period_bounds(time_period, self.today())
+                time_str = PERIOD_LABELS.get(time_period, "this " + time_period)
+
+            total_spent = self.spending_rollup.total(
+                customer_id, start_date, end_date, category
+            )
+            category_str = f"on '{category}'" if category else ""
+
+            return (
+                f"The total amount spent {category_str} {time_str} is €{total_spent:.2f}."
+            )
+        except Exception as e:
+            print(f"Error in get_total_spending: {e}")
+            return "Error: Could not calculate spending."
+
+    # --- 7. Context Retrievers ---
+    def retrieve_public_context(self, question, language="en", n_results=2):
+        return self.retrieve_public_contexts([question], language, n_results)[0]
+
+    def retrieve_public_contexts(
+        self, questions, language="en", n_results=2, fallback="No public context found."
+    ):
+        """
+        Batched retrieval: per-question cache lookups, then one embedding call
+        and one Chroma query for all misses. Returns contexts in input order;
+        questions whose retrieval failed get `fallback`.
+        """
+        scope = (language, n_results)
+        tracer = self.tracer
+        contexts = [None] * len(questions)
+        try:
+            with tracer.span("public_context"):
+                misses = []
+                for i, question in enumerate(questions):
+                    contexts[i] = self.retrieval_cache.get_exact(
+                        scope, question, count_miss=False
+                    )
+                    if contexts[i] is not None:
+                        tracer.count("retrieval_cache_exact_hits")
+                    else:
+                        misses.append(i)
+                if not misses:
+                    return contexts
 
-        context = f"""Customer Profile:
+                from lexical_index import reciprocal_rank_fusion
+
+                store = self.vector_store
+                with tracer.span("embedding"):
+                    # Embed once (recently seen questions not at all) and reuse the
+                    # vectors for both the cache and the query.
+                    embeddings = store.embed_queries([questions[i] for i in misses])
+                pending = []
+                for i, query_embedding in zip(misses, embeddings):
+                    contexts[i] = self.retrieval_cache.get_similar(scope, query_embedding)
+                    if contexts[i] is not None:
+                        tracer.count("retrieval_cache_similar_hits")
+                    else:
+                        pending.append((i, query_embedding))
+                if not pending:
+                    return contexts
+                tracer.count("retrieval_cache_misses", len(pending))
+
+                with tracer.span("vector_query"):
+                    # Hybrid retrieval: fuse dense and BM25 candidates with reciprocal-rank
+                    # fusion so a small n_results still catches exact product/fee terms.
+                    n_candidates = n_results * HYBRID_CANDIDATE_MULTIPLIER
+                    results = store.collections[language].query(
+                        query_embeddings=[query_embedding for _, query_embedding in pending],
+                        n_results=n_candidates,
+                    )
+                    lexical_index = store.lexical_indexes.get(language)
+                    for row, (i, query_embedding) in enumerate(pending):
+                        documents = dict(zip(results["ids"][row], results["documents"][row]))
+                        rankings = [results["ids"][row]]
+                        if lexical_index is not None:
+                            lexical_hits = lexical_index.search(questions[i], n_candidates)
+                            documents.update(
+                                (chunk_id, doc) for chunk_id, doc, _ in lexical_hits
+                            )
+                            rankings.append([chunk_id for chunk_id, _, _ in lexical_hits])
+
+                        top_ids = reciprocal_rank_fusion(rankings)[:n_results]
+                        contexts[i] = "\n".join(documents[chunk_id] for chunk_id in top_ids)
+                        self.retrieval_cache.put(
+                            scope, questions[i], contexts[i], embedding=query_embedding
+                        )
+                return contexts
+        except Exception as e:
+            print(f"Error retrieving from Vector DB: {e}")
+            tracer.count("public_context_errors")
+            return [context if context is not None else fallback for context in contexts]
+
+    def _materialize_context(self, customer_id, version):
+        """Renders the customer's profile and prepares their transaction history."""
+        from customer_context import CustomerContext
+        from prompt_builder import TransactionHistory
+
+        customer_index = self.customer_index
+        customer_row = customer_index.customer_row(customer_id)
+        if customer_row is None:
+            raise IndexError(customer_id)
+        customer_info = self.customers_df.iloc[customer_row]
+        active_products = self.products_df.take(customer_index.product_rows(customer_id))
+
+        profile = f"""Customer Profile:
 - Name: {customer_info['name']}
 - Segment: {customer_info['segment_code']}
 
 Owned Products (Active):
 {active_products[['product_name', 'status']].to_string(index=False) if not active_products.empty else "No active products."}
 """
+        # Index rows are already sorted newest first.
+        transactions = self.transactions_df.take(customer_index.transaction_rows(customer_id))
+        return CustomerContext(
+            customer_id=int(customer_id),
+            version=version,
+            profile=profile,
+            history=TransactionHistory(transactions),
+        )
+
+    def customer_context(self, customer_id):
+        """
+        The customer's materialized context, from the context cache when it
+        is still current. Raises IndexError for an unknown customer.
+        """
+        version = self.customer_index.data_version(customer_id)
+        context = self.context_cache.get(customer_id, version)
+        if context is not None:
+            self.tracer.count("context_cache_hits")
+            return context
+        self.tracer.count("context_cache_misses")
+        context = self._materialize_context(customer_id, version)
+        self.context_cache.put(context)
+        return context
+
+    def start_session(self, customer_id):
+        """
+        Materializes the customer's context in the background when a
+        conversation starts, so the first turn already finds it cached.
+        """
+        return self.stage_pool.submit(self.customer_context, customer_id)
+
+    def warm_contexts(self, customer_ids=None):
+        """
+        Materializes contexts ahead of time for `customer_ids` (by default the
+        first customers, as many as the cache holds). Returns how many were built.
+        """
+        if customer_ids is None:
+            customer_ids = self.customers_df["customer_id"].head(self.context_cache.max_entries)
+        built = 0
+        for customer_id in customer_ids:
+            try:
+                self.customer_context(customer_id)
+                built += 1
+            except Exception as e:
+                print(f"Could not materialize context for customer {customer_id}: {e}")
+        return built
+
+    def warm_contexts_in_background(self, customer_ids=None):
+        """Runs `warm_contexts` on a daemon thread; progress shows up in health()."""
+        thread = threading.Thread(
+            target=self.warm_contexts,
+            args=(customer_ids,),
+            name="leo-context-warmup",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def retrieve_personal_sections(self, customer_id, include_transactions=True):
+        """
+        Returns (profile_and_products_text, transactions) for the customer, with
+        transactions a `TransactionHistory` sorted newest first (None when
+        excluded or on error).
+        """
+        try:
+            context = self.customer_context(customer_id)
+            return context.profile, context.history if include_transactions else None
+        except IndexError:
+            return f"Error: Customer with ID '{customer_id}' not found.", None
+        except Exception as e:
+            print(f"Error retrieving personal context: {e}")
+            return "Error: Could not retrieve customer data.", None
 
-        if include_transactions:
-            product_ids = active_products["product_id"]
-            recent_transactions = transactions_df[
-                transactions_df["product_id"].isin(product_ids)
-            ].sort_values(by="date", ascending=False)
+    def retrieve_personal_context(
+        self,
+        customer_id,
+        include_transactions=True,
+        question="",
+        token_budget=TRANSACTION_TOKEN_BUDGET,
+    ):
+        """
+        Retrieves customer data. Can optionally exclude the recent transactions.
+        Transactions are rendered within `token_budget`: recent and question-relevant
+        rows are listed, older history is summarized.
+        """
+        context, history = self.retrieve_personal_sections(customer_id, include_transactions)
+        if history is not None:
             context += f"""
 Recent Transactions:
-{recent_transactions[['date', 'description', 'amount', 'currency']].to_string(index=False) if not recent_transactions.empty else "No recent transactions."}
+{history.render(question, token_budget)}
 """
         return context
-    except IndexError:
-        return f"Error: Customer with ID '{customer_id}' not found."
-    except Exception as e:
-        print(f"Error retrieving personal context: {e}")
-        return "Error: Could not retrieve customer data."
 
+    # --- 8. Query Router ---
+    def route_query(self, question, customer_id, language="en"):
+        """
+        Detects intent, category and time period (see intent_router.py) and
+        answers the question from precomputed data when a handler exists.
+        Returns "" when the question needs the full prompt.
+        """
+        with self.tracer.span("routing"):
+            route = self.intent_router.route(question, language)
+            self.tracer.annotate(intent=route.intent)
+            handler = self.intent_handlers.get(route.intent)
+            if handler is None:
+                return ""
+            self.tracer.count(f"intent_{route.intent}")
+            pre_computed_result = handler(route, customer_id)
+            print(f"Pre-computed result: {pre_computed_result}")
+            return pre_computed_result
 
-# --- 8. Query Router ---
-def route_query(question, customer_id):
-    question_lower = question.lower()
-    pre_computed_result = ""
-    if "how much" in question_lower and "spend" in question_lower:
-        category = None
-        time_period = "month"
+    def _answer_spending(self, route, customer_id):
+        return self.get_total_spending(
+            customer_id, route.time_period or "month", route.category
+        )
 
-        if "groceries" in question_lower or "grocery" in question_lower:
-            category = "Grocery"
-        elif "transport" in question_lower:
-            category = "Transport"
+    def _answer_products(self, route, customer_id):
+        products = self.products_df.take(self.customer_index.product_rows(customer_id))
+        if products.empty:
+            return "The customer has no products."
+        listed = ", ".join(
+            f"{row.product_name} ({row.status})" for row in products.itertuples()
+        )
+        return f"The customer holds {len(products)} product(s): {listed}."
 
-        if "this week" in question_lower:
-            time_period = "week"
-        elif "last month" in question_lower:
-            time_period = "last_month"
+    # --- 9. Gemini API Call ---
+    def call_gemini_api(self, prompt, call_stats=None):
+        """
+        Sends the completed prompt to the Gemini API using the simple API Key.
+        Uses the shared pooled client (keep-alive connections, jittered retries).
+        Pass a dict as `call_stats` to receive this call's retry counts.
+        """
+        if call_stats is None:
+            call_stats = {}
+        try:
+            with self.tracer.span("llm"):
+                return self.gemini_client.generate(prompt, call_stats)
+        finally:
+            self._record_llm_call(call_stats)
 
-        pre_computed_result = get_total_spending(customer_id, time_period, category)
-        print(f"Pre-computed result: {pre_computed_result}")
+    def stream_gemini_api(self, prompt, call_stats=None):
+        """
+        Yields the answer text in chunks as Gemini generates it. Pass a dict
+        as `call_stats` to learn whether the stream failed or was cut short.
+        """
+        if call_stats is None:
+            call_stats = {}
+        started = time.perf_counter()
+        first_chunk = True
+        try:
+            with self.tracer.span("llm"):
+                for chunk in self.gemini_client.stream(prompt, call_stats):
+                    if first_chunk:
+                        first_chunk = False
+                        self.tracer.observe(
+                            "llm_first_chunk_ms", (time.perf_counter() - started) * 1000
+                        )
+                    yield chunk
+        finally:
+            self._record_llm_call(call_stats)
 
-    return pre_computed_result
+    def _record_llm_call(self, call_stats):
+        self.tracer.count("llm_calls")
+        self.tracer.count("llm_retries", call_stats.get("retries", 0))
+        self.tracer.count("llm_rate_limited", call_stats.get("rate_limited", 0))
+        if call_stats.get("failed"):
+            self.tracer.count("llm_failures")
+        if call_stats.get("truncated"):
+            self.tracer.count("llm_truncated_streams")
 
+    # --- 10. Main Orchestrator ---
+    def _await_stage(self, future, stage, fallback):
+        """
+        Waits for a stage up to its deadline. A late stage keeps running in the
+        background (so it can still warm caches) but the caller moves on.
+        """
+        try:
+            return future.result(timeout=STAGE_DEADLINES.get(stage))
+        except FutureTimeoutError:
+            print(f"Stage '{stage}' missed its {STAGE_DEADLINES.get(stage)}s deadline.")
+            return fallback
 
-# --- 9. Gemini API Call ---
-def call_gemini_api(prompt):
-    """
-    Sends the completed prompt to the Gemini API using the simple API Key.
-    """
-    headers = {"Content-Type": "application/json"}
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-    max_retries = 3
-    delay = 1
+    def build_prompt(self, user_question, customer_id, language="en", public_context=None):
+        """
+        Routes the question, gathers context and assembles the prompt. Pass
+        `public_context` when it was already retrieved (e.g. in a batch).
+        """
+        from prompt_builder import build_master_prompt
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.post(API_URL, json=payload, headers=headers, timeout=60)
-            response.raise_for_status()
-            result = response.json()
+        print(f"\n--- New Query ---")
+        print(f"User ({customer_id}): {user_question}")
 
-            if "candidates" in result and result["candidates"]:
-                text = result["candidates"][0]["content"]["parts"][0]["text"]
-                return text
-            else:
-                return (
-                    "I'm sorry, I wasn't able to generate a response. Please try again."
-                )
+        # 1. Start the vector retrieval first; it is independent of routing and
+        # runs while the pandas-side work below happens on this thread.
+        retrieve = public_context is None
+        if retrieve and PARALLEL_RETRIEVAL:
+            # Submitted within a copy of this context so its spans join the turn.
+            public_future = self.stage_pool.submit(
+                contextvars.copy_context().run,
+                self.retrieve_public_context,
+                user_question,
+                language,
+            )
 
-        except requests.exceptions.HTTPError as http_err:
-            if response.status_code == 429 and attempt < max_retries - 1:
-                print(f"Rate limited. Retrying in {delay}s...")
-                time.sleep(delay)
-                delay *= 2
-            else:
-                print(f"HTTP error occurred: {http_err} - {response.text}")
-                return "I'm sorry, I'm facing a technical issue and can't respond right now."
-        except requests.exceptions.RequestException as req_err:
-            print(f"Request error occurred: {req_err}")
-            time.sleep(delay)
-            delay *= 2
+        # 2. Route query to check for calculations
+        pre_computed_result = self.route_query(user_question, customer_id, language)
 
-    return "I'm sorry, I'm currently overloaded. Please try again."
+        # 3. Retrieve personal context
+        # If we have a pre-computed result, don't include the confusing "Recent Transactions" list.
+        include_tx = not bool(pre_computed_result)
+        with self.tracer.span("personal_context"):
+            personal_context, transaction_history = self.retrieve_personal_sections(
+                customer_id, include_transactions=include_tx
+            )
 
+        # 4. Collect public context (falls back if the stage misses its deadline)
+        if retrieve and PARALLEL_RETRIEVAL:
+            public_context = self._await_stage(
+                public_future, "public_context", "No public context found."
+            )
+        elif retrieve:
+            public_context = self.retrieve_public_context(user_question, language)
 
-# --- 10. Main Orchestrator ---
-def get_bot_response(user_question, customer_id, language="en"):
-    print(f"\n--- New Query ---")
-    print(f"User ({customer_id}): {user_question}")
+        # 5. Assemble final prompt within the token budget
+        with self.tracer.span("prompt_build"):
+            prompt_build = build_master_prompt(
+                MASTER_PROMPT,
+                question=user_question,
+                public_context=public_context,
+                personal_context=personal_context,
+                pre_computed_result=pre_computed_result,
+                transactions=transaction_history,
+                token_budget=PROMPT_TOKEN_BUDGET,
+            )
+        print(f"Prompt tokens (estimated): {prompt_build.token_counts}")
+        self.tracer.observe("prompt_tokens", prompt_build.total_tokens)
+        self.tracer.annotate(prompt_tokens=prompt_build.token_counts)
+        return prompt_build
+
+    def prefetch_context(self, partial_question, customer_id, language="en"):
+        """
+        Starts public retrieval for an interim transcript in the background.
+        Results land in the retrieval cache, so the final question often hits it
+        (exactly or via the similarity tier). Routing itself is answered from
+        in-memory rollups and needs no warm-up.
+        """
+        self.stage_pool.submit(self.retrieve_public_context, partial_question, language)
+
+    def _answer_scope(self, customer_id, language):
+        # Any new transaction/product for the customer, a knowledge base sync
+        # or a new day (periods like "this week" move) changes the scope, so
+        # stale answers are never served. The vector DB is not waited for:
+        # until it is loaded the scope says so (see `_cacheable`), and
+        # retrieval degrades under its own stage deadline.
+        store = self._components.get("vector_db")
+        return (
+            int(customer_id),
+            language,
+            self.customer_index.data_version(customer_id),
+            store.kb_version if store is not None else KB_NOT_LOADED,
+            self.today(),
+        )
+
+    @staticmethod
+    def _cacheable(scope, answer):
+        """Whether `answer` may be cached: a real answer, built with the knowledge base."""
+        return answer and answer not in UNCACHEABLE_ANSWERS and KB_NOT_LOADED not in scope
+
+    def _cached_answer(self, scope, user_question, customer_id):
+        cached_answer = self.answer_cache.get_exact(scope, user_question)
+        if cached_answer is not None:
+            print(f"Answer cache hit for customer {customer_id}.")
+            self.tracer.count("answer_cache_hits")
+            self.tracer.annotate(answer_cache_hit=True)
+        else:
+            self.tracer.count("answer_cache_misses")
+        return cached_answer
+
+    def get_bot_response(self, user_question, customer_id, language="en"):
+        with self.tracer.trace(customer_id=int(customer_id), language=language):
+            scope = self._answer_scope(customer_id, language)
+            cached_answer = self._cached_answer(scope, user_question, customer_id)
+            if cached_answer is not None:
+                return cached_answer
+
+            final_prompt = self.build_prompt(user_question, customer_id, language).prompt
+
+            # 6. Call LLM for final answer
+            final_answer = self.call_gemini_api(final_prompt)
+            if self._cacheable(scope, final_answer):
+                self.answer_cache.put(scope, user_question, final_answer)
+            return final_answer
+
+    def get_bot_response_stream(self, user_question, customer_id, language="en"):
+        """
+        Streaming variant of get_bot_response: yields the answer in chunks as
+        they arrive, so playback/display can start before the full answer exists.
+        """
+        with self.tracer.trace(customer_id=int(customer_id), language=language):
+            scope = self._answer_scope(customer_id, language)
+            cached_answer = self._cached_answer(scope, user_question, customer_id)
+            if cached_answer is not None:
+                yield cached_answer
+                return
 
-    # 1. Route query to check for calculations
-    pre_computed_result = route_query(user_question, customer_id)
+            final_prompt = self.build_prompt(user_question, customer_id, language).prompt
+            chunks = []
+            call_stats = {}
+            for chunk in self.stream_gemini_api(final_prompt, call_stats):
+                chunks.append(chunk)
+                yield chunk
 
-    # 2. Retrieve public context
-    public_context = retrieve_public_context(user_question, language)
+            # A stream cut short must not be served as the full answer later.
+            final_answer = "".join(chunks)
+            complete = not (call_stats.get("failed") or call_stats.get("truncated"))
+            if complete and self._cacheable(scope, final_answer):
+                self.answer_cache.put(scope, user_question, final_answer)
 
-    # 3. Retrieve personal context
-    # If we have a pre-computed result, don't include the confusing "Recent Transactions" list.
-    include_tx = not bool(pre_computed_result)
-    personal_context = retrieve_personal_context(
-        customer_id, include_transactions=include_tx
+
+# --- 11. Shared Engine & Module-Level API ---
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The process-wide engine (created on first use, components stay lazy)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LeoAssistant()
+        return _engine
+
+
+def get_total_spending(
+    customer_id, time_period="month", category=None, start_date=None, end_date=None
+):
+    return get_engine().get_total_spending(
+        customer_id, time_period, category, start_date, end_date
     )
 
-    # 4. Assemble final prompt
-    final_prompt = MASTER_PROMPT.format(
-        public_context=public_context,
-        personal_context=personal_context,
-        pre_computed_result=pre_computed_result,
-        question=user_question,
+
+def retrieve_public_context(question, language="en", n_results=2):
+    return get_engine().retrieve_public_context(question, language, n_results)
+
+
+def retrieve_public_contexts(
+    questions, language="en", n_results=2, fallback="No public context found."
+):
+    return get_engine().retrieve_public_contexts(questions, language, n_results, fallback)
+
+
+def retrieve_personal_sections(customer_id, include_transactions=True):
+    return get_engine().retrieve_personal_sections(customer_id, include_transactions)
+
+
+def retrieve_personal_context(
+    customer_id, include_transactions=True, question="", token_budget=TRANSACTION_TOKEN_BUDGET
+):
+    return get_engine().retrieve_personal_context(
+        customer_id, include_transactions, question, token_budget
     )
 
-    # 5. Call LLM for final answer
-    final_answer = call_gemini_api(final_prompt)
-    return final_answer
+
+def route_query(question, customer_id, language="en"):
+    return get_engine().route_query(question, customer_id, language)
+
+
+def call_gemini_api(prompt, call_stats=None):
+    return get_engine().call_gemini_api(prompt, call_stats)
+
+
+def stream_gemini_api(prompt, call_stats=None):
+    return get_engine().stream_gemini_api(prompt, call_stats)
+
+
+def build_prompt(user_question, customer_id, language="en", public_context=None):
+    return get_engine().build_prompt(user_question, customer_id, language, public_context)
+
+
+def prefetch_context(partial_question, customer_id, language="en"):
+    return get_engine().prefetch_context(partial_question, customer_id, language)
+
+
+def start_session(customer_id):
+    return get_engine().start_session(customer_id)
+
+
+def get_bot_response(user_question, customer_id, language="en"):
+    return get_engine().get_bot_response(user_question, customer_id, language)
+
+
+def get_bot_response_stream(user_question, customer_id, language="en"):
+    return get_engine().get_bot_response_stream(user_question, customer_id, language)
+
+
+def append_products(new_rows):
+    return get_engine().append_products(new_rows)
+
+
+def append_transactions(new_rows):
+    return get_engine().append_transactions(new_rows)
+
+
+def ingest(transactions=None, products=None):
+    return get_engine().ingest(transactions, products)
+
+
+def sync_vector_db():
+    return get_engine().sync_vector_db()
+
+
+# Engine-backed attributes kept for callers of the old module-level globals,
+# e.g. `from ing_assistant import customers_df`. Resolved on first access.
+_ENGINE_ATTRIBUTES = {
+    "customers_df",
+    "products_df",
+    "transactions_df",
+    "customer_index",
+    "spending_rollup",
+    "collections",
+    "collection",
+    "gemini_client",
+    "retrieval_cache",
+    "answer_cache",
+    "context_cache",
+}
+
+
+def __getattr__(name):
+    if name in _ENGINE_ATTRIBUTES:
+        return getattr(get_engine(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-# --- 11. Example Usage (for testing) ---
+# --- 12. Example Usage (for testing) ---
 if __name__ == "__main__":
     print("\n--- Running ing_assistant.py as main script for testing ---")
+    engine = get_engine()
+    engine.warm()
+    print(f"Health: {engine.health()}")
 
     # Make sure customers_df is not empty before trying to get a user
-    if not customers_df.empty:
-        example_customer_id = customers_df["customer_id"].iloc[0]  # This should be 1001
+    if not engine.customers_df.empty:
+        example_customer_id = engine.customers_df["customer_id"].iloc[0]  # This should be 1001
 
         # --- Example 1: A calculation query ---
         question_1 = "How much did I spend on groceries this month?"
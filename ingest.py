@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Incremental ingestion of new transactions and product changes.
+
+Fresh data reaches a running engine without a cold reload:
+
+- a drop folder: write `transactions*.csv|jsonl` or `products*.csv|jsonl`
+  files (same columns as the source CSVs) into it. Files are picked up in
+  name order, applied, and moved to `processed/` (or `errors/`). Write
+  them under a temporary name (`.tmp`, or starting with `.`) and rename
+  when complete; those names are ignored;
+- an in-process `IngestQueue` standing in for a message queue, for
+  producers living in the same process.
+
+An `Ingestor` drains both in batches and hands them to
+`LeoAssistant.ingest`, which updates the tables, the per-customer indexes
+and the spending rollups incrementally. Product rows whose `product_id` is
+already known are applied as in-place changes (e.g. a status update); the
+rest are appended. Transactions whose `transaction_id` was already
+ingested are skipped, so replaying a file is harmless.
+
+Nothing is acknowledged before it was applied. When a batch fails, its
+events are retried one by one; an event that still fails is dead-lettered:
+a file moves to `errors/`, a queue event is kept in `Ingestor.dead_letters`
+(and written to `errors/` when there is a drop folder).
+
+    ingestor = Ingestor(engine, drop_folder="./ingest").start()
+    ingestor.queue.put_transactions(rows)
+"""
+
+import os
+import queue
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+# --- 1. Configuration ---
+POLL_INTERVAL = 2.0
+# Queue events applied together in one `engine.ingest` call at most.
+MAX_BATCH_EVENTS = 64
+KINDS = ("products", "transactions")
+PROCESSED_DIR = "processed"
+ERRORS_DIR = "errors"
+
+
+@dataclass
+class IngestEvent:
+    kind: str
+    rows: pd.DataFrame
+    source: str = None
+
+
+# --- 2. Sources ---
+def read_rows(path):
+    """Reads a dropped CSV or JSONL file into a DataFrame."""
+    if path.endswith(".jsonl"):
+        return pd.read_json(path, lines=True)
+    return pd.read_csv(path)
+
+
+def file_kind(name):
+    """'transactions' / 'products' for a drop file name, None otherwise."""
+    if name.startswith(".") or not name.endswith((".csv", ".jsonl")):
+        return None
+    for kind in KINDS:
+        if name.startswith(kind):
+            return kind
+    return None
+
+
+class DropFolder:
+    def __init__(self, folder):
+        self.folder = folder
+        for subfolder in (PROCESSED_DIR, ERRORS_DIR):
+            os.makedirs(os.path.join(folder, subfolder), exist_ok=True)
+
+    def poll(self):
+        """Events for every complete file currently in the folder, in name order."""
+        events = []
+        for name in sorted(os.listdir(self.folder)):
+            path = os.path.join(self.folder, name)
+            kind = file_kind(name)
+            if kind is None or not os.path.isfile(path):
+                continue
+            try:
+                rows = read_rows(path)
+            except Exception as e:
+                print(f"Could not read {path}: {e}")
+                self.ack(path, ok=False)
+                continue
+            events.append(IngestEvent(kind, rows, source=path))
+        return events
+
+    def ack(self, path, ok=True):
+        target = os.path.join(self.folder, PROCESSED_DIR if ok else ERRORS_DIR)
+        shutil.move(path, os.path.join(target, os.path.basename(path)))
+
+    def dead_letter(self, event):
+        """Writes a failed queue event to `errors/` as JSONL; returns its path."""
+        name = f"{event.kind}-queue-{time.time_ns()}.jsonl"
+        path = os.path.join(self.folder, ERRORS_DIR, name)
+        event.rows.to_json(path, orient="records", lines=True, date_format="iso")
+        return path
+
+    def processed(self):
+        """Events for every already-processed file, in name order."""
+        folder = os.path.join(self.folder, PROCESSED_DIR)
+        return [
+            IngestEvent(file_kind(name), read_rows(os.path.join(folder, name)))
+            for name in sorted(os.listdir(folder))
+            if file_kind(name)
+        ]
+
+
+class IngestQueue:
+    """In-process stand-in for a message queue of ingest events."""
+
+    def __init__(self, maxsize=0):
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        self._queue.put(event)
+
+    def put_transactions(self, rows):
+        self.put(IngestEvent("transactions", pd.DataFrame(rows)))
+
+    def put_products(self, rows):
+        self.put(IngestEvent("products", pd.DataFrame(rows)))
+
+    def drain(self, max_events=MAX_BATCH_EVENTS, timeout=None):
+        """Up to `max_events` events; waits up to `timeout` seconds for the first."""
+        events = []
+        try:
+            if timeout:
+                events.append(self._queue.get(timeout=timeout))
+            else:
+                events.append(self._queue.get_nowait())
+            while len(events) < max_events:
+                events.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+
+# --- 3. Ingestor ---
+class Ingestor:
+    def __init__(
+        self, engine, ingest_queue=None, drop_folder=None, poll_interval=POLL_INTERVAL
+    ):
+        self.engine = engine
+        self.queue = ingest_queue or IngestQueue()
+        self.drop_folder = DropFolder(drop_folder) if drop_folder else None
+        self.poll_interval = poll_interval
+        self.totals = {}
+        # Queue events that could not be applied, with the error.
+        self.dead_letters = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def apply(self, events):
+        """Applies events as one batch: products first, so new transactions find their owner."""
+        frames = {kind: [] for kind in KINDS}
+        for event in events:
+            if event.kind not in frames:
+                raise ValueError(f"Unknown ingest event kind: {event.kind!r}")
+            if len(event.rows):
+                frames[event.kind].append(event.rows)
+        batch = {
+            kind: pd.concat(rows, ignore_index=True) if rows else None
+            for kind, rows in frames.items()
+        }
+        stats = self.engine.ingest(**batch)
+        for name, value in stats.items():
+            self.totals[name] = self.totals.get(name, 0) + value
+        return stats
+
+    def process_pending(self, timeout=None):
+        """
+        Ingests whatever is waiting in the drop folder and the queue. If the
+        batch fails, each event is retried alone so one bad event cannot
+        take the others down; events that still fail are dead-lettered.
+        """
+        file_events = self.drop_folder.poll() if self.drop_folder else []
+        queue_events = self.queue.drain(timeout=None if file_events else timeout)
+        events = file_events + queue_events
+        if not events:
+            return {}
+        try:
+            stats = self.apply(events)
+        except Exception as e:
+            print(f"Ingest batch failed ({len(events)} events), retrying one by one: {e}")
+            # Safe after a partial apply: known transactions are skipped and
+            # product changes re-applied, so nothing is counted twice.
+            stats = {}
+            for event in events:
+                try:
+                    for name, value in self.apply([event]).items():
+                        stats[name] = stats.get(name, 0) + value
+                except Exception as error:
+                    self.fail(event, error)
+                else:
+                    self.ack_source(event)
+            return stats
+        for event in file_events:
+            self.ack_source(event)
+        return stats
+
+    def ack_source(self, event, ok=True):
+        if event.source and self.drop_folder:
+            self.drop_folder.ack(event.source, ok)
+
+    def fail(self, event, error):
+        """Dead-letters an event that could not be applied."""
+        if event.source:
+            print(f"Could not ingest {event.source}: {error}")
+            self.ack_source(event, ok=False)
+            return
+        self.dead_letters.append((event, f"{type(error).__name__}: {error}"))
+        where = self.drop_folder.dead_letter(event) if self.drop_folder else "dead_letters"
+        print(
+            f"Could not ingest a queued '{event.kind}' event ({len(event.rows)} rows, "
+            f"kept in {where}): {error}\n{event.rows.head().to_string()}"
+        )
+
+    def replay_processed(self):
+        """Re-applies processed drop files, e.g. after a restart from the source CSVs."""
+        if self.drop_folder is None:
+            return {}
+        events = self.drop_folder.processed()
+        return self.apply(events) if events else {}
+
+    def start(self, replay=False):
+        """Ingests on a daemon thread until `stop()`; returns self."""
+
+        def run():
+            if replay:
+                try:
+                    self.replay_processed()
+                except Exception as e:
+                    print(f"Replaying processed ingest files failed: {e}")
+            while not self._stop.is_set():
+                try:
+                    self.process_pending(timeout=self.poll_interval)
+                except Exception as e:
+                    # e.g. the drop folder became unreadable; try again later.
+                    print(f"Ingestion failed: {e}")
+                    self._stop.wait(self.poll_interval)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="leo-ingest", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Compiled multilingual intent router.
+
+`route_query` used to run a chain of English-only `in` checks, so French
+and Dutch spending questions never reached the precomputed answers. Here
+every cue (a quantity word, a spending verb, a category, a time range, ...)
+is a pattern in a per-language table. Each language's table is compiled
+into one regular expression of named alternatives, and a single `finditer`
+pass over the accent-folded question yields every cue it contains.
+
+An intent fires when all of its required cues were seen; the first
+matching intent in `INTENTS` wins. New intents, categories, periods or
+languages are added by extending the tables, not the code.
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass, field
+
+# --- 1. Pattern Tables ---
+# language -> [(slot, value, pattern)], patterns written lower-case and
+# without accents. Within a language, earlier entries win when two patterns
+# match at the same position, so list specific phrases before general ones.
+PATTERNS = {
+    "en": [
+        ("cue", "balance", r"balance|how much (?:money )?(?:do i have|is left)"),
+        ("cue", "quantity", r"how much|what did i|in total|total"),
+        ("cue", "spend", r"spen[dt]\w*"),
+        ("cue", "pay", r"pa(?:y|id) for"),
+        ("cue", "charged_item", r"cards?|accounts?|subscriptions?|memberships?"),
+        ("cue", "products", r"(?:which|what) (?:accounts?|cards?|products?)|my (?:accounts|cards|products)"),
+        ("cue", "fee", r"fees?|charges?|costs?"),
+        ("category", "Grocery", r"grocer(?:y|ies)|supermarkets?"),
+        ("category", "Transport", r"transport\w*|trains?|bus(?:es)?|metro|tram"),
+        ("category", "Restaurant", r"restaurants?|dining|eating out"),
+        ("category", "ATM", r"atm|cash withdrawals?"),
+        ("period", "last_week", r"last week|past week|previous week"),
+        ("period", "week", r"this week"),
+        ("period", "last_month", r"last month|past month|previous month"),
+        ("period", "month", r"this month"),
+        ("period", "year", r"this year"),
+    ],
+    "fr": [
+        ("cue", "balance", r"solde|combien d'argent (?:ai-je|me reste)|combien me reste"),
+        ("cue", "quantity", r"combien|au total|total"),
+        ("cue", "spend", r"depens\w*"),
+        ("cue", "pay", r"pa(?:y|i)e(?:r|z)? pour"),
+        ("cue", "charged_item", r"cartes?|comptes?|abonnements?"),
+        ("cue", "products", r"quels? (?:comptes?|cartes?|produits?)|mes (?:comptes|cartes|produits)"),
+        ("cue", "fee", r"frais|couts?|tarifs?"),
+        ("category", "Grocery", r"courses|epicerie|alimentation|supermarches?"),
+        ("category", "Transport", r"transports?|trains?|bus|metro|tram"),
+        ("category", "Restaurant", r"restaurants?"),
+        ("category", "ATM", r"retraits?|distributeurs?"),
+        ("period", "last_week", r"(?:la )?semaine (?:derniere|passee)"),
+        ("period", "week", r"cette semaine"),
+        ("period", "last_month", r"(?:le )?mois (?:dernier|passe|precedent)"),
+        ("period", "month", r"ce mois(?:-ci)?"),
+        ("period", "year", r"cette annee"),
+    ],
+    "nl": [
+        ("cue", "balance", r"saldo|hoeveel geld (?:heb ik|staat er)"),
+        ("cue", "quantity", r"hoeveel|in totaal|totaal"),
+        ("cue", "spend", r"uitgegeven|uitgeven|uitgaven|besteed\w*|gespendeerd"),
+        ("cue", "pay", r"betaal(?:d|t)? (?:ik )?(?:aan|voor)"),
+        ("cue", "charged_item", r"kaarten|kaart|rekeningen|rekening|abonnement(?:en)?"),
+        ("cue", "products", r"welke (?:rekeningen|rekening|kaarten|kaart|producten)|mijn (?:rekeningen|kaarten|producten)"),
+        ("cue", "fee", r"kosten|tarieven|tarief"),
+        ("category", "Grocery", r"boodschappen|supermarkt(?:en)?|voeding"),
+        ("category", "Transport", r"vervoer|transport|treinen|trein|bus|tram|metro"),
+        ("category", "Restaurant", r"restaurants?"),
+        ("category", "ATM", r"geldopnames?|geldautomaat|bancontact"),
+        ("period", "last_week", r"vorige week|afgelopen week"),
+        ("period", "week", r"deze week"),
+        ("period", "last_month", r"vorige maand|afgelopen maand"),
+        ("period", "month", r"deze maand"),
+        ("period", "year", r"dit jaar"),
+    ],
+}
+
+# (intent, required cues) in priority order. Paying "for" a card or an
+# account asks about its fees; paying for anything else (groceries, ...) is
+# spending.
+INTENTS = [
+    ("balance", {"balance"}),
+    ("fees", {"pay", "charged_item"}),
+    ("fees", {"pay", "products"}),
+    ("spending", {"quantity", "spend"}),
+    ("spending", {"quantity", "pay"}),
+    ("products", {"products"}),
+    ("fees", {"fee"}),
+]
+
+
+def fold(text):
+    """Lower-cases and strips accents, so "dépensé" matches "depense"."""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+# --- 2. Router ---
+@dataclass
+class Route:
+    intent: str = None
+    category: str = None
+    time_period: str = None
+    cues: set = field(default_factory=set)
+
+
+class IntentRouter:
+    def __init__(self, patterns=PATTERNS, intents=INTENTS):
+        self.intents = intents
+        self._compiled = {}
+        # group name -> (slot, value), shared by all compiled languages
+        self._groups = {}
+        for language, entries in patterns.items():
+            self._compiled[language] = self._compile(language, entries)
+        self._compiled[None] = self._compile(
+            "any", [entry for entries in patterns.values() for entry in entries]
+        )
+
+    def _compile(self, name, entries):
+        alternatives = []
+        for i, (slot, value, pattern) in enumerate(entries):
+            group = f"{name}_{i}"
+            self._groups[group] = (slot, value)
+            # Each pattern is anchored on its own, so "atm" never matches
+            # inside "treatment".
+            alternatives.append(f"(?P<{group}>\\b(?:{pattern})\\b)")
+        return re.compile("|".join(alternatives))
+
+    def route(self, question, language=None):
+        """
+        Extracts intent, category and time period in one pass. Unknown
+        languages (or None) are matched against every language's patterns.
+        """
+        compiled = self._compiled.get(language, self._compiled[None])
+        route = Route()
+        for match in compiled.finditer(fold(question)):
+            slot, value = self._groups[match.lastgroup]
+            if slot == "cue":
+                route.cues.add(value)
+            elif slot == "category" and route.category is None:
+                route.category = value
+            elif slot == "period" and route.time_period is None:
+                route.time_period = value
+        for intent, required in self.intents:
+            if required <= route.cues:
+                route.intent = intent
+                break
+        return route
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Batched, resumable and incremental knowledge base ingestion.
+
+`sync_knowledge_base` streams the chunk manifests in fixed-size batches,
+embeds batches in parallel and upserts them into the Chroma collection.
+Every chunk carries a `content_hash` in its metadata, so a new manifest
+release only re-embeds chunks whose content changed; chunks that vanished
+from the manifests are deleted.
+
+Progress is checkpointed after every batch by appending the batch's IDs to
+a JSONL checkpoint. If a build is interrupted, the next run with the same
+manifests skips the batches that already landed.
+Several collections can share one `db_path` (e.g. one per language) by
+giving each its own state and checkpoint files (`state_names`).
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+# --- 1. Configuration ---
+BATCH_SIZE = 128
+MAX_WORKERS = 4
+CHECKPOINT_NAME = "ingest_checkpoint.jsonl"
+STATE_NAME = "kb_state.json"
+
+
+# --- 2. Manifest Streaming ---
+def manifest_key(language_configs):
+    """Cheap fingerprint (path, size, mtime) of all manifest files."""
+    parts = []
+    for lang_code, manifest_path in sorted(language_configs.items()):
+        stat = os.stat(manifest_path)
+        parts.append(f"{lang_code}:{manifest_path}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def _content_hash(document, metadata):
+    payload = json.dumps([document, metadata], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def iter_chunks(language_configs, read_manifest=pd.read_excel):
+    """
+    Yields (unique_id, document, metadata) for every chunk of every manifest.
+    Duplicate IDs keep their first occurrence and are reported at the end.
+    """
+    seen = set()
+    duplicates = []
+    for lang_code, manifest_path in language_configs.items():
+        print(f"--- Processing language: {lang_code.upper()} ---")
+        # Ensure you have 'openpyxl' installed (via requirements.txt)
+        df_manifest = read_manifest(manifest_path)
+        for row in df_manifest.itertuples(index=False):
+            unique_id = f"{lang_code}_{row.chunk_id}"
+            if unique_id in seen:
+                duplicates.append(unique_id)
+                continue
+            seen.add(unique_id)
+
+            chunk_metadata = {
+                "language": lang_code,
+                "chunk_name": row.chunk_name,
+                "chunk_url": row.chunk_url,
+                "chunk_number": row.chunk_number,
+            }
+            chunk_metadata["content_hash"] = _content_hash(
+                row.chunk_content, chunk_metadata
+            )
+            yield unique_id, row.chunk_content, chunk_metadata
+
+    if duplicates:
+        print(
+            f"⚠️ Skipped {len(duplicates)} duplicated chunk IDs (kept the first occurrence)."
+        )
+        print("Here are the first 10 problematic IDs:", duplicates[:10])
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# --- 3. Checkpoint & State Files ---
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_json(path, data):
+    # A unique temporary name, so concurrent writers never share one.
+    with tempfile.NamedTemporaryFile(
+        "w",
+        dir=os.path.dirname(path) or ".",
+        prefix=os.path.basename(path),
+        suffix=".tmp",
+        delete=False,
+    ) as f:
+        json.dump(data, f)
+    os.replace(f.name, path)
+
+
+def _read_checkpoint(path, key):
+    """IDs already upserted by an interrupted build from manifests `key`."""
+    done = set()
+    try:
+        with open(path) as f:
+            header = json.loads(f.readline() or "null")
+            if not header or header.get("manifest_key") != key:
+                return done
+            for line in f:
+                try:
+                    done.update(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # a batch line cut short by the interruption
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    return done
+
+
+def _start_checkpoint(path, key, resumed):
+    """Opens the checkpoint for appending; a new build starts it over."""
+    if resumed:
+        return open(path, "a")
+    f = open(path, "w")
+    f.write(json.dumps({"manifest_key": key}) + "\n")
+    f.flush()
+    return f
+
+
+def state_names(name):
+    """(state, checkpoint) file names for collection `name`, e.g. a language code."""
+    return f"kb_state_{name}.json", f"ingest_checkpoint_{name}.jsonl"
+
+
+def knowledge_base_is_current(collection, language_configs, db_path, state_name=STATE_NAME):
+    """True if the collection was fully synced from the current manifests."""
+    if collection.count() == 0:
+        return False
+    state = _read_json(os.path.join(db_path, state_name))
+    if state is None:
+        return False
+    try:
+        return state.get("manifest_key") == manifest_key(language_configs)
+    except FileNotFoundError:
+        # Manifests are only needed to (re)build; an existing DB is still usable.
+        return True
+
+
+def synced_version(db_path, state_name=STATE_NAME):
+    """Manifest key of the last completed sync, or None."""
+    state = _read_json(os.path.join(db_path, state_name))
+    return state.get("manifest_key") if state else None
+
+
+def _existing_hashes(collection, page_size=1000):
+    hashes = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            hashes[chunk_id] = (metadata or {}).get("content_hash")
+        if len(page["ids"]) < page_size:
+            return hashes
+        offset += page_size
+
+
+# --- 4. Sync ---
+def sync_knowledge_base(
+    collection,
+    language_configs,
+    db_path,
+    embedding_function=None,
+    batch_size=BATCH_SIZE,
+    max_workers=MAX_WORKERS,
+    state_name=STATE_NAME,
+    checkpoint_name=CHECKPOINT_NAME,
+):
+    """
+    Brings `collection` in line with the manifests and returns a stats dict.
+    `embedding_function` must match the collection's; when None, documents
+    are passed to Chroma to embed (still batched, but not in parallel).
+    """
+    key = manifest_key(language_configs)
+    checkpoint_path = os.path.join(db_path, checkpoint_name)
+    done = _read_checkpoint(checkpoint_path, key)
+    if done:
+        print(f"Resuming interrupted build: {len(done)} chunks already ingested.")
+
+    existing = _existing_hashes(collection)
+    stats = {"seen": 0, "unchanged": 0, "upserted": 0, "deleted": 0}
+    manifest_ids = set()
+
+    def pending_chunks():
+        for chunk_id, document, metadata in iter_chunks(language_configs):
+            manifest_ids.add(chunk_id)
+            stats["seen"] += 1
+            if chunk_id in done or existing.get(chunk_id) == metadata["content_hash"]:
+                stats["unchanged"] += 1
+                continue
+            yield chunk_id, document, metadata
+
+    def embed(batch):
+        documents = [document for _, document, _ in batch]
+        embeddings = embedding_function(documents) if embedding_function else None
+        return batch, embeddings
+
+    checkpoint = _start_checkpoint(checkpoint_path, key, resumed=bool(done))
+    with checkpoint, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Keep at most `max_workers` batches in flight so memory stays bounded
+        # no matter how large the manifests are.
+        in_flight = []
+        batches = _batched(pending_chunks(), batch_size)
+        while True:
+            while len(in_flight) < max_workers:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                in_flight.append(pool.submit(embed, batch))
+            if not in_flight:
+                break
+
+            batch, embeddings = in_flight.pop(0).result()
+            ids = [chunk_id for chunk_id, _, _ in batch]
+            collection.upsert(
+                ids=ids,
+                documents=[document for _, document, _ in batch],
+                metadatas=[metadata for _, _, metadata in batch],
+                embeddings=embeddings,
+            )
+            stats["upserted"] += len(batch)
+            # One line per batch: appending keeps checkpointing linear in the build.
+            checkpoint.write(json.dumps(ids) + "\n")
+            checkpoint.flush()
+            print(f"Upserted {stats['upserted']} chunks...")
+
+    stale_ids = [chunk_id for chunk_id in existing if chunk_id not in manifest_ids]
+    for batch in _batched(stale_ids, batch_size):
+        collection.delete(ids=batch)
+        stats["deleted"] += len(batch)
+
+    _write_json(os.path.join(db_path, state_name), {"manifest_key": key})
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    print(
+        f"✅ Knowledge base synced: {stats['seen']} chunks, {stats['upserted']} upserted, "
+        f"{stats['unchanged']} unchanged, {stats['deleted']} deleted."
+    )
+    return stats
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Thin client for the Leo backend service (see leo_service.py).
+
+Has the same call shapes as the engine methods the UI uses
+(`get_bot_response`, `get_bot_response_stream`, `prefetch_context`), so
+app.py talks to the service instead of running the pipeline in-process.
+A busy or unreachable service yields the usual fallback messages rather
+than an exception, just like a failed Gemini call.
+"""
+
+import json
+import os
+
+import httpx
+
+from gemini_client import OVERLOADED_MESSAGE, TECHNICAL_ISSUE_MESSAGE
+
+SERVICE_URL = os.environ.get("LEO_SERVICE_URL", "http://127.0.0.1:8765")
+# Connecting should be instant; an answer may take as long as the LLM does.
+TIMEOUT = httpx.Timeout(120.0, connect=5.0)
+
+
+class LeoServiceClient:
+    def __init__(self, base_url=SERVICE_URL, timeout=TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self._http = httpx.Client(base_url=self.base_url, timeout=timeout)
+
+    @staticmethod
+    def _request(user_question, customer_id, language):
+        return {"question": user_question, "customer_id": int(customer_id), "language": language}
+
+    def get_bot_response(self, user_question, customer_id, language="en"):
+        try:
+            response = self._http.post(
+                "/answer", json=self._request(user_question, customer_id, language)
+            )
+        except httpx.HTTPError as e:
+            print(f"Leo service unreachable at {self.base_url}: {e}")
+            return TECHNICAL_ISSUE_MESSAGE
+        if response.status_code == 503:
+            return OVERLOADED_MESSAGE
+        if response.status_code != 200:
+            print(f"Leo service error {response.status_code}: {response.text}")
+            return TECHNICAL_ISSUE_MESSAGE
+        return response.json()["answer"]
+
+    def get_bot_response_stream(self, user_question, customer_id, language="en"):
+        """Yields answer chunks as the service streams them."""
+        try:
+            with self._http.stream(
+                "POST",
+                "/answer/stream",
+                json=self._request(user_question, customer_id, language),
+            ) as response:
+                if response.status_code == 503:
+                    yield OVERLOADED_MESSAGE
+                    return
+                if response.status_code != 200:
+                    print(f"Leo service error {response.status_code}")
+                    yield TECHNICAL_ISSUE_MESSAGE
+                    return
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    message = json.loads(line)
+                    if "chunk" in message:
+                        yield message["chunk"]
+                    elif "error" in message:
+                        print(f"Leo service error: {message['error']}")
+                        yield TECHNICAL_ISSUE_MESSAGE
+                        return
+        except httpx.HTTPError as e:
+            print(f"Leo service unreachable at {self.base_url}: {e}")
+            yield TECHNICAL_ISSUE_MESSAGE
+
+    def prefetch_context(self, partial_question, customer_id, language="en"):
+        try:
+            self._http.post(
+                "/prefetch",
+                json=self._request(partial_question, customer_id, language),
+                timeout=1.0,
+            )
+        except httpx.HTTPError:
+            # Only a head start; the final question retrieves regardless.
+            pass
+
+    def start_session(self, customer_id):
+        try:
+            self._http.post("/session", json={"customer_id": int(customer_id)}, timeout=1.0)
+        except httpx.HTTPError:
+            # Only a head start; the first turn materializes the context anyway.
+            pass
+
+    def customer_ids(self):
+        response = self._http.get("/customers")
+        response.raise_for_status()
+        return response.json()["customer_ids"]
+
+    def health(self):
+        response = self._http.get("/health")
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self._http.close()
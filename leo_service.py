@@ -0,0 +1,619 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Standalone backend service: Leo's pipeline behind a local HTTP API.
+
+    python leo_service.py --workers 4 --port 8765
+
+The service process loads (or rebuilds) the data snapshot once and exports
+it as a memory-mapped column store (see data_snapshot.py). Each worker
+process opens that store read-only, so the tables sit in the page cache once
+however many workers run; indexes and the Gemini client are per worker. The
+service also syncs the knowledge base (vector DB and BM25 indexes) before
+starting the workers, which then only open it read-only. A worker answers
+several requests at a time on threads, since most of a turn is spent
+waiting for the LLM.
+
+Requests are routed to a worker by customer, so one customer's turns (and
+the prefetches started while they speak) share that worker's caches. At
+most `max_pending` requests are queued or running; beyond that, requests
+are rejected at once with 503 and a Retry-After header rather than piling
+up behind a slow LLM.
+
+New transactions and product changes dropped into `ingest_dir`
+(LEO_INGEST_DIR, see ingest.py) are picked up by the service and applied in
+every worker; a worker that (re)starts first replays the files already
+processed. `GET /metrics` merges the service's counters and latencies with
+those of every worker's engine (retrieval, LLM, cache hits, ...).
+
+Each worker keeps its customers' rendered context (profile, products,
+transaction history; see customer_context.py). `POST /session` builds it
+when a conversation starts, and with `prewarm_contexts` every worker builds
+it for up to that many of its customers right after warm-up.
+
+    POST /answer         {"question", "customer_id", "language"} -> {"answer"}
+    POST /answer/stream  same body; NDJSON lines {"chunk": ...}, then {"done": true}
+    POST /prefetch       same body; fire-and-forget, dropped when busy
+    POST /session        {"customer_id"}; materializes the customer's context
+    GET  /customers      {"customer_ids": [...]}
+    GET  /health         worker readiness (with warm-up errors) and queue depth
+    GET  /metrics        latency histograms and counters of the service and its workers
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telemetry import HISTOGRAM_SAMPLES, Tracer
+
+# --- 1. Configuration ---
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = int(os.environ.get("LEO_SERVICE_PORT", "8765"))
+WORKERS = max(1, (os.cpu_count() or 2) // 2)
+THREADS_PER_WORKER = 4
+# Requests queued or running across all workers before new ones get a 503.
+MAX_PENDING = 64
+# Seconds to wait for the next chunk of an answer before giving up on it.
+RESPONSE_TIMEOUT = 120.0
+# Seconds /metrics waits for busy workers; late ones are left out.
+METRICS_TIMEOUT = 5.0
+COLUMN_STORE_DIR = "./data_cache/columns"
+# Customer contexts each worker materializes in the background after warm-up.
+PREWARM_CONTEXTS = int(os.environ.get("LEO_PREWARM_CONTEXTS", "0"))
+# Drop folder the service ingests from and fans out to every worker.
+INGEST_DIR = os.environ.get("LEO_INGEST_DIR")
+
+
+class ServiceBusy(Exception):
+    """Raised when `max_pending` requests are already queued or running."""
+
+
+# --- 2. Worker Processes ---
+def _worker_main(
+    worker_id, engine_options, jobs, results, threads, prewarm_ids=(), ingest_dir=None
+):
+    """Entry point of a worker process: one engine, `threads` request loops."""
+    from ing_assistant import LeoAssistant
+
+    engine = LeoAssistant(**engine_options)
+    # Still serve after a failure: failed components are retried on first
+    # use, and the errors are reported in the service's health.
+    warmup_errors = {}
+    for name in engine.COMPONENTS:
+        try:
+            engine.warm([name])
+        except Exception as e:
+            warmup_errors[name] = f"{type(e).__name__}: {e}"
+            print(f"Worker {worker_id}: warm-up of '{name}' failed: {e}")
+    if ingest_dir:
+        from ingest import Ingestor
+
+        # The column store holds the snapshot only: catch up on what the
+        # service ingested before this worker (re)started.
+        try:
+            Ingestor(engine, drop_folder=ingest_dir).replay_processed()
+        except Exception as e:
+            print(f"Worker {worker_id}: replaying processed ingest files failed: {e}")
+    results.put((None, "ready", (worker_id, warmup_errors)))
+    if prewarm_ids:
+        engine.warm_contexts_in_background(prewarm_ids)
+
+    def serve():
+        while True:
+            job = jobs.get()
+            if job is None:
+                jobs.put(None)  # let the other loops of this worker see it
+                return
+            job_id, kind, request = job
+            try:
+                if kind == "session":
+                    engine.start_session(request["customer_id"])
+                    continue
+                if kind == "metrics":
+                    results.put((job_id, "chunk", engine.tracer.export()))
+                    continue
+                if kind == "ingest":
+                    results.put((job_id, "chunk", engine.ingest(**request)))
+                    continue
+                args = (
+                    request["question"],
+                    request["customer_id"],
+                    request.get("language", "en"),
+                )
+                if kind == "prefetch":
+                    engine.prefetch_context(*args)
+                    continue
+                if kind == "stream":
+                    for chunk in engine.get_bot_response_stream(*args):
+                        results.put((job_id, "chunk", chunk))
+                else:
+                    results.put((job_id, "chunk", engine.get_bot_response(*args)))
+                results.put((job_id, "done", None))
+            except Exception as e:
+                if job_id is not None:
+                    results.put((job_id, "error", f"{type(e).__name__}: {e}"))
+
+    loops = [
+        threading.Thread(target=serve, name=f"leo-worker-{worker_id}-{i}")
+        for i in range(threads)
+    ]
+    for loop in loops:
+        loop.start()
+    for loop in loops:
+        loop.join()
+
+
+# --- 3. Service ---
+class LeoService:
+    def __init__(
+        self,
+        workers=WORKERS,
+        threads_per_worker=THREADS_PER_WORKER,
+        max_pending=MAX_PENDING,
+        column_store=COLUMN_STORE_DIR,
+        response_timeout=RESPONSE_TIMEOUT,
+        engine_options=None,
+        prewarm_contexts=PREWARM_CONTEXTS,
+        ingest_dir=INGEST_DIR,
+    ):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.max_pending = max_pending
+        self.column_store = column_store
+        self.response_timeout = response_timeout
+        self.prewarm_contexts = prewarm_contexts
+        self.ingest_dir = ingest_dir
+        # Extra LeoAssistant arguments for every worker (must be picklable).
+        self.engine_options = dict(engine_options or {})
+        self.tracer = Tracer()
+        self.customer_ids = []
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._jobs = [None] * workers
+        self._processes = [None] * workers
+        self._ready = [False] * workers
+        # Components each worker failed to warm up, by name.
+        self._warmup_errors = [{} for _ in range(workers)]
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._streams = {}
+        # job_id -> perf_counter() at submit, for requests not yet released
+        self._started = {}
+        self._streams_lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+        self._stopping = threading.Event()
+        self._ingestor = None
+
+    # --- Lifecycle ---
+    def start(self):
+        from data_snapshot import load_snapshot, write_column_store
+        from ing_assistant import DATA_FILES, WRANGLE_VERSION, wrangle_tables
+
+        tables = load_snapshot(
+            self.engine_options.get("data_files", DATA_FILES),
+            wrangle_tables,
+            version=WRANGLE_VERSION,
+        )
+        write_column_store(tables, self.column_store)
+        self.customer_ids = [int(i) for i in tables["customers"]["customer_id"]]
+        del tables
+        print(f"Exported memory-mapped tables to {self.column_store}.")
+        self._sync_knowledge_base()
+
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        threading.Thread(target=self._dispatch, name="leo-dispatch", daemon=True).start()
+        threading.Thread(target=self._supervise, name="leo-supervise", daemon=True).start()
+        if self.ingest_dir:
+            from ingest import Ingestor
+
+            # Workers replay processed files themselves when they start.
+            self._ingestor = Ingestor(self, drop_folder=self.ingest_dir).start()
+        return self
+
+    def _sync_knowledge_base(self):
+        """
+        Brings the vector DB and BM25 indexes up to date once, before any
+        worker opens them, so workers never sync or write them concurrently.
+        """
+        from ing_assistant import LeoAssistant
+
+        engine = LeoAssistant(**self.engine_options)
+        try:
+            engine.warm(["vector_db"])
+        except Exception as e:
+            # Workers still open whatever collections exist.
+            print(f"Knowledge base sync failed: {e}")
+
+    def _spawn(self, worker_id):
+        # A fresh queue each time: a worker killed inside `jobs.get()` leaves
+        # its queue's read lock held forever. Jobs still queued are lost.
+        self._jobs[worker_id] = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                worker_id,
+                {
+                    **self.engine_options,
+                    "column_store": self.column_store,
+                    "sync_knowledge_base": False,
+                },
+                self._jobs[worker_id],
+                self._results,
+                self.threads_per_worker,
+                [
+                    customer_id
+                    for customer_id in self.customer_ids
+                    if self._worker_for({"customer_id": customer_id}) == worker_id
+                ][: self.prewarm_contexts],
+                self.ingest_dir,
+            ),
+            name=f"leo-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._ready[worker_id] = False
+        self._warmup_errors[worker_id] = {}
+        self._processes[worker_id] = process
+
+    def _supervise(self):
+        """Restarts crashed workers. Requests they were running or had queued time out."""
+        while not self._stopping.wait(1.0):
+            for worker_id, process in enumerate(self._processes):
+                if not process.is_alive():
+                    print(f"Worker {worker_id} exited ({process.exitcode}); restarting it.")
+                    self.tracer.count("service_worker_restarts")
+                    self._spawn(worker_id)
+
+    def stop(self):
+        self._stopping.set()
+        if self._ingestor is not None:
+            self._ingestor.stop()
+        for jobs in self._jobs:
+            jobs.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def _dispatch(self):
+        """Routes worker results to the request waiting for them."""
+        while True:
+            job_id, kind, payload = self._results.get()
+            if kind == "ready":
+                worker_id, warmup_errors = payload
+                self._warmup_errors[worker_id] = warmup_errors
+                self._ready[worker_id] = True
+                continue
+            with self._streams_lock:
+                stream = self._streams.get(job_id)
+            if stream is not None:
+                stream.put((kind, payload))
+
+    # --- Requests ---
+    def _worker_for(self, request):
+        return int(request["customer_id"]) % self.workers
+
+    def submit(self, request, stream=False):
+        """
+        Queues a question and returns its job id. Raises `ServiceBusy` right
+        away when the queue is full. Read the answer with `results(job_id)`
+        and always `release(job_id)` afterwards, however the request ended.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.tracer.count("service_rejected")
+            raise ServiceBusy(f"{self.max_pending} requests already pending")
+        job_id = next(self._job_ids)
+        with self._streams_lock:
+            self._streams[job_id] = queue.Queue()
+            self._started[job_id] = time.perf_counter()
+            self._pending += 1
+        self.tracer.count("service_requests")
+        self._jobs[self._worker_for(request)].put(
+            (job_id, "stream" if stream else "answer", request)
+        )
+        return job_id
+
+    def results(self, job_id):
+        """Yields the answer chunks of a submitted job as the worker produces them."""
+        with self._streams_lock:
+            results = self._streams[job_id]
+            started = self._started[job_id]
+        first = True
+        while True:
+            try:
+                kind, payload = results.get(timeout=self.response_timeout)
+            except queue.Empty:
+                self.tracer.count("service_timeouts")
+                raise TimeoutError(f"No response within {self.response_timeout}s")
+            if first:
+                first = False
+                self.tracer.observe(
+                    "service_first_chunk_ms", (time.perf_counter() - started) * 1000
+                )
+            if kind == "chunk":
+                yield payload
+            elif kind == "error":
+                self.tracer.count("service_errors")
+                raise RuntimeError(payload)
+            else:
+                return
+
+    def release(self, job_id):
+        """Frees a submitted job's slot; anything its worker still sends is dropped."""
+        with self._streams_lock:
+            if self._streams.pop(job_id, None) is None:
+                return
+            started = self._started.pop(job_id)
+            self._pending -= 1
+        self._slots.release()
+        self.tracer.observe("service_request_ms", (time.perf_counter() - started) * 1000)
+
+    def answer(self, request):
+        job_id = self.submit(request)
+        try:
+            return "".join(self.results(job_id))
+        finally:
+            self.release(job_id)
+
+    def prefetch(self, request):
+        """Starts retrieval for an interim transcript unless the service is busy."""
+        if self._pending >= self.max_pending // 2:
+            self.tracer.count("service_prefetch_dropped")
+            return False
+        self._jobs[self._worker_for(request)].put((None, "prefetch", request))
+        return True
+
+    def start_session(self, request):
+        """Materializes the customer's context on their worker, ahead of the first turn."""
+        self._jobs[self._worker_for(request)].put((None, "session", request))
+
+    def health(self):
+        """
+        Ready once every worker is alive and warmed up without errors; a
+        worker whose warm-up failed lists the failed components.
+        """
+        alive = [process is not None and process.is_alive() for process in self._processes]
+        workers = [
+            {
+                "pid": process.pid,
+                "alive": is_alive,
+                "ready": ready and not errors,
+                "warmup_errors": errors,
+            }
+            for process, is_alive, ready, errors in zip(
+                self._processes, alive, self._ready, self._warmup_errors
+            )
+        ]
+        return {
+            "ready": all(worker["alive"] and worker["ready"] for worker in workers),
+            "workers": workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+        }
+
+    def _broadcast(self, kind, request, timeout, workers=None):
+        """
+        Runs a job on every worker (or only on `workers`); returns
+        {worker_id: result} for those that answered within `timeout` seconds.
+        """
+        replies = {}
+        with self._streams_lock:
+            for worker_id in sorted(workers) if workers is not None else range(self.workers):
+                job_id = next(self._job_ids)
+                replies[worker_id] = (job_id, queue.Queue())
+                self._streams[job_id] = replies[worker_id][1]
+        for worker_id, (job_id, _) in replies.items():
+            self._jobs[worker_id].put((job_id, kind, request))
+        deadline = time.monotonic() + timeout
+        answers = {}
+        try:
+            for worker_id, (_, results) in replies.items():
+                try:
+                    remaining = max(0.0, deadline - time.monotonic())
+                    status, payload = results.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+                if status == "error":
+                    raise RuntimeError(f"Worker {worker_id}: {payload}")
+                answers[worker_id] = payload
+        finally:
+            with self._streams_lock:
+                for job_id, _ in replies.values():
+                    del self._streams[job_id]
+        return answers
+
+    def ingest(self, transactions=None, products=None):
+        """
+        Applies new rows in every worker (see `LeoAssistant.ingest`) and
+        returns the first worker's stats. A worker that misses the deadline
+        (busy, or restarted and lost the job) gets the batch again until it
+        applied it; re-applying is harmless, since known transactions are
+        skipped. Raises when a worker fails to apply it.
+
+        When the service stops first, the batch counts as done: it is then
+        acknowledged into `processed/`, which every worker replays on start.
+        """
+        batch = {"transactions": transactions, "products": products}
+        stats = {}
+        lagging = set(range(self.workers))
+        while lagging:
+            applied = self._broadcast("ingest", batch, self.response_timeout, lagging)
+            stats.update(applied)
+            lagging -= applied.keys()
+            if lagging and self._stopping.is_set():
+                break
+            if lagging:
+                print(f"Workers {sorted(lagging)} did not apply the batch yet; resending.")
+                self.tracer.count("service_ingest_resends")
+        return stats[min(stats)] if stats else {}
+
+    def metrics(self):
+        """
+        The service's own latencies and counters merged with every worker
+        engine's. Counters add up across workers; a worker too busy to
+        answer within METRICS_TIMEOUT is left out (see `workers_reporting`).
+        """
+        merged = Tracer(max_samples=HISTOGRAM_SAMPLES * (self.workers + 1))
+        merged.merge(self.tracer.export())
+        exported = self._broadcast("metrics", None, METRICS_TIMEOUT)
+        for worker_metrics in exported.values():
+            merged.merge(worker_metrics)
+        snapshot = merged.snapshot()
+        snapshot["workers_reporting"] = len(exported)
+        return snapshot
+
+
+# --- 4. HTTP API ---
+def serve(service, port=SERVICE_PORT, host=SERVICE_HOST):
+    """Serves `service` over HTTP on a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.1 for chunked streaming responses.
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, body):
+            data = (json.dumps(body) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            sources = {
+                "customers": lambda: {"customer_ids": service.customer_ids},
+                "health": service.health,
+                "metrics": service.metrics,
+            }
+            source = sources.get(self.path.strip("/").split("?")[0])
+            if source is None:
+                self._send_json(404, {"error": "not found"})
+                return
+            self._send_json(200, source())
+
+        def do_POST(self):
+            path = self.path.strip("/").split("?")[0]
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                request["customer_id"] = int(request["customer_id"])
+                if path != "session":
+                    request["question"] = str(request["question"])
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {"error": f"bad request: {e}"})
+                return
+
+            if path == "session":
+                service.start_session(request)
+                self._send_json(202, {"accepted": True})
+                return
+            if path == "prefetch":
+                self._send_json(202, {"accepted": service.prefetch(request)})
+                return
+            if path not in ("answer", "answer/stream"):
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                job_id = service.submit(request, stream=path == "answer/stream")
+            except ServiceBusy as e:
+                self._send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+                return
+            # Released however the response ends, even if the caller goes
+            # away before the first chunk.
+            try:
+                if path == "answer":
+                    self._send_answer(job_id)
+                else:
+                    self._stream_answer(job_id)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                service.release(job_id)
+
+        def _send_answer(self, job_id):
+            try:
+                answer = "".join(service.results(job_id))
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {"answer": answer})
+
+        def _stream_answer(self, job_id):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for chunk in service.results(job_id):
+                    self._write_chunk({"chunk": chunk})
+                self._write_chunk({"done": True})
+            except (BrokenPipeError, ConnectionResetError):
+                raise
+            except Exception as e:
+                self._write_chunk({"error": str(e)})
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="leo-service", daemon=True).start()
+    print(f"Leo service listening on http://{host}:{server.server_address[1]}/")
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--threads", type=int, default=THREADS_PER_WORKER)
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING)
+    parser.add_argument(
+        "--prewarm-contexts",
+        type=int,
+        default=PREWARM_CONTEXTS,
+        help="customer contexts each worker builds after warm-up",
+    )
+    parser.add_argument(
+        "--ingest-dir",
+        default=INGEST_DIR,
+        help="drop folder of new transactions and product changes",
+    )
+    args = parser.parse_args(argv)
+
+    service = LeoService(
+        workers=args.workers,
+        threads_per_worker=args.threads,
+        max_pending=args.max_pending,
+        prewarm_contexts=args.prewarm_contexts,
+        ingest_dir=args.ingest_dir,
+    ).start()
+    server = serve(service, args.port, args.host)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Shutting down...")
+    finally:
+        server.shutdown()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Per-language BM25 index over the knowledge base chunks.
+
+Dense search alone often misses exact product names and fee terms ("Visa
+Gold", "Zoomit"). `BM25Index` scores those lexically; the retriever fuses
+both rankings with `reciprocal_rank_fusion`, so a small top-k is enough and
+the prompt stays short.
+
+Per-posting BM25 impacts are precomputed at build time, so a query is just
+a scatter-add of the postings of its terms. Indexes are pickled next to
+the Chroma DB as `bm25_<language>.pkl`, tagged with the knowledge base
+version they were built from.
+"""
+
+import os
+import pickle
+import re
+import tempfile
+import unicodedata
+from collections import Counter, defaultdict
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lower-cased, accent-folded word tokens ("Frais" and "frais" match)."""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN.findall(text)
+
+
+class BM25Index:
+    def __init__(self, ids, documents, k1=1.5, b=0.75):
+        self.ids = list(ids)
+        self.documents = list(documents)
+
+        term_docs = defaultdict(list)
+        term_freqs = defaultdict(list)
+        lengths = np.empty(len(self.documents), dtype=np.float32)
+        for doc_idx, document in enumerate(self.documents):
+            counts = Counter(tokenize(document))
+            lengths[doc_idx] = sum(counts.values())
+            for term, tf in counts.items():
+                term_docs[term].append(doc_idx)
+                term_freqs[term].append(tf)
+
+        n_docs = len(self.documents)
+        avg_length = float(lengths.mean()) if n_docs else 0.0
+        norm = k1 * (1 - b + b * lengths / avg_length) if avg_length else lengths
+
+        # term -> (doc indices, precomputed BM25 impact per posting)
+        self.postings = {}
+        for term, docs in term_docs.items():
+            docs = np.asarray(docs, dtype=np.int32)
+            tf = np.asarray(term_freqs[term], dtype=np.float32)
+            idf = np.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            self.postings[term] = (docs, (idf * tf * (k1 + 1) / (tf + norm[docs])).astype(np.float32))
+
+    def search(self, query, k):
+        """Returns up to k (id, document, score) tuples, best first."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                np.add.at(scores, posting[0], posting[1])
+        matched = np.flatnonzero(scores)
+        if matched.size == 0:
+            return []
+        top = matched[np.argsort(-scores[matched], kind="stable")[:k]]
+        return [(self.ids[i], self.documents[i], float(scores[i])) for i in top]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuses several ranked ID lists; returns IDs by descending RRF score."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+# --- Build / Persist ---
+def _index_path(db_path, language):
+    return os.path.join(db_path, f"bm25_{language}.pkl")
+
+
+def build_lexical_indexes(collection, db_path, version, page_size=1000, save=True):
+    """
+    Builds one BM25 index per language from the collection's chunks and,
+    with `save`, pickles each next to the Chroma DB.
+    """
+    by_language = defaultdict(lambda: ([], []))
+    offset = 0
+    while True:
+        page = collection.get(
+            include=["documents", "metadatas"], limit=page_size, offset=offset
+        )
+        for chunk_id, document, metadata in zip(
+            page["ids"], page["documents"], page["metadatas"]
+        ):
+            ids, documents = by_language[(metadata or {}).get("language")]
+            ids.append(chunk_id)
+            documents.append(document)
+        if len(page["ids"]) < page_size:
+            break
+        offset += page_size
+
+    indexes = {}
+    for language, (ids, documents) in by_language.items():
+        if language is None:
+            continue
+        indexes[language] = BM25Index(ids, documents)
+        if not save:
+            continue
+        path = _index_path(db_path, language)
+        # A unique temporary name, so concurrent builders never share one.
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=db_path, prefix=os.path.basename(path), suffix=".tmp", delete=False
+        ) as f:
+            pickle.dump({"version": version, "index": indexes[language]}, f)
+        os.replace(f.name, path)
+    print(f"✅ Built lexical indexes for: {', '.join(sorted(indexes))}")
+    return indexes
+
+
+def load_lexical_indexes(db_path, languages, version):
+    """Loads saved indexes; returns None if any is missing or from another version."""
+    indexes = {}
+    for language in languages:
+        try:
+            with open(_index_path(db_path, language), "rb") as f:
+                saved = pickle.load(f)
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+            return None
+        if saved.get("version") != version:
+            return None
+        indexes[language] = saved["index"]
+    return indexes
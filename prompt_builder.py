@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Token-budgeted assembly of MASTER_PROMPT.
+
+Without a budget, a long-tenured customer's whole transaction history was
+rendered into the prompt. `build_master_prompt` fills the template within a
+fixed token budget instead:
+
+- the template, question and pre-computed result are always included;
+- the profile and product table are capped at `max_personal_tokens` (the
+  profile comes first, so it is the product list that gets cut);
+- public context is capped at `max_public_tokens`;
+- transactions get what is left: the most relevant (description matches a
+  question word) and most recent rows are listed, and everything else is
+  summarized into monthly debit/credit aggregates. With too little left
+  for any row, only the aggregates (or nothing) are included. A `TransactionHistory`
+  pre-renders the rows and totals once, so repeated prompts for the same
+  customer only select from them.
+
+Token counts use a ~4 characters per token estimate, which is close enough
+for budgeting and needs no tokenizer dependency.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from table_layout import amount_cents, amount_euros
+
+# --- 1. Configuration ---
+PROMPT_TOKEN_BUDGET = 3000
+MAX_PUBLIC_TOKENS = 1200
+MAX_PERSONAL_TOKENS = 600
+# Share of the transaction budget reserved for the older-history summary.
+SUMMARY_SHARE = 0.25
+# Lower bound on one rendered transaction row, used to cap candidate rows.
+MIN_TOKENS_PER_ROW = 8
+TRANSACTION_COLUMNS = ["date", "description", "amount", "currency"]
+
+_WORD = re.compile(r"\w{3,}")
+_TRUNCATED = "\n[...]"
+
+
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cuts text to at most `max_tokens`, preferring a line boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    room = max_tokens * 4 - len(_TRUNCATED)
+    if room <= 0:
+        return ""
+    cut = text[:room]
+    newline = cut.rfind("\n")
+    if newline > len(cut) // 2:
+        cut = cut[:newline]
+    return cut.rstrip() + _TRUNCATED
+
+
+# --- 2. Transactions Section ---
+def _relevance_mask(transactions, question):
+    words = {word for word in _WORD.findall(question.lower())}
+    if not words:
+        return None
+    pattern = "|".join(re.escape(word) for word in sorted(words))
+    descriptions = transactions["description"]
+    if isinstance(descriptions.dtype, pd.CategoricalDtype):
+        # Match the few distinct descriptions, then look rows up by code.
+        matches = descriptions.cat.categories.astype(str).str.contains(
+            pattern, case=False, regex=True
+        )
+        codes = descriptions.cat.codes.to_numpy()
+        return np.append(np.asarray(matches, dtype=bool), False)[codes]
+    return descriptions.astype(str).str.contains(
+        pattern, case=False, regex=True
+    ).to_numpy()
+
+
+def _format_rows(transactions):
+    """Header and one line per row, columns right-aligned like `DataFrame.to_string`."""
+    cells = {
+        "date": transactions["date"].dt.strftime("%Y-%m-%d").fillna("NaT"),
+        "description": transactions["description"].astype(str),
+        "amount": pd.Series(
+            np.char.mod("%.2f", amount_euros(transactions).to_numpy(dtype=np.float64)),
+            index=transactions.index,
+            dtype=object,
+        ),
+        "currency": transactions["currency"].astype(str),
+    }
+    header = []
+    lines = None
+    for column in TRANSACTION_COLUMNS:
+        values = cells[column]
+        width = max(len(column), int(values.str.len().max()) if len(values) else 0)
+        header.append(column.rjust(width))
+        values = values.str.rjust(width)
+        lines = values if lines is None else lines + " " + values
+    return " ".join(header), lines.to_numpy(dtype=object)
+
+
+class TransactionHistory:
+    """
+    A customer's transactions (sorted newest first), prepared once for many
+    prompts: every row is pre-rendered and the monthly debit/credit totals
+    are pre-aggregated. `render` then only picks lines and subtracts the
+    listed rows from the totals, so building one per customer data version
+    and reusing it (see customer_context.py) keeps pandas out of each turn.
+    """
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+        self.header, self.lines = _format_rows(transactions)
+        self._line_tokens = np.array(
+            [estimate_tokens(line) for line in self.lines], dtype=np.int64
+        )
+
+        months = transactions["date"].dt.strftime("%Y-%m").fillna("unknown date")
+        self.months, self._month_codes = np.unique(
+            months.to_numpy(dtype=object).astype(str), return_inverse=True
+        )
+        self._is_debit = (transactions["transaction_type"] == "Debit").to_numpy(dtype=bool)
+        cents = amount_cents(transactions).to_numpy(dtype=np.int64)
+        self._debit_cents = np.where(self._is_debit, cents, 0)
+        self._credit_cents = np.where(self._is_debit, 0, cents)
+        self._totals = self._month_totals(np.arange(len(transactions)))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def _month_totals(self, positions):
+        """(debit_cents, credit_cents, n_debit, n_credit) per month for `positions`."""
+        codes = self._month_codes[positions]
+        size = len(self.months)
+        return np.stack(
+            [
+                np.bincount(codes, weights=self._debit_cents[positions], minlength=size),
+                np.bincount(codes, weights=self._credit_cents[positions], minlength=size),
+                np.bincount(codes, weights=self._is_debit[positions], minlength=size),
+                np.bincount(codes, weights=~self._is_debit[positions], minlength=size),
+            ]
+        ).round().astype(np.int64)
+
+    def _summarize(self, listed, max_tokens):
+        """
+        Monthly aggregates of the rows not `listed`, newest month first,
+        within the budget ("" when not even the heading fits).
+        """
+        debit, credit, n_debit, n_credit = self._totals - self._month_totals(listed)
+        lines = [f"Older history summary ({len(self) - len(listed)} transactions not listed):"]
+        used = estimate_tokens(lines[0])
+        if used > max_tokens:
+            return ""
+        omitted = "- (earlier months omitted)"
+        months = [
+            month
+            for month in range(len(self.months) - 1, -1, -1)
+            if n_debit[month] or n_credit[month]
+        ]
+        for i, month in enumerate(months):
+            line = (
+                f"- {self.months[month]}: {n_debit[month]} debits totalling "
+                f"€{debit[month] / 100:.2f}, {n_credit[month]} credits totalling "
+                f"€{credit[month] / 100:.2f}"
+            )
+            # Leave room for the "omitted" note unless this is the last month.
+            reserve = 0 if i == len(months) - 1 else estimate_tokens(omitted) + 1
+            if used + estimate_tokens(line) + 1 + reserve > max_tokens:
+                if used + estimate_tokens(omitted) + 1 <= max_tokens:
+                    lines.append(omitted)
+                break
+            used += estimate_tokens(line) + 1
+            lines.append(line)
+        return "\n".join(lines)
+
+    def render(self, question, max_tokens):
+        """
+        Renders the history within `max_tokens`: relevant and recent rows
+        listed, the rest summarized. When not even one row fits, only the
+        monthly aggregates are returned.
+        """
+        if not len(self):
+            return truncate_to_tokens("No recent transactions.", max_tokens)
+        if max_tokens < MIN_TOKENS_PER_ROW * 4:
+            return self._summarize(np.empty(0, dtype=np.intp), max_tokens)
+
+        list_budget = int(max_tokens * (1 - SUMMARY_SHARE))
+        max_rows = max(1, list_budget // MIN_TOKENS_PER_ROW)
+
+        # Relevant rows first (up to half the rows), then fill with the most recent.
+        relevant = np.empty(0, dtype=np.intp)
+        mask = _relevance_mask(self.transactions, question)
+        if mask is not None:
+            relevant = np.flatnonzero(mask)[: max_rows // 2]
+        fill = max_rows - len(relevant)
+        recent = np.arange(min(len(self), fill + len(relevant)))
+        recent = recent[~np.isin(recent, relevant)][:fill]
+        chosen = np.sort(np.concatenate([relevant, recent]))
+
+        # Keep lines (header first) while they fit, but always at least one row.
+        used = np.cumsum(
+            np.concatenate([[estimate_tokens(self.header)], self._line_tokens[chosen]]) + 1
+        )
+        over = np.flatnonzero((used > list_budget) & (np.arange(len(used)) > 1))
+        kept = int(over[0]) if len(over) else len(used)
+        listed = chosen[: kept - 1]
+        text = "\n".join([self.header, *self.lines[listed]])
+        if estimate_tokens(text) > max_tokens:
+            return self._summarize(np.empty(0, dtype=np.intp), max_tokens)
+
+        if len(listed) < len(self):
+            summary = self._summarize(listed, max_tokens - estimate_tokens(text))
+            if summary:
+                text += "\n\n" + summary
+        return text
+
+
+def render_transactions(transactions, question, max_tokens):
+    """
+    Renders a customer's transactions (a DataFrame sorted newest first, or a
+    prepared `TransactionHistory`) within `max_tokens`.
+    """
+    if not isinstance(transactions, TransactionHistory):
+        transactions = TransactionHistory(transactions)
+    return transactions.render(question, max_tokens)
+
+
+# --- 3. Prompt Assembly ---
+@dataclass
+class PromptBuild:
+    prompt: str
+    token_counts: dict = field(default_factory=dict)
+
+    @property
+    def total_tokens(self):
+        return self.token_counts.get("total", 0)
+
+
+def build_master_prompt(
+    template,
+    question,
+    public_context,
+    personal_context,
+    pre_computed_result="",
+    transactions=None,
+    token_budget=PROMPT_TOKEN_BUDGET,
+    max_public_tokens=MAX_PUBLIC_TOKENS,
+    max_personal_tokens=MAX_PERSONAL_TOKENS,
+):
+    """
+    Fills `template` within `token_budget`. `personal_context` is the profile
+    and products text; `transactions` (newest first, or a `TransactionHistory`)
+    is rendered into the remaining budget, or omitted when None.
+    """
+    fixed_tokens = (
+        estimate_tokens(template)
+        + estimate_tokens(question)
+        + estimate_tokens(pre_computed_result)
+    )
+    remaining = max(0, token_budget - fixed_tokens)
+
+    personal_context = truncate_to_tokens(
+        personal_context, min(max_personal_tokens, remaining)
+    )
+    remaining -= estimate_tokens(personal_context)
+
+    public_context = truncate_to_tokens(public_context, min(max_public_tokens, remaining))
+    remaining -= estimate_tokens(public_context)
+
+    transactions_text = ""
+    if transactions is not None:
+        heading = "\nRecent Transactions:\n"
+        rendered = render_transactions(
+            transactions, question, remaining - estimate_tokens(heading)
+        )
+        if rendered:
+            transactions_text = heading + rendered
+
+    personal_section = personal_context + transactions_text
+    prompt = template.format(
+        public_context=public_context,
+        personal_context=personal_section,
+        pre_computed_result=pre_computed_result,
+        question=question,
+    )
+    token_counts = {
+        "template": estimate_tokens(template),
+        "public_context": estimate_tokens(public_context),
+        "personal_context": estimate_tokens(personal_context),
+        "transactions": estimate_tokens(transactions_text),
+        "pre_computed_result": estimate_tokens(pre_computed_result),
+        "question": estimate_tokens(question),
+        "total": estimate_tokens(prompt),
+    }
+    return PromptBuild(prompt=prompt, token_counts=token_counts)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Two-tier semantic cache in front of the vector DB.
+
+Voice users ask the same few dozen questions in near-identical wording, so
+`retrieve_public_context` checks this cache before querying Chroma:
+
+1. Exact tier: the normalized question text (lower-cased, punctuation and
+   extra whitespace stripped) within a scope such as the language.
+2. Semantic tier: the nearest cached query embedding in the same scope, if
+   its cosine similarity is above `similarity_threshold`.
+
+Entries are evicted least-recently-used beyond `max_entries` and expire
+after `ttl_seconds`. Call `invalidate()` whenever the collection is rebuilt.
+`stats()` reports hit counters so the threshold can be tuned against answer
+quality.
+"""
+
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    text = _PUNCTUATION.sub(" ", question.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticCache:
+    def __init__(self, max_entries=512, ttl_seconds=3600, similarity_threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.generation = 0
+        # (scope, normalized question) -> (value, unit embedding or None, stored_at)
+        self._entries = OrderedDict()
+        # scope -> (keys, matrix of unit embeddings); rebuilt lazily when dirty
+        self._matrices = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    # --- Internal helpers ---
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def _drop(self, key):
+        del self._entries[key]
+        self._matrices.pop(key[0], None)
+
+    def _matrix(self, scope, now):
+        cached = self._matrices.get(scope)
+        if cached is not None:
+            return cached
+        keys, vectors = [], []
+        for key, (_, embedding, stored_at) in self._entries.items():
+            if key[0] == scope and embedding is not None and not self._expired(stored_at, now):
+                keys.append(key)
+                vectors.append(embedding)
+        matrix = np.vstack(vectors) if vectors else None
+        self._matrices[scope] = (keys, matrix)
+        return keys, matrix
+
+    # --- Lookups ---
+    def get_exact(self, scope, question, count_miss=True):
+        """
+        Exact-tier lookup. Pass `count_miss=False` when a `get_similar`
+        lookup follows a miss, so that one counts it instead.
+        """
+        key = (scope, normalize_question(question))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[2], now):
+                self._drop(key)
+                self._counters["expired"] += 1
+                entry = None
+            if entry is None:
+                if count_miss:
+                    self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["exact_hits"] += 1
+            return entry[0]
+
+    def get_similar(self, scope, embedding):
+        now = time.monotonic()
+        query = _unit(embedding)
+        with self._lock:
+            while True:
+                keys, matrix = self._matrix(scope, now)
+                if matrix is None:
+                    self._counters["misses"] += 1
+                    return None
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                key = keys[best]
+                if scores[best] < self.similarity_threshold or key not in self._entries:
+                    self._counters["misses"] += 1
+                    return None
+                if not self._expired(self._entries[key][2], now):
+                    break
+                # The scope matrix predates the expiry: evict and look again.
+                self._drop(key)
+                self._counters["expired"] += 1
+            self._entries.move_to_end(key)
+            self._counters["semantic_hits"] += 1
+            return self._entries[key][0]
+
+    # --- Updates ---
+    def put(self, scope, question, value, embedding=None):
+        key = (scope, normalize_question(question))
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (
+                value,
+                _unit(embedding) if embedding is not None else None,
+                time.monotonic(),
+            )
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def invalidate(self):
+        """Drops every entry; call after the knowledge base changes."""
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            self.generation += 1
+            self._counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._entries)
+        hits = counters.get("exact_hits", 0) + counters.get("semantic_hits", 0)
+        lookups = hits + counters.get("misses", 0)
+        counters["size"] = size
+        counters["hit_rate"] = hits / lookups if lookups else 0.0
+        return counters
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Streaming speech-to-text for the voice UI.
+
+Instead of recording a fixed window and then sending the whole buffer to a
+batch `recognize` call, audio is pushed to the recognizer in small frames
+while the user is still speaking:
+
+- `MicrophoneStream` yields 100 ms int16 frames from the microphone and
+  stops on end-of-utterance (energy-based voice activity detection) or
+  when the recognizer signals the end of the utterance.
+- `GoogleStreamingRecognizer` wraps Google's `streaming_recognize` with
+  interim results; `FakeRecognizer` replays a scripted transcript so the
+  pipeline can be tested without credentials or audio hardware.
+- `transcribe_stream` drives both and hands interim transcripts to a
+  callback (e.g. to start routing/retrieval before the user finishes).
+"""
+
+import queue
+import threading
+
+import numpy as np
+
+# --- 1. Configuration ---
+SAMPLE_RATE = 16000
+CHANNELS = 1
+FRAME_MS = 100
+MAX_DURATION = 15  # seconds; hard cap on one utterance
+# Voice activity detection (RMS of int16 samples)
+SPEECH_RMS_THRESHOLD = 500
+END_SILENCE_MS = 800
+NO_SPEECH_TIMEOUT_MS = 5000
+
+
+# --- 2. Voice Activity Detection ---
+class EnergyVAD:
+    """
+    Tracks speech/silence from frame energy. `update()` returns True once
+    speech was heard and then followed by `end_silence_ms` of silence, or
+    when nothing was said within `no_speech_timeout_ms`.
+    """
+
+    def __init__(
+        self,
+        threshold=SPEECH_RMS_THRESHOLD,
+        frame_ms=FRAME_MS,
+        end_silence_ms=END_SILENCE_MS,
+        no_speech_timeout_ms=NO_SPEECH_TIMEOUT_MS,
+    ):
+        self.threshold = threshold
+        self.frame_ms = frame_ms
+        self.end_silence_ms = end_silence_ms
+        self.no_speech_timeout_ms = no_speech_timeout_ms
+        self.speech_started = False
+        self._silence_ms = 0
+        self._elapsed_ms = 0
+
+    def update(self, frame):
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        rms = float(np.sqrt(np.mean(samples**2))) if samples.size else 0.0
+        self._elapsed_ms += self.frame_ms
+
+        if rms >= self.threshold:
+            self.speech_started = True
+            self._silence_ms = 0
+            return False
+        if not self.speech_started:
+            return self._elapsed_ms >= self.no_speech_timeout_ms
+        self._silence_ms += self.frame_ms
+        return self._silence_ms >= self.end_silence_ms
+
+
+# --- 3. Audio Sources ---
+class MicrophoneStream:
+    """Pushes microphone audio out in `FRAME_MS` chunks as it is recorded."""
+
+    def __init__(
+        self,
+        sample_rate=SAMPLE_RATE,
+        channels=CHANNELS,
+        frame_ms=FRAME_MS,
+        max_duration=MAX_DURATION,
+        vad=None,
+    ):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_ms = frame_ms
+        self.max_frames = int(max_duration * 1000 / frame_ms)
+        self.vad = vad or EnergyVAD(frame_ms=frame_ms)
+        self._frames = queue.Queue()
+        self._stopped = threading.Event()
+        self._stream = None
+
+    def __enter__(self):
+        # Imported here so tests with FakeRecognizer need no audio device.
+        import sounddevice as sd
+
+        self._stream = sd.RawInputStream(
+            samplerate=self.sample_rate,
+            channels=self.channels,
+            dtype="int16",
+            blocksize=int(self.sample_rate * self.frame_ms / 1000),
+            callback=self._on_audio,
+        )
+        self._stream.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def _on_audio(self, data, frames, time_info, status):
+        self._frames.put(bytes(data))
+
+    def stop(self):
+        """Ends the frame generator (e.g. on the recognizer's end-of-utterance)."""
+        self._stopped.set()
+        self._frames.put(None)
+
+    def frames(self):
+        for _ in range(self.max_frames):
+            frame = self._frames.get()
+            if frame is None or self._stopped.is_set():
+                return
+            yield frame
+            if self.vad.update(frame):
+                return
+
+
+# --- 4. Recognizers ---
+class GoogleStreamingRecognizer:
+    """Google Cloud streaming recognition with interim results."""
+
+    def __init__(self, speech_client, sample_rate=SAMPLE_RATE):
+        self.speech_client = speech_client
+        self.sample_rate = sample_rate
+
+    def streaming_recognize(self, frames, language_code, on_end_of_utterance=None):
+        """Yields (transcript, is_final) pairs while `frames` are consumed."""
+        from google.cloud import speech
+
+        config = speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=self.sample_rate,
+                language_code=language_code,
+            ),
+            interim_results=True,
+            single_utterance=True,
+        )
+        requests = (
+            speech.StreamingRecognizeRequest(audio_content=frame) for frame in frames
+        )
+        end_event = (
+            speech.StreamingRecognizeResponse.SpeechEventType.END_OF_SINGLE_UTTERANCE
+        )
+        for response in self.speech_client.streaming_recognize(config, requests):
+            if response.speech_event_type == end_event and on_end_of_utterance:
+                on_end_of_utterance()
+            for result in response.results:
+                if result.alternatives:
+                    yield result.alternatives[0].transcript, result.is_final
+
+
+class FakeRecognizer:
+    """
+    Local stand-in for tests: reveals one more word of `transcript` as an
+    interim result every `frames_per_word` frames, then emits it as final
+    once the frames run out.
+    """
+
+    def __init__(self, transcript, frames_per_word=3):
+        self.words = transcript.split()
+        self.frames_per_word = frames_per_word
+
+    def streaming_recognize(self, frames, language_code, on_end_of_utterance=None):
+        count = 0
+        shown = 0
+        for _ in frames:
+            count += 1
+            revealed = min(len(self.words), count // self.frames_per_word)
+            if revealed > shown:
+                shown = revealed
+                yield " ".join(self.words[:shown]), False
+        if on_end_of_utterance:
+            on_end_of_utterance()
+        yield " ".join(self.words), True
+
+
+def synthetic_frames(n_speech, n_silence, frame_ms=FRAME_MS, sample_rate=SAMPLE_RATE):
+    """Loud frames followed by silent ones, for exercising the VAD in tests."""
+    samples = int(sample_rate * frame_ms / 1000)
+    loud = (np.ones(samples) * 3000).astype(np.int16).tobytes()
+    quiet = np.zeros(samples, dtype=np.int16).tobytes()
+    return [loud] * n_speech + [quiet] * n_silence
+
+
+# --- 5. Driver ---
+class InterimPrefetcher:
+    """
+    Calls `callback(transcript)` for interim transcripts that grew by at
+    least `min_new_words`, so routing/retrieval can start early without
+    firing on every partial result.
+    """
+
+    def __init__(self, callback, min_new_words=2):
+        self.callback = callback
+        self.min_new_words = min_new_words
+        self._last_words = 0
+
+    def __call__(self, transcript):
+        words = len(transcript.split())
+        if words - self._last_words >= self.min_new_words:
+            self._last_words = words
+            self.callback(transcript)
+
+
+def transcribe_stream(
+    frames, recognizer, language_code="en-US", on_interim=None, on_end_of_utterance=None
+):
+    """
+    Streams `frames` to `recognizer` and returns the final transcript
+    ("" if nothing was recognized). `on_interim` receives interim text.
+    """
+    finals = []
+    last_interim = ""
+    for transcript, is_final in recognizer.streaming_recognize(
+        frames, language_code, on_end_of_utterance=on_end_of_utterance
+    ):
+        if is_final:
+            finals.append(transcript.strip())
+        else:
+            last_interim = transcript
+            if on_interim:
+                on_interim(transcript)
+    return " ".join(finals).strip() or last_interim.strip()
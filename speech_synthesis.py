@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Sentence-level incremental text-to-speech with a synthesized-audio cache.
+
+Sending the whole answer in one `synthesize_speech` request meant playback
+could only start once the audio for every sentence existed. Here the
+answer is split into sentences that are synthesized concurrently and
+yielded in order, so the first sentence can play while the rest are still
+being produced.
+
+Audio is cached per (sentence, language, voice) in a byte-bounded LRU.
+Recurring phrases - the fixed escalation and "can't find that information"
+sentences in MASTER_PROMPT - can be synthesized ahead of time with
+`prewarm`, so canned responses cost no TTS round trip at all.
+
+Audio is LINEAR16 WAV so sentences can be played back-to-back on the local
+output device (the same machine that records the microphone) and joined
+into a single clip for the chat history.
+"""
+
+import io
+import queue
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+# --- 1. Configuration ---
+VOICE_NAME_MAP = {
+    "en-US": "en-US-Wavenet-F",
+    "fr-FR": "fr-FR-Wavenet-B",
+    "nl-BE": "nl-BE-Wavenet-A",
+}
+DEFAULT_VOICE = "en-US-Wavenet-F"
+AUDIO_SAMPLE_RATE = 24000
+AUDIO_CACHE_BYTES = 32 * 1024 * 1024
+MAX_WORKERS = 4
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+_MARKDOWN = re.compile(r"[*_`#]+")
+# Fragments shorter than this are merged into the previous sentence.
+MIN_SENTENCE_CHARS = 20
+
+
+def split_sentences(text):
+    """Splits an answer into speakable sentences (markdown stripped)."""
+    sentences = []
+    for part in _SENTENCE_END.split(_MARKDOWN.sub("", text)):
+        part = " ".join(part.split())
+        if not part:
+            continue
+        if sentences and len(part) < MIN_SENTENCE_CHARS:
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def canned_phrases(prompt_template):
+    """
+    The fixed responses a prompt template instructs the LLM to use, i.e.
+    quoted text introduced by a colon (`respond with: "..."`).
+    """
+    return re.findall(r':\s*"([^"]+)"', prompt_template)
+
+
+def join_wav(parts):
+    """Concatenates WAV clips into one WAV clip."""
+    arrays = []
+    sample_rate = AUDIO_SAMPLE_RATE
+    for part in parts:
+        data, sample_rate = sf.read(io.BytesIO(part), dtype="int16")
+        arrays.append(data)
+    with io.BytesIO() as out:
+        sf.write(out, np.concatenate(arrays), sample_rate, format="WAV")
+        return out.getvalue()
+
+
+# --- 2. Audio Cache ---
+class AudioCache:
+    """LRU of synthesized clips, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes=AUDIO_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return audio
+
+    def put(self, key, audio):
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size_bytes -= len(self._entries.pop(key))
+            self._entries[key] = audio
+            self.size_bytes += len(audio)
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+
+
+# --- 3. Synthesizer ---
+class SentenceSynthesizer:
+    def __init__(self, tts_client, cache=None, max_workers=MAX_WORKERS):
+        self.tts_client = tts_client
+        self.cache = cache or AudioCache()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+
+    def synthesize(self, sentence, language_code="en-US"):
+        """One sentence to WAV bytes, served from the cache when possible."""
+        from google.cloud import texttospeech
+
+        voice_name = VOICE_NAME_MAP.get(language_code, DEFAULT_VOICE)
+        key = (sentence, language_code, voice_name)
+        audio = self.cache.get(key)
+        if audio is not None:
+            return audio
+
+        response = self.tts_client.synthesize_speech(
+            input=texttospeech.SynthesisInput(text=sentence),
+            voice=texttospeech.VoiceSelectionParams(
+                language_code=language_code, name=voice_name
+            ),
+            audio_config=texttospeech.AudioConfig(
+                audio_encoding=texttospeech.AudioEncoding.LINEAR16,
+                sample_rate_hertz=AUDIO_SAMPLE_RATE,
+            ),
+        )
+        self.cache.put(key, response.audio_content)
+        return response.audio_content
+
+    def stream(self, text, language_code="en-US"):
+        """
+        Yields (sentence, audio) in order. All sentences are submitted at
+        once, so later ones are synthesized while earlier ones play.
+        """
+        sentences = split_sentences(text)
+        futures = [
+            self._pool.submit(self.synthesize, sentence, language_code)
+            for sentence in sentences
+        ]
+        for sentence, future in zip(sentences, futures):
+            yield sentence, future.result()
+
+    def prewarm(self, phrases, language_codes=("en-US",)):
+        """Synthesizes recurring phrases in the background, sentence by sentence."""
+        for language_code in language_codes:
+            for phrase in phrases:
+                for sentence in split_sentences(phrase):
+                    self._pool.submit(self.synthesize, sentence, language_code)
+
+
+# --- 4. Local Playback ---
+class AudioPlayer:
+    """Plays queued WAV clips back-to-back on a background thread."""
+
+    def __init__(self):
+        self._clips = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="tts-player", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # Imported here so synthesis can be used without an audio device.
+        import sounddevice as sd
+
+        while True:
+            clip = self._clips.get()
+            try:
+                data, sample_rate = sf.read(io.BytesIO(clip), dtype="int16")
+                sd.play(data, sample_rate)
+                sd.wait()
+            except Exception as e:
+                print(f"Audio playback error: {e}")
+
+    def enqueue(self, clip):
+        self._clips.put(clip)
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Precomputed daily spending rollups.
+
+"How much did I spend" is the most common question, and it used to filter
+the raw transaction table and run `str.contains` over every description on
+each call. `SpendingRollup` does that work once:
+
+- every distinct description is assigned an integer code (so a category
+  filter is matched against the few distinct descriptions, never against
+  the raw rows), and
+- debit amounts are summed per customer, per day, per description code into
+  compact numpy arrays, in integer cents.
+
+A spending question is then a binary search for the date range plus a
+prefix-sum difference (or a masked sum over that customer's rollup rows
+when a category is given).
+
+Debits of a product that is not known yet (e.g. a transaction ingested
+before its product) are held back and folded in by `adopt_orphans` once
+the product's owner is known, so the rollups match a full rebuild.
+"""
+
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from table_layout import amount_cents
+
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def _to_day(value):
+    """Days since the epoch for a Timestamp/date-like value."""
+    return int((np.datetime64(pd.Timestamp(value).date(), "D") - _EPOCH).astype(int))
+
+
+def period_bounds(time_period, today):
+    """
+    Returns the (start_date, end_date) window for a named period, relative to
+    `today`. Unknown periods fall back to the current month.
+    """
+    today = pd.Timestamp(today).normalize()
+    if time_period == "last_month":
+        first_of_current_month = today.replace(day=1)
+        start_date = (first_of_current_month - timedelta(days=1)).replace(day=1)
+    elif time_period == "week":
+        start_date = today - timedelta(days=today.dayofweek + 1)
+    elif time_period == "last_week":
+        week_start = today - timedelta(days=today.dayofweek + 1)
+        return week_start - timedelta(days=7), week_start - timedelta(days=1)
+    elif time_period == "year":
+        start_date = today.replace(month=1, day=1)
+    else:
+        start_date = today.replace(day=1)
+    return start_date, today
+
+
+class _CustomerRollup:
+    """One customer's (day, description code) -> debit cents rows, sorted by day."""
+
+    __slots__ = ("days", "codes", "cents", "prefix")
+
+    def __init__(self, days, codes, cents):
+        order = np.lexsort((codes, days))
+        days, codes, cents = days[order], codes[order], cents[order]
+
+        # Collapse duplicate (day, code) pairs produced by appends.
+        if len(days) > 1:
+            new_group = np.empty(len(days), dtype=bool)
+            new_group[0] = True
+            new_group[1:] = (days[1:] != days[:-1]) | (codes[1:] != codes[:-1])
+            starts = np.flatnonzero(new_group)
+            cents = np.add.reduceat(cents, starts)
+            days, codes = days[starts], codes[starts]
+
+        self.days = days
+        self.codes = codes
+        self.cents = cents
+        self.prefix = np.concatenate([[0], np.cumsum(cents)])
+
+    def range_sum(self, start_day, end_day, code_mask=None):
+        lo = np.searchsorted(self.days, start_day, side="left")
+        hi = np.searchsorted(self.days, end_day, side="right")
+        if code_mask is None:
+            return int(self.prefix[hi] - self.prefix[lo])
+        return int(self.cents[lo:hi][code_mask[self.codes[lo:hi]]].sum())
+
+
+class SpendingRollup:
+    def __init__(self, products_df, transactions_df):
+        self._description_codes = {}
+        self._descriptions = []
+        self._category_masks = {}
+        self._customers = {}
+        # Debit rows whose product has no known owner yet.
+        self._orphans = []
+        owners = dict(
+            zip(
+                products_df["product_id"].astype(int),
+                products_df["customer_id"].astype(int),
+            )
+        )
+        self.add_transactions(transactions_df, owners.get)
+
+    # --- Building / Appending ---
+    def _encode(self, descriptions):
+        codes = np.empty(len(descriptions), dtype=np.int32)
+        for i, description in enumerate(descriptions):
+            code = self._description_codes.get(description)
+            if code is None:
+                code = len(self._descriptions)
+                self._description_codes[description] = code
+                self._descriptions.append(description)
+            codes[i] = code
+        return codes
+
+    def add_transactions(self, rows, owner_of):
+        """
+        Folds new transaction rows into the rollups. `owner_of(product_id)`
+        returns the owning customer_id (or None for unknown products).
+        """
+        debits = rows[(rows["transaction_type"] == "Debit") & rows["date"].notna()]
+        if debits.empty:
+            return
+
+        customers = debits["product_id"].map(
+            lambda product_id: owner_of(int(product_id))
+        )
+        owned = customers.notna()
+        if not owned.all():
+            self._orphans.append(debits[~owned])
+            debits = debits[owned]
+            if debits.empty:
+                return
+        customers = customers[owned].astype(np.int64).to_numpy()
+
+        n_known = len(self._descriptions)
+        descriptions = debits["description"]
+        if isinstance(descriptions.dtype, pd.CategoricalDtype) and descriptions.notna().all():
+            # Already dictionary-encoded: map the categories, not every row.
+            uniques = descriptions.cat.categories.astype(str).to_numpy()
+            inverse = descriptions.cat.codes.to_numpy()
+        else:
+            uniques, inverse = np.unique(
+                descriptions.astype(str).to_numpy(), return_inverse=True
+            )
+        codes = self._encode(uniques)[inverse]
+        if len(self._descriptions) != n_known:
+            self._category_masks.clear()
+
+        days = (
+            (debits["date"].to_numpy("datetime64[D]") - _EPOCH).astype(np.int32)
+        )
+        cents = amount_cents(debits).to_numpy(dtype=np.int64)
+
+        groups = pd.Series(np.arange(len(customers))).groupby(customers).indices
+        for customer_id, idx in groups.items():
+            customer_id = int(customer_id)
+            existing = self._customers.get(customer_id)
+            if existing is not None:
+                idx_days = np.concatenate([existing.days, days[idx]])
+                idx_codes = np.concatenate([existing.codes, codes[idx]])
+                idx_cents = np.concatenate([existing.cents, cents[idx]])
+            else:
+                idx_days, idx_codes, idx_cents = days[idx], codes[idx], cents[idx]
+            self._customers[customer_id] = _CustomerRollup(
+                idx_days, idx_codes, idx_cents
+            )
+
+    def adopt_orphans(self, owner_of):
+        """
+        Folds held-back debits whose product now has an owner into the
+        rollups (call after adding products). Returns how many rows remain
+        without an owner.
+        """
+        if not self._orphans:
+            return 0
+        orphans = pd.concat(self._orphans)
+        self._orphans = []
+        self.add_transactions(orphans, owner_of)
+        return self.orphan_count
+
+    @property
+    def orphan_count(self):
+        return sum(len(rows) for rows in self._orphans)
+
+    # --- Queries ---
+    def _category_mask(self, category):
+        """Boolean mask over description codes matching `category` (case-insensitive)."""
+        key = category.lower()
+        mask = self._category_masks.get(key)
+        if mask is None:
+            mask = np.fromiter(
+                (key in description.lower() for description in self._descriptions),
+                dtype=bool,
+                count=len(self._descriptions),
+            )
+            self._category_masks[key] = mask
+        return mask
+
+    def total_cents(self, customer_id, start_date, end_date, category=None):
+        """Total debit cents for the customer between two dates, inclusive."""
+        rollup = self._customers.get(int(customer_id))
+        if rollup is None:
+            return 0
+        code_mask = self._category_mask(category) if category else None
+        return rollup.range_sum(_to_day(start_date), _to_day(end_date), code_mask)
+
+    def total(self, customer_id, start_date, end_date, category=None):
+        return self.total_cents(customer_id, start_date, end_date, category) / 100
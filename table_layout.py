@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Compact in-memory layout for the banking tables.
+
+After wrangling, repeated strings (descriptions, transaction types,
+currencies, product names, statuses) were Python-object columns and
+amounts were float64. `compact_tables` converts every table to its schema:
+
+- repeated strings become categoricals (one small dictionary plus an
+  integer code per row);
+- ID columns become fixed-width integers;
+- `amount` is replaced by exact integer `amount_cents`.
+
+Categoricals only stay categorical when concatenated frames share the same
+categories, so appends must go through `append_rows`, which widens the
+categories first. `amount_euros` gives display values for the few rows
+that end up in a prompt, and `memory_report` measures each table.
+"""
+
+import numpy as np
+import pandas as pd
+
+# --- 1. Schemas ---
+_PRODUCTS = {
+    "ints": {"product_id": "int32", "customer_id": "int32"},
+    "categories": ["product_type", "product_name", "status"],
+    "dates": ["opened_date"],
+}
+SCHEMAS = {
+    "customers": {
+        "ints": {"customer_id": "int32"},
+        "categories": ["segment_code"],
+        "dates": ["birthdate"],
+    },
+    "products": _PRODUCTS,
+    "products_closed": _PRODUCTS,
+    "transactions": {
+        "ints": {"transaction_id": "int64", "product_id": "int32"},
+        "categories": ["description", "transaction_type", "currency"],
+        "dates": ["date"],
+        "cents": {"amount": "amount_cents"},
+    },
+}
+
+
+# --- 2. Conversion ---
+def compact_table(df, schema):
+    """Returns `df` converted to `schema` (columns it lacks are left alone)."""
+    columns = {}
+    for column, dtype in schema.get("ints", {}).items():
+        if column in df:
+            columns[column] = pd.to_numeric(df[column]).astype(dtype)
+    for column in schema.get("categories", ()):
+        if column in df and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            columns[column] = df[column].astype("category")
+    for column in schema.get("dates", ()):
+        if column in df and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            columns[column] = pd.to_datetime(df[column], errors="coerce")
+    if columns:
+        df = df.assign(**columns)
+    for source, target in schema.get("cents", {}).items():
+        if source in df:
+            euros = pd.to_numeric(df[source]).to_numpy(dtype=np.float64)
+            df = df.drop(columns=source).assign(
+                **{target: np.rint(euros * 100).astype(np.int64)}
+            )
+    return df
+
+
+def compact_tables(tables):
+    return {name: compact_table(df, SCHEMAS.get(name, {})) for name, df in tables.items()}
+
+
+def append_rows(base, new_rows, schema):
+    """
+    Concatenates `new_rows` onto `base` in `base`'s layout. Categories are
+    widened on both sides first, so the result stays categorical.
+    """
+    new_rows = compact_table(new_rows, schema)
+    for column in schema.get("categories", ()):
+        if column not in base or column not in new_rows:
+            continue
+        categories = base[column].cat.categories
+        extra = pd.Index(new_rows[column].dropna().unique()).difference(categories)
+        if len(extra):
+            base = base.assign(**{column: base[column].cat.add_categories(extra)})
+            categories = base[column].cat.categories
+        new_rows = new_rows.assign(
+            **{column: pd.Categorical(new_rows[column], categories=categories)}
+        )
+    return pd.concat([base, new_rows], ignore_index=True)
+
+
+# --- 3. Amounts ---
+def amount_cents(df):
+    """Transaction amounts as int64 cents, whichever layout `df` has."""
+    if "amount_cents" in df:
+        return df["amount_cents"]
+    return pd.Series(
+        np.rint(df["amount"].to_numpy(dtype=np.float64) * 100).astype(np.int64),
+        index=df.index,
+    )
+
+
+def amount_euros(df):
+    if "amount_cents" in df:
+        return df["amount_cents"] / 100
+    return df["amount"]
+
+
+# --- 4. Memory Report ---
+def memory_report(tables):
+    """{table: {"rows", "bytes", "columns": {column: bytes}}}, deep-measured."""
+    report = {}
+    for name, df in tables.items():
+        usage = df.memory_usage(index=True, deep=True)
+        report[name] = {
+            "rows": len(df),
+            "bytes": int(usage.sum()),
+            "columns": {column: int(size) for column, size in usage.items()},
+        }
+    return report
+
+
+def format_memory_report(report):
+    lines = ["Table memory:"]
+    for name, table in report.items():
+        lines.append(
+            f"- {name}: {table['rows']} rows, {table['bytes'] / 2**20:.2f} MiB"
+        )
+    return "\n".join(lines)
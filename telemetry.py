@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Per-stage latency tracing and metrics for the request pipeline.
+
+A `Tracer` records timing spans (STT, routing, vector query, personal
+context, prompt build, LLM, TTS), counters (cache hits, LLM retries) and
+values (prompt sizes):
+
+- `tracer.trace(**attributes)` wraps one turn. Spans, counters and
+  attributes recorded inside it are attached to that turn, and the finished
+  turn is appended to a JSONL trace file when `trace_path` is set.
+- `tracer.span(name)` times a stage and feeds its latency histogram, with
+  or without an active turn.
+- `tracer.snapshot()` aggregates every histogram into count/mean/p50/p95/
+  p99/max; `serve_metrics()` exposes it as JSON on a local HTTP endpoint.
+  `export()` and `merge()` combine tracers across processes.
+
+Each tracer keeps its current turn in its own context variable, so two
+tracers (e.g. the UI's and an in-process engine's) never see each other's
+turns. Work handed to a thread pool must be submitted through
+`contextvars.copy_context().run` to be attributed to the turn that started
+it.
+"""
+
+import contextvars
+import json
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+# --- 1. Configuration ---
+# Most recent samples kept per histogram; percentiles are computed over these.
+HISTOGRAM_SAMPLES = 4096
+PERCENTILES = (50, 95, 99)
+
+
+# --- 2. Histograms ---
+class Histogram:
+    def __init__(self, max_samples=HISTOGRAM_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=max_samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self._samples.append(value)
+
+    def merge(self, count, total, samples):
+        """Folds in another histogram's totals and samples (see `Tracer.export`)."""
+        self.count += count
+        self.total += total
+        self._samples.extend(samples)
+
+    def summary(self):
+        if not self._samples:
+            return {"count": 0}
+        samples = np.fromiter(self._samples, dtype=np.float64)
+        summary = {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3),
+            "max": round(float(samples.max()), 3),
+        }
+        for percentile, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES)):
+            summary[f"p{percentile}"] = round(float(value), 3)
+        return summary
+
+
+# --- 3. Turns ---
+class Trace:
+    """One request turn: its spans, counters and attributes."""
+
+    def __init__(self, attributes):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.attributes = dict(attributes)
+        self.spans = []
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def add_span(self, name, started, seconds, error=None):
+        span = {
+            "name": name,
+            "start_ms": round((started - self.started) * 1000, 3),
+            "duration_ms": round(seconds * 1000, 3),
+            "thread": threading.current_thread().name,
+        }
+        if error:
+            span["error"] = error
+        with self._lock:
+            self.spans.append(span)
+
+    def to_record(self, seconds):
+        with self._lock:
+            return {
+                "trace_id": self.trace_id,
+                "started_at": self.started_at,
+                "duration_ms": round(seconds * 1000, 3),
+                "attributes": dict(self.attributes),
+                "counters": dict(self.counters),
+                "spans": sorted(self.spans, key=lambda span: span["start_ms"]),
+            }
+
+
+# --- 4. Tracer ---
+class Tracer:
+    def __init__(self, trace_path=None, max_samples=HISTOGRAM_SAMPLES):
+        self.trace_path = trace_path
+        self.max_samples = max_samples
+        self._histograms = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._current = contextvars.ContextVar(f"leo_trace_{id(self):x}", default=None)
+
+    def current(self):
+        """This tracer's active turn in this context, or None."""
+        return self._current.get()
+
+    @contextmanager
+    def trace(self, **attributes):
+        """
+        Starts a turn, or joins this tracer's active one (so nested entry
+        points, e.g. get_bot_response inside a batch turn, produce one turn).
+        """
+        active = self._current.get()
+        if active is not None:
+            active.attributes.update(attributes)
+            yield active
+            return
+
+        turn = Trace(attributes)
+        token = self._current.set(turn)
+        try:
+            yield turn
+        finally:
+            try:
+                self._current.reset(token)
+            except ValueError:
+                # A streaming generator finished from another context than it
+                # started in: that context never saw the turn, so clear it.
+                self._current.set(None)
+            seconds = time.perf_counter() - turn.started
+            self.observe("turn_ms", seconds * 1000)
+            self._write(turn.to_record(seconds))
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe(f"{name}_ms", seconds * 1000)
+            turn = self._current.get()
+            if turn is not None:
+                turn.add_span(name, started, seconds, error)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+        turn = self._current.get()
+        if turn is not None:
+            with turn._lock:
+                turn.counters[name] += n
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.max_samples)
+            histogram.observe(value)
+
+    def annotate(self, **attributes):
+        """Sets attributes (e.g. prompt token counts) on the active turn."""
+        turn = self._current.get()
+        if turn is not None:
+            with turn._lock:
+                turn.attributes.update(attributes)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "histograms": {
+                    name: histogram.summary()
+                    for name, histogram in sorted(self._histograms.items())
+                },
+                "counters": dict(self._counters),
+            }
+
+    def export(self):
+        """
+        Raw histogram samples and counters, picklable, for `merge` into a
+        tracer in another process (e.g. a service collecting its workers').
+        """
+        with self._lock:
+            return {
+                "histograms": {
+                    name: (histogram.count, histogram.total, list(histogram._samples))
+                    for name, histogram in self._histograms.items()
+                },
+                "counters": dict(self._counters),
+            }
+
+    def merge(self, exported):
+        """Adds another tracer's `export()`: counters sum, histograms pool their samples."""
+        with self._lock:
+            for name, (count, total, samples) in exported["histograms"].items():
+                histogram = self._histograms.get(name)
+                if histogram is None:
+                    histogram = self._histograms[name] = Histogram(self.max_samples)
+                histogram.merge(count, total, samples)
+            self._counters.update(exported["counters"])
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def _write(self, record):
+        if not self.trace_path:
+            return
+        try:
+            with self._file_lock, open(self.trace_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        except OSError as e:
+            print(f"Could not write trace to {self.trace_path}: {e}")
+
+
+# --- 5. Metrics Endpoint ---
+def serve_metrics(sources, port, host="127.0.0.1"):
+    """
+    Serves `GET /<name>` as JSON for each `sources[name]` callable (e.g.
+    {"metrics": tracer.snapshot, "health": engine.health}) on a daemon
+    thread. Returns the server; call `shutdown()` to stop it.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            source = sources.get(self.path.strip("/").split("?")[0])
+            if source is None:
+                self.send_error(404)
+                return
+            body = json.dumps(source(), default=str).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="leo-metrics", daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/")
+    return server
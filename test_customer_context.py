@@ -0,0 +1,63 @@
+"""
+ContextCache: contexts are served only at the data version they were built
+from, are rebuilt after a bump, and are evicted least recently used first.
+
+    python -m pytest test_customer_context.py
+"""
+
+from customer_context import ContextCache, CustomerContext
+
+
+def _context(customer_id, version):
+    return CustomerContext(
+        customer_id=customer_id, version=version, profile=f"profile v{version}", history=None
+    )
+
+
+def test_context_is_served_at_its_version_only():
+    cache = ContextCache()
+    cache.put(_context(1, 3))
+
+    assert cache.get(1, 3).profile == "profile v3"
+    # A bump (new transaction, product change) makes the cached context stale...
+    assert cache.get(1, 4) is None
+    assert 1 not in cache
+    # ...and it is dropped rather than served again at the old version.
+    assert cache.get(1, 3) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["stale"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 1 / 3
+
+
+def test_put_never_replaces_a_newer_version():
+    cache = ContextCache()
+    cache.put(_context(1, 5))
+    # A build that started before the bump finishes late.
+    cache.put(_context(1, 4))
+
+    assert cache.get(1, 5).profile == "profile v5"
+    cache.put(_context(1, 6))
+    assert cache.get(1, 6).profile == "profile v6"
+
+
+def test_least_recently_used_contexts_are_evicted():
+    cache = ContextCache(max_entries=2)
+    cache.put(_context(1, 0))
+    cache.put(_context(2, 0))
+    cache.get(1, 0)
+    cache.put(_context(3, 0))
+
+    assert 2 not in cache
+    assert 1 in cache and 3 in cache
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_some_or_all_customers():
+    cache = ContextCache()
+    for customer_id in (1, 2, 3):
+        cache.put(_context(customer_id, 0))
+
+    cache.invalidate([2])
+    assert [customer_id in cache for customer_id in (1, 2, 3)] == [True, False, True]
+    cache.invalidate()
+    assert cache.stats()["size"] == 0
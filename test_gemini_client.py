@@ -0,0 +1,172 @@
+"""
+Offline checks of GeminiClient against an httpx MockTransport stub:
+retries, retry budget exhaustion, SSE streaming and malformed responses.
+
+    python -m pytest test_gemini_client.py
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from gemini_client import (
+    OVERLOADED_MESSAGE,
+    TECHNICAL_ISSUE_MESSAGE,
+    GeminiClient,
+    RetryBudget,
+)
+
+
+def _answer(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+class StubServer:
+    """Replays `responses` in order (the last one repeats) and records requests."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        response = self.responses[min(len(self.requests), len(self.responses)) - 1]
+        return response() if callable(response) else response
+
+
+@pytest.fixture
+def make_client():
+    clients = []
+
+    def make(stub, **options):
+        options.setdefault("base_delay", 0.0)
+        client = GeminiClient("test-key", transport=httpx.MockTransport(stub), **options)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def test_retries_retryable_status_then_succeeds(make_client):
+    stub = StubServer(
+        httpx.Response(503),
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, json=_answer("Hello!")),
+    )
+    client = make_client(stub)
+    call_stats = {}
+
+    assert client.generate("Hi", call_stats) == "Hello!"
+    assert len(stub.requests) == 3
+    assert call_stats == {"retries": 2, "rate_limited": 1}
+    assert "key=test-key" in str(stub.requests[0].url)
+
+
+def test_exhausted_retry_budget_stops_retrying(make_client):
+    stub = StubServer(httpx.Response(503))
+    client = make_client(stub, retry_budget=RetryBudget(ratio=0.0, min_retries=1))
+
+    assert client.generate("Hi") == OVERLOADED_MESSAGE
+    # One initial attempt plus the single retry the budget allowed.
+    assert len(stub.requests) == 2
+    assert client.generate("Hi") == OVERLOADED_MESSAGE
+    assert len(stub.requests) == 3
+    assert client.stats["failures"] == 2
+
+
+def test_non_json_response_falls_back(make_client):
+    stub = StubServer(httpx.Response(200, text="<html>proxy error</html>"))
+    client = make_client(stub)
+
+    assert client.generate("Hi") == TECHNICAL_ISSUE_MESSAGE
+    assert len(stub.requests) == 1
+
+
+def test_client_error_is_not_retried(make_client):
+    stub = StubServer(httpx.Response(400, json={"error": "bad request"}))
+    client = make_client(stub)
+
+    assert client.generate("Hi") == TECHNICAL_ISSUE_MESSAGE
+    assert len(stub.requests) == 1
+
+
+def _sse(*events):
+    body = "".join(f"data: {json.dumps(event)}\r\n\r\n" for event in events)
+    return httpx.Response(
+        200, content=body.encode("utf-8"), headers={"Content-Type": "text/event-stream"}
+    )
+
+
+def test_stream_parses_sse_events(make_client):
+    stub = StubServer(
+        httpx.Response(503),
+        lambda: _sse(_answer("Hel"), {"candidates": []}, _answer("lo "), _answer("there.")),
+    )
+    client = make_client(stub)
+
+    assert list(client.stream("Hi")) == ["Hel", "lo ", "there."]
+    assert "alt=sse" in str(stub.requests[-1].url)
+
+
+def test_stream_with_malformed_event_falls_back(make_client):
+    stub = StubServer(
+        httpx.Response(
+            200, content=b"data: {not json\n\n", headers={"Content-Type": "text/event-stream"}
+        )
+    )
+    client = make_client(stub)
+
+    assert list(client.stream("Hi")) == [TECHNICAL_ISSUE_MESSAGE]
+
+
+def test_stream_cut_short_by_malformed_event_is_flagged(make_client):
+    body = f"data: {json.dumps(_answer('Hel'))}\n\ndata: {{not json\n\n"
+    stub = StubServer(
+        httpx.Response(
+            200, content=body.encode("utf-8"), headers={"Content-Type": "text/event-stream"}
+        )
+    )
+    client = make_client(stub)
+    call_stats = {}
+
+    assert list(client.stream("Hi", call_stats)) == ["Hel"]
+    assert call_stats.get("truncated") is True
+
+
+class _BrokenStream(httpx.AsyncByteStream):
+    """An SSE body that fails after its first event."""
+
+    async def __aiter__(self):
+        yield f"data: {json.dumps(_answer('Hel'))}\n\n".encode("utf-8")
+        raise httpx.ReadError("connection reset")
+
+
+def test_stream_interrupted_mid_answer_is_flagged(make_client):
+    stub = StubServer(
+        lambda: httpx.Response(
+            200, stream=_BrokenStream(), headers={"Content-Type": "text/event-stream"}
+        )
+    )
+    client = make_client(stub)
+    call_stats = {}
+
+    assert list(client.stream("Hi", call_stats)) == ["Hel"]
+    assert call_stats.get("truncated") is True
+    assert len(stub.requests) == 1
+
+
+def test_async_api_works_from_another_loop(make_client):
+    stub = StubServer(lambda: httpx.Response(200, json=_answer("Hi!")))
+    client = make_client(stub)
+
+    async def main():
+        answer = await client.agenerate("Hi")
+        stub.responses = [lambda: _sse(_answer("a"), _answer("b"))]
+        chunks = [chunk async for chunk in client.astream("Hi")]
+        return answer, chunks
+
+    assert asyncio.run(main()) == ("Hi!", ["a", "b"])
@@ -0,0 +1,145 @@
+"""
+Incremental ingestion into a real engine built from small CSVs: duplicate
+transactions are skipped, debits that arrive before their product are
+adopted once it does, and batches that cannot be applied are dead-lettered.
+
+    python -m pytest test_ingest.py
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from ing_assistant import LeoAssistant
+from ingest import ERRORS_DIR, PROCESSED_DIR, IngestEvent, Ingestor
+
+TODAY = "2025-10-15"
+MONTH = (pd.Timestamp("2025-10-01"), pd.Timestamp(TODAY))
+
+
+def _product(product_id, customer_id, status="Active"):
+    return {
+        "product_id": product_id,
+        "customer_id": customer_id,
+        "product_name": "Current Account",
+        "status": status,
+        "opened_date": "2020-01-01",
+    }
+
+
+def _transaction(transaction_id, product_id, amount, kind="Debit", date="2025-10-10"):
+    return {
+        "transaction_id": transaction_id,
+        "product_id": product_id,
+        "date": date,
+        "amount": amount,
+        "currency": "EUR",
+        "description": "Grocery Store",
+        "transaction_type": kind,
+    }
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # The snapshot cache (./data_cache) lands in tmp_path too.
+    monkeypatch.chdir(tmp_path)
+    # wrangle_tables drops customer row 30 and transaction row 65 (notebook
+    # clean-up), so both tables are padded past those rows with customers
+    # and credits the tests never look at.
+    customers = pd.DataFrame(
+        {
+            "customer_id": range(1, 41),
+            "name": [f"Customer {i}" for i in range(1, 41)],
+            "segment_code": "ADULT",
+            "birthdate": "1990-01-01",
+        }
+    )
+    products = pd.DataFrame([_product(10, 1), _product(20, 2), _product(90, 40)])
+    transactions = pd.DataFrame(
+        [_transaction(1, 10, 12.5), _transaction(2, 20, 7.0), _transaction(3, 10, 100.0, "Credit")]
+        + [_transaction(100 + i, 90, 1.0, "Credit") for i in range(70)]
+    )
+    data_files = {}
+    for name, table in [
+        ("customers", customers),
+        ("products", products),
+        ("products_closed", products.head(0)),
+        ("transactions", transactions),
+    ]:
+        data_files[name] = str(tmp_path / f"{name}.csv")
+        table.to_csv(data_files[name], index=False)
+    return LeoAssistant(data_files=data_files, reference_date=TODAY, trace_path=None)
+
+
+def _spent(engine, customer_id):
+    return engine.spending_rollup.total(customer_id, *MONTH)
+
+
+def test_known_and_repeated_transactions_are_skipped(engine):
+    batch = pd.DataFrame(
+        [_transaction(1, 10, 12.5), _transaction(4, 10, 3.0), _transaction(4, 10, 3.0)]
+    )
+
+    assert engine.ingest(transactions=batch) == {
+        "transactions_added": 1,
+        "transactions_skipped": 2,
+    }
+    assert engine.ingest(transactions=batch)["transactions_skipped"] == 3
+    assert engine.transactions_df["transaction_id"].isin([4]).sum() == 1
+    assert _spent(engine, 1) == pytest.approx(15.5)
+
+
+def test_debits_before_their_product_are_adopted_when_it_arrives(engine):
+    engine.ingest(transactions=pd.DataFrame([_transaction(5, 30, 40.0)]))
+    assert engine.spending_rollup.orphan_count == 1
+    assert _spent(engine, 2) == pytest.approx(7.0)
+
+    stats = engine.ingest(products=pd.DataFrame([_product(30, 2)]))
+
+    assert stats == {"products_added": 1}
+    assert engine.spending_rollup.orphan_count == 0
+    assert _spent(engine, 2) == pytest.approx(47.0)
+    assert _spent(engine, 1) == pytest.approx(12.5)
+
+
+def test_product_changes_update_in_place_and_bump_the_data_version(engine):
+    version = engine.customer_index.data_version(1)
+
+    stats = engine.ingest(products=pd.DataFrame([_product(10, 1, status="Closed")]))
+
+    assert stats == {"products_updated": 1}
+    assert len(engine.products_df) == 3
+    row = engine.customer_index.product_row(10)
+    assert engine.products_df["status"].iloc[row] == "Closed"
+    assert engine.customer_index.data_version(1) > version
+
+
+def test_ingestor_acks_files_and_dead_letters_bad_events(engine, tmp_path):
+    drop = tmp_path / "ingest"
+    ingestor = Ingestor(engine, drop_folder=str(drop))
+    pd.DataFrame([_transaction(6, 20, 1.0)]).to_csv(drop / "transactions-1.csv", index=False)
+    ingestor.queue.put(IngestEvent("refunds", pd.DataFrame([{"amount": 1.0}])))
+
+    stats = ingestor.process_pending()
+
+    assert stats == {"transactions_added": 1, "transactions_skipped": 0}
+    assert os.listdir(drop / PROCESSED_DIR) == ["transactions-1.csv"]
+    assert [event.kind for event, _ in ingestor.dead_letters] == ["refunds"]
+    assert len(os.listdir(drop / ERRORS_DIR)) == 1
+    # Replaying the processed file after a restart adds nothing twice.
+    assert ingestor.replay_processed() == {"transactions_added": 0, "transactions_skipped": 1}
+
+
+def test_cached_customer_context_is_rebuilt_after_ingest(engine):
+    before = engine.customer_context(1)
+    other = engine.customer_context(2)
+    assert engine.customer_context(1) is before
+
+    engine.ingest(transactions=pd.DataFrame([_transaction(7, 10, 5.0)]))
+    after = engine.customer_context(1)
+
+    assert after.version > before.version
+    assert len(after.history) == len(before.history) + 1
+    # Only the customer whose data changed is rebuilt.
+    assert engine.customer_context(2) is other
@@ -0,0 +1,80 @@
+"""
+Routing checks per language: spending (with category and period), fee
+and product questions, and patterns that must not match inside words.
+
+    python -m pytest test_intent_router.py
+"""
+
+import pytest
+
+from intent_router import IntentRouter
+
+
+@pytest.fixture(scope="module")
+def router():
+    return IntentRouter()
+
+
+@pytest.mark.parametrize(
+    "language, question, category, time_period",
+    [
+        ("en", "How much did I spend on groceries this month?", "Grocery", "month"),
+        ("en", "How much did I pay for restaurants last week?", "Restaurant", "last_week"),
+        ("en", "What did I spend at the ATM last month?", "ATM", "last_month"),
+        ("fr", "Combien ai-je dépensé en courses ce mois-ci ?", "Grocery", "month"),
+        ("fr", "Combien ai-je payé pour le train la semaine passée ?", "Transport", "last_week"),
+        ("nl", "Hoeveel heb ik deze maand uitgegeven aan boodschappen?", "Grocery", "month"),
+        ("nl", "Hoeveel heb ik vorige maand betaald aan restaurants?", "Restaurant", "last_month"),
+    ],
+)
+def test_spending_questions(router, language, question, category, time_period):
+    route = router.route(question, language)
+
+    assert (route.intent, route.category, route.time_period) == (
+        "spending",
+        category,
+        time_period,
+    )
+
+
+@pytest.mark.parametrize(
+    "language, question",
+    [
+        ("en", "How much do I pay for my Visa Gold card?"),
+        ("en", "How much do I pay for my cards?"),
+        ("en", "What are the fees on a savings account?"),
+        ("fr", "Combien je paye pour ma carte ?"),
+        ("fr", "Quels sont les frais de retrait ?"),
+        ("nl", "Hoeveel betaal ik voor mijn kaart?"),
+        ("nl", "Hoeveel heb ik betaald aan kosten voor mijn rekening?"),
+        ("nl", "Wat zijn de kosten van een spaarrekening?"),
+    ],
+)
+def test_fee_questions(router, language, question):
+    assert router.route(question, language).intent == "fees"
+
+
+@pytest.mark.parametrize(
+    "language, question",
+    [
+        ("en", "Which cards do I have?"),
+        ("fr", "Quels comptes ai-je ?"),
+        ("nl", "Welke rekeningen heb ik?"),
+    ],
+)
+def test_product_questions(router, language, question):
+    assert router.route(question, language).intent == "products"
+
+
+def test_patterns_do_not_match_inside_words(router):
+    route = router.route("How much did I spend on treatment this month?", "en")
+
+    assert route.intent == "spending"
+    assert route.category is None
+    assert router.route("Tell me about the metronome", "en").category is None
+
+
+def test_unknown_language_matches_every_table(router):
+    route = router.route("Combien ai-je dépensé au restaurant ?", None)
+
+    assert (route.intent, route.category) == ("spending", "Restaurant")
@@ -0,0 +1,152 @@
+"""
+sync_knowledge_base against an in-memory collection: incremental syncs,
+and resuming an interrupted build from its (possibly truncated) JSONL
+checkpoint.
+
+    python -m pytest test_kb_ingest.py
+"""
+
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import kb_ingest
+
+
+class MemoryCollection:
+    """The slice of the Chroma collection API the sync uses."""
+
+    def __init__(self, fail_after=None):
+        self.rows = {}
+        self.upserts = []
+        self.fail_after = fail_after
+
+    def get(self, include, limit, offset):
+        ids = sorted(self.rows)[offset : offset + limit]
+        return {"ids": ids, "metadatas": [self.rows[i][1] for i in ids]}
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        if self.fail_after is not None and len(self.upserts) >= self.fail_after:
+            raise RuntimeError("interrupted")
+        self.upserts.append(list(ids))
+        for chunk_id, document, metadata in zip(ids, documents, metadatas):
+            self.rows[chunk_id] = (document, metadata)
+
+    def delete(self, ids):
+        for chunk_id in ids:
+            del self.rows[chunk_id]
+
+    def count(self):
+        return len(self.rows)
+
+
+def _manifest(n_chunks, changed=()):
+    return pd.DataFrame(
+        {
+            "chunk_id": range(n_chunks),
+            "chunk_name": [f"chunk {i}" for i in range(n_chunks)],
+            "chunk_url": "https://example.com",
+            "chunk_number": range(n_chunks),
+            "chunk_content": [
+                f"content {i}" + (" (new)" if i in changed else "") for i in range(n_chunks)
+            ],
+        }
+    )
+
+
+@pytest.fixture
+def kb(tmp_path, monkeypatch):
+    """Returns sync(collection, manifest) over a fake 'en' manifest file."""
+    manifest_path = tmp_path / "manifest_en.xlsx"
+    manifest_path.write_text("v1")
+    current = {}
+    iter_chunks = kb_ingest.iter_chunks
+    monkeypatch.setattr(
+        kb_ingest,
+        "iter_chunks",
+        lambda configs: iter_chunks(configs, read_manifest=lambda path: current["manifest"]),
+    )
+
+    def sync(collection, manifest, **options):
+        current["manifest"] = manifest
+        return kb_ingest.sync_knowledge_base(
+            collection,
+            {"en": str(manifest_path)},
+            str(tmp_path),
+            embedding_function=lambda documents: [[float(len(d))] for d in documents],
+            batch_size=3,
+            max_workers=2,
+            **options,
+        )
+
+    sync.path = tmp_path
+    sync.manifest_path = manifest_path
+    return sync
+
+
+def test_second_sync_only_touches_changed_and_removed_chunks(kb):
+    collection = MemoryCollection()
+    stats = kb(collection, _manifest(10))
+    assert stats == {"seen": 10, "unchanged": 0, "upserted": 10, "deleted": 0}
+    assert not os.path.exists(kb.path / kb_ingest.CHECKPOINT_NAME)
+
+    kb.manifest_path.write_text("v2")  # a new release of the manifest
+    stats = kb(collection, _manifest(8, changed={2, 5}))
+
+    assert stats == {"seen": 8, "unchanged": 6, "upserted": 2, "deleted": 2}
+    assert collection.upserts[-1] == ["en_2", "en_5"]
+    assert sorted(collection.rows) == [f"en_{i}" for i in range(8)]
+
+
+def test_interrupted_build_resumes_after_a_truncated_checkpoint_line(kb):
+    collection = MemoryCollection(fail_after=2)
+    with pytest.raises(RuntimeError):
+        kb(collection, _manifest(10))
+    checkpoint = kb.path / kb_ingest.CHECKPOINT_NAME
+    lines = checkpoint.read_text().splitlines()
+    key = kb_ingest.manifest_key({"en": str(kb.manifest_path)})
+    assert json.loads(lines[0]) == {"manifest_key": key}
+    assert [json.loads(line) for line in lines[1:]] == collection.upserts
+    # A crash in the middle of writing the next batch line.
+    with open(checkpoint, "a") as f:
+        f.write('["en_6", "en_')
+
+    # Drop the stored hashes, so only the checkpoint can tell which batches
+    # already landed.
+    for chunk_id, (document, _) in collection.rows.items():
+        collection.rows[chunk_id] = (document, {})
+    collection.fail_after = None
+    collection.upserts = []
+    stats = kb(collection, _manifest(10))
+
+    assert stats["upserted"] == 4
+    assert sorted(sum(collection.upserts, [])) == ["en_6", "en_7", "en_8", "en_9"]
+    assert collection.count() == 10
+    assert not checkpoint.exists()
+    assert kb_ingest.synced_version(str(kb.path)) is not None
+
+
+def test_checkpoint_from_other_manifests_is_ignored(kb):
+    checkpoint = kb.path / kb_ingest.CHECKPOINT_NAME
+    checkpoint.write_text(
+        json.dumps({"manifest_key": "old"}) + "\n" + json.dumps(["en_0"]) + "\n"
+    )
+    collection = MemoryCollection()
+
+    stats = kb(collection, _manifest(4))
+
+    assert stats["upserted"] == 4
+
+
+def test_knowledge_base_is_current_after_a_sync(kb):
+    collection = MemoryCollection()
+    configs = {"en": str(kb.manifest_path)}
+    assert not kb_ingest.knowledge_base_is_current(collection, configs, str(kb.path))
+
+    kb(collection, _manifest(5))
+
+    assert kb_ingest.knowledge_base_is_current(collection, configs, str(kb.path))
+    kb.manifest_path.write_text("changed")
+    assert not kb_ingest.knowledge_base_is_current(collection, configs, str(kb.path))
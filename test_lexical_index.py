@@ -0,0 +1,88 @@
+"""
+BM25 ranking, reciprocal rank fusion and the versioned on-disk indexes,
+built from an in-memory stand-in for the Chroma collection.
+
+    python -m pytest test_lexical_index.py
+"""
+
+import os
+
+import pytest
+
+from lexical_index import (
+    BM25Index,
+    build_lexical_indexes,
+    load_lexical_indexes,
+    reciprocal_rank_fusion,
+    tokenize,
+)
+
+CHUNKS = [
+    ("en-1", "The Visa Gold card has an annual fee of 60 euros.", "en"),
+    ("en-2", "Visa Classic: no annual fee the first year.", "en"),
+    ("en-3", "Zoomit shows your invoices in Home'Bank.", "en"),
+    ("fr-1", "Les frais de la carte Visa Gold sont de 60 euros par an.", "fr"),
+]
+
+
+class MemoryCollection:
+    """Pages through CHUNKS like `collection.get(limit=..., offset=...)`."""
+
+    def get(self, include, limit, offset):
+        page = CHUNKS[offset:offset + limit]
+        return {
+            "ids": [chunk_id for chunk_id, _, _ in page],
+            "documents": [document for _, document, _ in page],
+            "metadatas": [{"language": language} for _, _, language in page],
+        }
+
+
+def test_tokenize_folds_case_and_accents():
+    assert tokenize("Frais bancaires, ÉTÉ 2025") == ["frais", "bancaires", "ete", "2025"]
+
+
+def test_bm25_ranks_rarer_and_denser_matches_first():
+    index = BM25Index(
+        ["a", "b", "c"],
+        ["visa gold fee", "visa classic fee fee", "zoomit invoices"],
+    )
+
+    # "gold" occurs in one document only, so it outweighs the common "fee".
+    assert [hit[0] for hit in index.search("gold fee", 3)] == ["a", "b"]
+    assert [hit[0] for hit in index.search("fee", 3)] == ["b", "a"]
+    assert index.search("mortgage", 3) == []
+    assert len(index.search("visa", 1)) == 1
+
+
+def test_bm25_breaks_ties_in_document_order():
+    index = BM25Index(["x", "y"], ["visa card", "visa card"])
+    hits = index.search("visa", 2)
+    assert [hit[0] for hit in hits] == ["x", "y"]
+    assert hits[0][2] == pytest.approx(hits[1][2])
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "x"], ["c", "b", "y"]])
+    assert fused[0] == "b"  # second in both beats first in only one
+    assert set(fused[1:3]) == {"a", "c"}
+    assert set(fused[3:]) == {"x", "y"}
+    assert reciprocal_rank_fusion([]) == []
+
+
+def test_indexes_round_trip_per_language_and_version(tmp_path):
+    db_path = str(tmp_path)
+    built = build_lexical_indexes(MemoryCollection(), db_path, "v1", page_size=2)
+
+    assert sorted(built) == ["en", "fr"]
+    assert built["en"].ids == ["en-1", "en-2", "en-3"]
+    loaded = load_lexical_indexes(db_path, ["en", "fr"], "v1")
+    assert loaded["fr"].search("frais", 1)[0][0] == "fr-1"
+    assert load_lexical_indexes(db_path, ["en", "fr"], "v2") is None
+    assert load_lexical_indexes(db_path, ["en", "nl"], "v1") is None
+    assert not [name for name in os.listdir(db_path) if name.endswith(".tmp")]
+
+
+def test_build_without_save_writes_nothing(tmp_path):
+    indexes = build_lexical_indexes(MemoryCollection(), str(tmp_path), "v1", save=False)
+    assert sorted(indexes) == ["en", "fr"]
+    assert os.listdir(tmp_path) == []
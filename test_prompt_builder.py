@@ -0,0 +1,104 @@
+"""
+Token-budget checks of build_master_prompt and TransactionHistory on
+synthetic customers: long product tables, long histories, tiny budgets.
+
+    python -m pytest test_prompt_builder.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from prompt_builder import (
+    TransactionHistory,
+    build_master_prompt,
+    estimate_tokens,
+    truncate_to_tokens,
+)
+
+TEMPLATE = (
+    "You are Leo, a banking assistant.\n"
+    "Public context:\n{public_context}\n"
+    "Customer:\n{personal_context}\n"
+    "Result: {pre_computed_result}\n"
+    "Question: {question}\n"
+)
+
+
+def _transactions(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2025-10-31") - pd.to_timedelta(np.arange(n_rows), unit="D")
+    return pd.DataFrame(
+        {
+            "date": dates,
+            "description": rng.choice(["Grocery Store", "Train Ticket", "Salary"], n_rows),
+            "amount": rng.uniform(1, 200, n_rows).round(2),
+            "currency": "EUR",
+            "transaction_type": rng.choice(["Debit", "Credit"], n_rows, p=[0.8, 0.2]),
+        }
+    )
+
+
+def _profile(n_products):
+    products = "\n".join(f"Product number {i:04d}   Active" for i in range(n_products))
+    return (
+        "Customer Profile:\n- Name: Ann\n- Segment: RETAIL\n\n"
+        f"Owned Products (Active):\n{products}\n"
+    )
+
+
+@pytest.mark.parametrize("token_budget", [3000, 800, 300, 120])
+def test_prompt_stays_within_budget_with_many_products(token_budget):
+    build = build_master_prompt(
+        TEMPLATE,
+        question="How much did I spend at the grocery store?",
+        public_context="Fees: " + "a monthly card fee applies. " * 400,
+        personal_context=_profile(500),
+        transactions=_transactions(2000),
+        token_budget=token_budget,
+    )
+
+    assert build.total_tokens <= token_budget
+    assert estimate_tokens(build.prompt) == build.total_tokens
+    assert "Customer Profile:" in build.prompt
+
+
+def test_small_budget_keeps_only_monthly_aggregates():
+    history = TransactionHistory(_transactions(200))
+
+    text = history.render("groceries", max_tokens=30)
+
+    assert estimate_tokens(text) <= 30
+    assert text.startswith("Older history summary (200 transactions not listed)")
+
+
+def test_render_lists_relevant_and_recent_rows_and_summarizes_the_rest():
+    transactions = _transactions(300)
+    history = TransactionHistory(transactions)
+
+    text = history.render("train", max_tokens=400)
+
+    assert estimate_tokens(text) <= 400
+    listed = text.split("\n\n")[0].splitlines()[1:]
+    assert any("Train Ticket" in line for line in listed)
+    assert "2025-10-31" in listed[0]
+    assert "Older history summary" in text
+
+
+def test_summary_totals_match_unlisted_rows():
+    transactions = _transactions(120)
+    history = TransactionHistory(transactions)
+
+    summary = history._summarize(np.arange(0), max_tokens=10_000)
+
+    october = transactions[transactions["date"].dt.month == 10]
+    debits = october.loc[october["transaction_type"] == "Debit", "amount"].sum()
+    assert f"- 2025-10: {int((october['transaction_type'] == 'Debit').sum())} debits" in summary
+    assert f"€{debits:.2f}" in summary
+
+
+def test_truncate_to_tokens_never_exceeds_the_limit():
+    text = "\n".join(f"line {i}" for i in range(200))
+
+    for max_tokens in (0, 1, 2, 5, 50):
+        assert estimate_tokens(truncate_to_tokens(text, max_tokens)) <= max_tokens
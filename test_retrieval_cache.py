@@ -0,0 +1,95 @@
+"""
+SemanticCache tiers on a fake clock: exact and similarity hits, TTL
+expiry (also for entries already in a scope's similarity matrix), LRU
+eviction and invalidation.
+
+    python -m pytest test_retrieval_cache.py
+"""
+
+import numpy as np
+import pytest
+
+import retrieval_cache
+from retrieval_cache import SemanticCache, normalize_question
+
+SCOPE = ("en", 2)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(retrieval_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _vector(*values):
+    return np.array(values, dtype=np.float32)
+
+
+def test_normalize_question():
+    question = "  What's the FEE,   for Visa Gold? "
+    assert normalize_question(question) == "what s the fee for visa gold"
+
+
+def test_exact_tier_matches_normalized_questions_until_they_expire(clock):
+    cache = SemanticCache(ttl_seconds=60)
+    cache.put(SCOPE, "What is the fee?", "context")
+
+    assert cache.get_exact(SCOPE, "what is the fee") == "context"
+    assert cache.get_exact(("fr", 2), "what is the fee") is None
+    clock[0] += 61
+    assert cache.get_exact(SCOPE, "what is the fee") is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["misses"], stats["expired"]) == (1, 2, 1)
+    assert stats["size"] == 0
+
+
+def test_similar_tier_uses_the_threshold(clock):
+    cache = SemanticCache(similarity_threshold=0.95)
+    cache.put(SCOPE, "visa gold fee", "gold", embedding=_vector(1, 0, 0))
+
+    assert cache.get_similar(SCOPE, _vector(0.99, 0.05, 0)) == "gold"
+    assert cache.get_similar(SCOPE, _vector(0.5, 0.5, 0)) is None
+    assert cache.get_similar(("fr", 2), _vector(1, 0, 0)) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_expired_similar_entry_is_never_served(clock):
+    cache = SemanticCache(ttl_seconds=100, similarity_threshold=0.9)
+    cache.put(SCOPE, "old", "old context", embedding=_vector(1, 0, 0))
+    clock[0] += 50
+    cache.put(SCOPE, "newer", "newer context", embedding=_vector(0.95, 0.3, 0))
+    # Builds the scope's similarity matrix while both entries are fresh.
+    assert cache.get_similar(SCOPE, _vector(1, 0, 0)) == "old context"
+
+    clock[0] += 60  # "old" is now past its TTL, "newer" is not
+    assert cache.get_similar(SCOPE, _vector(1, 0, 0)) == "newer context"
+    assert cache.stats()["expired"] == 1
+
+    clock[0] += 100
+    assert cache.get_similar(SCOPE, _vector(1, 0, 0)) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(clock):
+    cache = SemanticCache(max_entries=2)
+    cache.put(SCOPE, "a", 1)
+    cache.put(SCOPE, "b", 2)
+    cache.get_exact(SCOPE, "a")
+    cache.put(SCOPE, "c", 3)
+
+    assert cache.get_exact(SCOPE, "b") is None
+    assert cache.get_exact(SCOPE, "a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_drops_both_tiers(clock):
+    cache = SemanticCache()
+    cache.put(SCOPE, "a", 1, embedding=_vector(1, 0))
+    generation = cache.generation
+
+    cache.invalidate()
+
+    assert cache.get_exact(SCOPE, "a") is None
+    assert cache.get_similar(SCOPE, _vector(1, 0)) is None
+    assert cache.generation == generation + 1
@@ -0,0 +1,77 @@
+"""
+Offline checks of the streaming speech pipeline: VAD end-of-utterance,
+the max-duration cap and interim transcripts, driven by synthetic frames
+and FakeRecognizer (no audio device or credentials needed).
+
+    python -m pytest test_speech_stream.py
+"""
+
+from speech_stream import (
+    END_SILENCE_MS,
+    FRAME_MS,
+    NO_SPEECH_TIMEOUT_MS,
+    FakeRecognizer,
+    InterimPrefetcher,
+    MicrophoneStream,
+    synthetic_frames,
+    transcribe_stream,
+)
+
+
+def _microphone(frames, **options):
+    """A MicrophoneStream fed `frames` through its audio callback."""
+    microphone = MicrophoneStream(**options)
+    for frame in frames:
+        microphone._on_audio(frame, None, None, None)
+    return microphone
+
+
+def test_stream_ends_after_trailing_silence():
+    microphone = _microphone(synthetic_frames(n_speech=5, n_silence=30))
+
+    frames = list(microphone.frames())
+
+    assert len(frames) == 5 + END_SILENCE_MS // FRAME_MS
+
+
+def test_stream_ends_when_nothing_is_said():
+    microphone = _microphone(synthetic_frames(n_speech=0, n_silence=100))
+
+    assert len(list(microphone.frames())) == NO_SPEECH_TIMEOUT_MS // FRAME_MS
+
+
+def test_max_duration_cuts_off_continuous_speech():
+    microphone = _microphone(synthetic_frames(n_speech=50, n_silence=0), max_duration=2)
+
+    assert len(list(microphone.frames())) == 2000 // FRAME_MS
+
+
+def test_stop_ends_the_stream_early():
+    microphone = _microphone(synthetic_frames(n_speech=3, n_silence=0))
+    microphone.stop()
+
+    assert list(microphone.frames()) == []
+
+
+def test_transcribe_stream_reports_interims_and_final():
+    microphone = _microphone(synthetic_frames(n_speech=12, n_silence=30))
+    recognizer = FakeRecognizer("how much did I spend on groceries", frames_per_word=2)
+    interims, prefetched, ended = [], [], []
+
+    def on_interim(transcript):
+        interims.append(transcript)
+        prefetch(transcript)
+
+    prefetch = InterimPrefetcher(prefetched.append, min_new_words=2)
+    final = transcribe_stream(
+        microphone.frames(),
+        recognizer,
+        on_interim=on_interim,
+        on_end_of_utterance=lambda: ended.append(True),
+    )
+
+    assert final == "how much did I spend on groceries"
+    assert interims[0] == "how"
+    assert interims[-1] == final
+    assert prefetched == ["how much", "how much did I", "how much did I spend on"]
+    assert ended == [True]
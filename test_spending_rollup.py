@@ -0,0 +1,115 @@
+"""
+SpendingRollup against a brute-force pandas sum of the raw debits, per
+customer, named period and category, including appended batches.
+
+    python -m pytest test_spending_rollup.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from spending_rollup import SpendingRollup, period_bounds
+
+TODAY = pd.Timestamp("2025-10-15")
+PERIODS = ["week", "last_week", "month", "last_month", "year"]
+CATEGORIES = [None, "grocery", "ATM", "Transport", "no such category"]
+DESCRIPTIONS = ["Grocery Store", "ATM Withdrawal", "Transport Ticket", "Salary Deposit"]
+
+
+def _tables(n_rows=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    products = pd.DataFrame(
+        {"product_id": np.arange(1, 31), "customer_id": np.repeat(np.arange(100, 110), 3)}
+    )
+    transactions = pd.DataFrame(
+        {
+            "transaction_id": np.arange(n_rows),
+            "product_id": rng.integers(1, 31, n_rows),
+            "date": TODAY - pd.to_timedelta(rng.integers(-3, 400, n_rows), unit="D"),
+            "amount": rng.integers(1, 50_000, n_rows) / 100,
+            "description": rng.choice(DESCRIPTIONS, n_rows),
+            "transaction_type": rng.choice(["Debit", "Credit"], n_rows, p=[0.7, 0.3]),
+        }
+    )
+    transactions.loc[::97, "date"] = pd.NaT
+    return products, transactions
+
+
+def _brute_force_cents(products, transactions, customer_id, start, end, category):
+    rows = transactions.merge(products, on="product_id")
+    rows = rows[
+        (rows["customer_id"] == customer_id)
+        & (rows["transaction_type"] == "Debit")
+        & (rows["date"].dt.normalize() >= start)
+        & (rows["date"].dt.normalize() <= end)
+    ]
+    if category:
+        rows = rows[rows["description"].str.contains(category, case=False, regex=False)]
+    return int(np.rint(rows["amount"] * 100).sum())
+
+
+@pytest.fixture(scope="module")
+def tables():
+    return _tables()
+
+
+@pytest.mark.parametrize("categorical", [False, True])
+@pytest.mark.parametrize("period", PERIODS)
+def test_totals_match_a_brute_force_sum(tables, period, categorical):
+    products, transactions = tables
+    source = transactions.copy()
+    if categorical:
+        source["description"] = source["description"].astype("category")
+    rollup = SpendingRollup(products, source)
+    start, end = period_bounds(period, TODAY)
+
+    for customer_id in products["customer_id"].unique():
+        for category in CATEGORIES:
+            assert rollup.total_cents(customer_id, start, end, category) == _brute_force_cents(
+                products, transactions, customer_id, start, end, category
+            ), (customer_id, period, category)
+
+
+def test_appended_batches_match_a_full_build(tables):
+    products, transactions = tables
+    full = SpendingRollup(products, transactions)
+    owners = dict(zip(products["product_id"], products["customer_id"]))
+    appended = SpendingRollup(products, transactions.iloc[:1000])
+    for start in range(1000, len(transactions), 700):
+        appended.add_transactions(transactions.iloc[start : start + 700], owners.get)
+
+    for customer_id in products["customer_id"].unique():
+        for category in CATEGORIES:
+            assert appended.total_cents(
+                customer_id, "2024-01-01", TODAY, category
+            ) == full.total_cents(customer_id, "2024-01-01", TODAY, category)
+
+
+def test_orphan_debits_are_adopted_once_their_product_is_known(tables):
+    products, transactions = tables
+    full = SpendingRollup(products, transactions)
+    known = products[products["product_id"] != 7]
+    rollup = SpendingRollup(known, transactions)
+    owner = int(products.loc[products["product_id"] == 7, "customer_id"].iloc[0])
+
+    assert rollup.orphan_count > 0
+    assert rollup.total_cents(owner, "2024-01-01", TODAY) < full.total_cents(
+        owner, "2024-01-01", TODAY
+    )
+    owners = dict(zip(products["product_id"], products["customer_id"]))
+    assert rollup.adopt_orphans(owners.get) == 0
+    assert rollup.total_cents(owner, "2024-01-01", TODAY) == full.total_cents(
+        owner, "2024-01-01", TODAY
+    )
+
+
+def test_period_bounds():
+    assert period_bounds("month", TODAY) == (pd.Timestamp("2025-10-01"), TODAY)
+    assert period_bounds("last_month", TODAY)[0] == pd.Timestamp("2025-09-01")
+    assert period_bounds("last_week", TODAY) == (
+        pd.Timestamp("2025-10-05"),
+        pd.Timestamp("2025-10-11"),
+    )
+    assert period_bounds("year", TODAY) == (pd.Timestamp("2025-01-01"), TODAY)
+    assert period_bounds("unknown", TODAY) == period_bounds("month", TODAY)